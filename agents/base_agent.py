@@ -0,0 +1,383 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain.chains import LLMChain
+from mcp_interface.protocol_server import ProtocolServer
+from agents.chunked_review import (MAX_PARALLEL_CHUNKS, NO_CONCERNS, ReviewChunk, build_review_chunks,
+                                   chunk_token_budget, merge_chunk_feedback, section_units)
+from agents.section_routing import route_protocol_content
+from utils.llm_registry import get_chat_model, get_prompt
+from utils.llm_resilience import stage_deadline
+from utils.llm_runner import run_chain, submit_with_context
+from utils.token_counter import count_tokens
+from utils.tracing import trace_stage
+import os
+import re
+import threading
+
+
+# Prompt layouts. ROUTED (the default) sends each agent just its routed sections (agents/section_routing.py).
+# With SHARED_PREFIX every reviewer sends the full protocol in an identical prompt prefix, so the provider's
+# prompt cache serves it to all but the first agent, and section routing only adds a focus hint to the role
+# suffix. That trades routing's token savings (reported as forgone_saved_tokens) for cached-token discounts
+# and a faster first token on the later agents.
+SHARED_PREFIX = "shared_prefix"
+ROUTED = "routed"
+DEFAULT_PROMPT_LAYOUT = os.getenv("REVIEW_PROMPT_LAYOUT", ROUTED)
+
+# Mode of utils.findings_store in which near-duplicate sections skip the LLM (kept here so the agents
+# don't import NumPy).
+FINDINGS_REUSE = "reuse"
+
+# OpenAI only caches prompts of at least this many tokens.
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Identical for every reviewer, so it must not contain anything agent-specific.
+SHARED_PROMPT_PREFIX = """
+            You are an expert reviewer taking part in a multi-disciplinary review of the clinical trial protocol below.
+            Identify any potential issues that could lead to amendments, suggest improvements, and provide a clear rationale.
+
+            Protocol content:
+            ---
+            {protocol_content}
+            ---
+            """
+
+
+class BaseReviewAgent:
+    """
+    Shared plumbing for the reviewer agents. Subclasses provide the role-specific instructions,
+    which follow the shared protocol prefix.
+    """
+    agent_key = None
+    # Bump when ROLE_INSTRUCTIONS changes so cached responses for the old prompt are not reused.
+    TEMPLATE_VERSION = "1"
+    ROLE_INSTRUCTIONS = ""
+
+    def __init__(self, llm_model="gpt-4o", temperature=0.5, prompt_layout: str = None):
+        # Clients and compiled prompts are shared process-wide (utils/llm_registry.py).
+        self.llm = get_chat_model(llm_model, temperature)
+        self.prompt_layout = prompt_layout or DEFAULT_PROMPT_LAYOUT
+        self.prompt_template = get_prompt(
+            SHARED_PROMPT_PREFIX + "{focus_instructions}" + self.ROLE_INSTRUCTIONS,
+            ["protocol_content", "focus_instructions"]
+        )
+        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
+        # Per-thread, because one shared agent instance may serve several reviews at once.
+        self._local = threading.local()
+
+    @property
+    def last_routing_report(self):
+        """Routing report of the last review_protocol call made from the current thread."""
+        return getattr(self._local, "routing_report", None)
+
+    def shares_prompt_prefix(self, protocol_server: ProtocolServer) -> bool:
+        """
+        True if this agent's review of the protocol sends the shared prefix and it is long enough
+        for the provider to cache, i.e. if warming the cache with a first call pays off.
+        """
+        return (self.prompt_layout == SHARED_PREFIX and
+                count_tokens(protocol_server.get_all_content(), self.llm.model_name) >= PROMPT_CACHE_MIN_TOKENS)
+
+    @staticmethod
+    def _focus_instructions(section_titles: list) -> str:
+        if not section_titles:
+            return ""
+        return (
+            "\n            Concentrate your review on these sections, using the rest of the protocol for context "
+            f"and cross-references: {'; '.join(section_titles)}.\n"
+        )
+
+    @staticmethod
+    def _chunk_focus(protocol_server: ProtocolServer, chunks: list, routed_titles: list) -> list:
+        """
+        Returns, per chunk, the routed sections it holds: its sections that are routed or nested in a routed
+        section, and routed sections nested in one of its sections (e.g. "5.1 Eligibility" inside a chunk
+        labelled "5. Study Population").
+        """
+        def span_of(title):
+            return protocol_server.section_span(re.sub(r" \(part \d+\)$", "", title))
+
+        unit_starts = [span[0] for chunk in chunks for span in map(span_of, chunk.sections) if span is not None]
+        routed = []
+        for title in routed_titles:
+            span = protocol_server.section_span(title)
+            if span is not None:
+                # Reached through an enclosing section only if it isn't chunked as units of its own.
+                enclosed = not any(span[0] <= start < span[1] for start in unit_starts)
+                routed.append((title, span, enclosed))
+
+        focus = []
+        for chunk in chunks:
+            titles = []
+            for chunk_title in chunk.sections:
+                span = span_of(chunk_title)
+                if span is None:
+                    continue
+                for title, (start, end), enclosed in routed:
+                    if start <= span[0] < end:
+                        match = chunk_title
+                    elif enclosed and span[0] <= start < span[1]:
+                        match = title
+                    else:
+                        continue
+                    if match not in titles:
+                        titles.append(match)
+            focus.append(titles)
+        return focus
+
+    def plan_review(self, protocol_server: ProtocolServer) -> dict:
+        """
+        Works out the calls review_protocol will make, without calling the LLM. Protocols that don't
+        fit the model's context window are split into section-aligned chunks (agents/chunked_review.py).
+        Returns:
+            {"report": routing report, "budget": protocol tokens per call, "chunks": [ReviewChunk],
+             "contents": [protocol_content per call], "focus_instructions": [focus hint per call]}
+        """
+        model = self.llm.model_name
+        routed_content, report = route_protocol_content(protocol_server, self.agent_key, model=model)
+        shared = self.prompt_layout == SHARED_PREFIX
+        if shared:
+            content, tokens, titles = protocol_server.get_all_content(), report["full_tokens"], None
+            report = dict(report, routed_tokens=report["full_tokens"], saved_tokens=0,
+                          forgone_saved_tokens=report["saved_tokens"])
+        else:
+            content, tokens, titles = routed_content, report["routed_tokens"], report["sections"] or None
+        budget = chunk_token_budget(model)
+
+        if tokens <= budget:
+            # Unchanged single-call prompt, so cached responses remain valid.
+            chunks = [ReviewChunk(0, titles or [], content, tokens)]
+            contents = [content]
+            focus = [self._focus_instructions(report["sections"]) if shared else ""]
+        else:
+            chunks = build_review_chunks(protocol_server, budget, model, titles)
+            if shared and report["sections"]:
+                # Every agent gets identical chunks; each skips those holding none of its sections.
+                focus = self._chunk_focus(protocol_server, chunks, report["sections"])
+                if any(focus):
+                    chunks = [chunk for chunk, titles in zip(chunks, focus) if titles]
+                    focus = [self._focus_instructions(titles) for titles in focus if titles]
+                else:
+                    focus = [self._focus_instructions(report["sections"])] * len(chunks)
+            else:
+                focus = [""] * len(chunks)
+            contents = [
+                f"[Protocol excerpt {n} of {len(chunks)}: {chunk.label}]\n\n{chunk.text}"
+                for n, chunk in enumerate(chunks, start=1)
+            ]
+        report = dict(report, layout=self.prompt_layout, chunks=len(chunks))
+        return {"report": report, "budget": budget, "chunks": chunks, "contents": contents,
+                "focus_instructions": focus}
+
+    @property
+    def last_section_findings(self):
+        """
+        Per-section findings of the last review_protocol call with a findings store, from the current
+        thread: [{"section", "findings", "entry_id", "reused", "risks"}], or None.
+        """
+        return getattr(self._local, "section_findings", None)
+
+    def review_protocol(self, protocol_server: ProtocolServer, bypass_cache: bool = False, on_partial=None,
+                        findings_store=None, triage=None) -> str:
+        """
+        Reviews the clinical protocol from this agent's perspective.
+        Args:
+            protocol_server: An instance of ProtocolServer to access protocol content.
+            bypass_cache: If True, skip the shared response cache and call the LLM.
+            on_partial: Optional callback(text_so_far) to stream the feedback as it is generated.
+            findings_store: Optional utils.findings_store.FindingsStore. If given, the protocol is reviewed
+                            section by section and sections near-identical to ones reviewed before reuse
+                            (or are reviewed with) the earlier findings.
+            triage: Optional agents.triage.SectionTriager. If given (and no findings_store), a cheap model
+                    screens each section first and only flagged sections are reviewed, one call each.
+        Returns:
+            A string containing the agent's feedback and recommendations.
+        """
+        with stage_deadline("agent"), trace_stage(f"agent.{self.agent_key}", model=self.llm.model_name,
+                                                  layout=self.prompt_layout) as span:
+            self._local.section_findings = None
+            if findings_store is not None:
+                return self._review_with_findings_store(protocol_server, findings_store, bypass_cache, on_partial, span)
+            if triage is not None:
+                return self._review_with_triage(protocol_server, triage, bypass_cache, on_partial, span)
+            plan = self.plan_review(protocol_server)
+            self._local.routing_report = plan["report"]
+            span.attributes["routed_sections"] = len(plan["report"]["sections"])
+            span.attributes["chunks"] = len(plan["chunks"])
+            if len(plan["chunks"]) > 1:
+                return self._review_chunks(plan["chunks"], plan["contents"], plan["focus_instructions"],
+                                           bypass_cache, on_partial)
+            return run_chain(
+                self.chain,
+                template_version=self.TEMPLATE_VERSION,
+                bypass_cache=bypass_cache,
+                on_partial=on_partial,
+                protocol_content=plan["contents"][0],
+                focus_instructions=plan["focus_instructions"][0]
+            )
+
+    def _review_with_findings_store(self, protocol_server: ProtocolServer, findings_store, bypass_cache: bool,
+                                    on_partial, span) -> str:
+        """
+        Reviews each of the agent's sections in its own call so findings can be stored and reused per section.
+        """
+        model = self.llm.model_name
+        _, report = route_protocol_content(protocol_server, self.agent_key, model=model)
+        titles = report["sections"] or protocol_server.child_sections()
+        units = section_units(protocol_server, titles, chunk_token_budget(model), model)
+        reuse = findings_store.mode == FINDINGS_REUSE
+
+        chunks, contents, focus, feedbacks, items = [], [], [], [], []
+        for index, (title, text, tokens) in enumerate(units):
+            signature = findings_store.signature(text)
+            match = findings_store.find_similar(self.agent_key, model, self.TEMPLATE_VERSION, text, signature)
+            item = {"section": title, "findings": None, "entry_id": None, "reused": False, "risks": None,
+                    "text": text, "signature": signature, "match": match}
+            if match is not None and reuse and match["numbers_match"]:
+                item.update(findings=match["findings"], entry_id=match["id"], reused=True, risks=match["risks"])
+                findings_store.record_reuse(match["prompt_tokens"] + match["completion_tokens"])
+            chunks.append(ReviewChunk(index, [title], text, tokens))
+            contents.append(f"[Protocol section provided for this review: {title}]\n\n{text}")
+            focus.append(self._prior_findings_instructions(match) if match is not None and not item["reused"] else "")
+            feedbacks.append(item["findings"])
+            items.append(item)
+
+        def store_findings(index, findings):
+            item = items[index]
+            item["findings"] = findings
+            item["entry_id"] = findings_store.add(self.agent_key, model, self.TEMPLATE_VERSION, item["section"],
+                                                  item["text"], findings, signature=item["signature"])
+
+        feedback = self._review_chunks(chunks, contents, focus, bypass_cache, on_partial, feedbacks, store_findings)
+        reused = [item for item in items if item["reused"]]
+        self._local.routing_report = dict(
+            report, layout=self.prompt_layout, chunks=len(units) - len(reused),
+            reused_sections=[{"section": item["section"], "from_section": item["match"]["section_title"],
+                              "similarity": item["match"]["similarity"]} for item in reused],
+            reused_tokens=sum(item["match"]["prompt_tokens"] + item["match"]["completion_tokens"] for item in reused),
+        )
+        self._local.section_findings = [
+            {key: item[key] for key in ("section", "findings", "entry_id", "reused", "risks")} for item in items
+        ]
+        span.attributes["sections"] = len(units)
+        span.attributes["reused_sections"] = len(reused)
+        return feedback
+
+    def _review_with_triage(self, protocol_server: ProtocolServer, triage, bypass_cache: bool, on_partial,
+                            span) -> str:
+        """
+        Screens each of the agent's sections with the triage model and reviews only the escalated ones.
+        """
+        model = self.llm.model_name
+        _, report = route_protocol_content(protocol_server, self.agent_key, model=model)
+        titles = report["sections"] or protocol_server.child_sections()
+        units = section_units(protocol_server, titles, chunk_token_budget(model), model)
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_CHUNKS, len(units)))) as executor:
+            futures = [submit_with_context(executor, triage.screen, self, title, text, bypass_cache)
+                       for title, text, _ in units]
+            decisions = [future.result() for future in futures]
+
+        escalated = [index for index, decision in enumerate(decisions) if decision["escalated"]]
+        chunks = [ReviewChunk(n, [units[index][0]], units[index][1], units[index][2]) for n, index in enumerate(escalated)]
+        contents = [f"[Protocol section provided for this review: {chunk.label}]\n\n{chunk.text}" for chunk in chunks]
+
+        def record_review(n, findings):
+            triage.record(decisions[escalated[n]], findings)
+
+        for decision in decisions:
+            if not decision["escalated"]:
+                triage.record(decision)
+        if chunks:
+            feedback = self._review_chunks(chunks, contents, [""] * len(chunks), bypass_cache, on_partial,
+                                           on_chunk=record_review)
+        else:
+            feedback = NO_CONCERNS
+            if on_partial is not None:
+                on_partial(feedback)
+        skipped = [decision for decision in decisions if not decision["escalated"]]
+        self._local.routing_report = dict(
+            report, layout=self.prompt_layout, chunks=len(chunks),
+            triage={
+                "model": triage.llm.model_name,
+                "threshold": triage.threshold_for(self.agent_key),
+                "sections": len(units),
+                "escalated": [decisions[index]["section"] for index in escalated],
+                "skipped": [{"section": decision["section"], "score": decision["score"]} for decision in skipped],
+                "skipped_tokens": sum(decision["section_tokens"] for decision in skipped),
+            },
+        )
+        span.attributes["sections"] = len(units)
+        span.attributes["escalated_sections"] = len(escalated)
+        return feedback
+
+    @staticmethod
+    def _prior_findings_instructions(match: dict) -> str:
+        return (
+            "\n            A near-identical section was reviewed before "
+            f"(similarity {match['similarity']:.0%}). Its findings are given for reference; confirm, "
+            f"correct or extend them for this protocol:\n---\n{match['findings']}\n---\n"
+        )
+
+    def _review_chunks(self, chunks: list, contents: list, focus_instructions: list, bypass_cache: bool, on_partial,
+                       feedbacks: list = None, on_chunk=None) -> str:
+        """
+        Reviews chunks in parallel and merges the findings into one response.
+        on_partial is called once when the first token arrives, then with the merged findings as
+        each chunk completes.
+        Args:
+            feedbacks: Feedback already known per chunk; chunks with None are reviewed.
+            on_chunk: Optional callback(chunk index, feedback) as each chunk's review completes.
+        """
+        feedbacks = list(feedbacks) if feedbacks is not None else [None] * len(chunks)
+        pending = [index for index, feedback in enumerate(feedbacks) if feedback is None]
+        started = threading.Event()
+
+        def on_token(text):
+            if not started.is_set():
+                started.set()
+                on_partial(merge_chunk_feedback(feedbacks, chunks))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_CHUNKS, len(pending)))) as executor:
+            futures = {
+                submit_with_context(
+                    executor, run_chain, self.chain,
+                    template_version=self.TEMPLATE_VERSION,
+                    bypass_cache=bypass_cache,
+                    on_partial=on_token if on_partial is not None else None,
+                    protocol_content=contents[index],
+                    focus_instructions=focus_instructions[index]
+                ): index
+                for index in pending
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                feedbacks[index] = future.result()
+                if on_chunk is not None:
+                    on_chunk(index, feedbacks[index])
+                if on_partial is not None:
+                    on_partial(merge_chunk_feedback(feedbacks, chunks))
+        return merge_chunk_feedback(feedbacks, chunks)
+
+    def review_section(self, protocol_server: ProtocolServer, section_name: str, bypass_cache: bool = False) -> str:
+        """
+        Reviews a single protocol section, e.g. after it was amended.
+        Args:
+            protocol_server: An instance of ProtocolServer to access protocol content.
+            section_name: Title or number of the section to review.
+            bypass_cache: If True, skip the shared response cache and call the LLM.
+        Returns:
+            The agent's feedback on that section only.
+        """
+        title = protocol_server.find_section_title(section_name) or section_name
+        protocol_content = (
+            f"[Protocol section provided for this review: {title}]\n\n"
+            f"{title}\n{protocol_server.get_section(title)}"
+        )
+        with stage_deadline("agent"), trace_stage(f"agent.{self.agent_key}.section", model=self.llm.model_name,
+                                                  section=title):
+            return run_chain(
+                self.chain,
+                template_version=self.TEMPLATE_VERSION,
+                bypass_cache=bypass_cache,
+                protocol_content=protocol_content,
+                focus_instructions=""
+            )
@@ -0,0 +1,248 @@
+from mcp_interface.protocol_server import ProtocolServer
+from utils.token_counter import count_tokens
+import os
+import re
+
+
+# Context window (prompt + completion tokens) per model family. Longest matching prefix wins.
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Room kept free for the reviewer's answer, and for the shared prefix, focus hint and role
+# instructions around the protocol text. Both are fixed rather than per agent, so every reviewer
+# cuts the protocol into identical chunks and each chunk's prompt prefix stays cacheable.
+COMPLETION_RESERVE_TOKENS = 4096
+INSTRUCTION_RESERVE_TOKENS = 2048
+
+# Optional cap on protocol tokens per chunk, e.g. to keep each call short even on large-context models.
+MAX_CHUNK_TOKENS = int(os.getenv("REVIEW_CHUNK_TOKENS", "0")) or None
+
+# Chunks of one agent's review that run at the same time (the request scheduler still applies).
+MAX_PARALLEL_CHUNKS = int(os.getenv("REVIEW_CHUNK_WORKERS", "4"))
+
+NO_CONCERNS = "No major concerns for this section."
+
+# "**1. Practicality of Procedures:**", "### 2. Eligibility" or "3. **Dosing**" style headings.
+_FINDING_HEADING_RE = re.compile(
+    r'^\s*(?:#{1,6}\s*)?(?:\*\*\s*)?(?P<number>\d{1,2})\.\s*(?:\*\*\s*)?(?P<title>[^\n*:]{2,120}?)\s*:?\s*(?:\*\*)?\s*:?\s*$',
+    re.MULTILINE
+)
+
+
+def get_context_window(model: str) -> int:
+    matches = [name for name in CONTEXT_WINDOWS if (model or "").startswith(name)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+def chunk_token_budget(model: str) -> int:
+    """
+    Returns the protocol tokens one review call can carry for the model.
+    """
+    budget = get_context_window(model) - COMPLETION_RESERVE_TOKENS - INSTRUCTION_RESERVE_TOKENS
+    if MAX_CHUNK_TOKENS:
+        budget = min(budget, MAX_CHUNK_TOKENS)
+    return max(budget, 256)
+
+
+class ReviewChunk:
+    """
+    One window of protocol text reviewed in a single call.
+    """
+    def __init__(self, index: int, sections: list, text: str, tokens: int):
+        self.index = index
+        # Section titles covered, in document order. Oversized sections appear as "<title> (part n)".
+        self.sections = sections
+        self.text = text
+        self.tokens = tokens
+
+    @property
+    def label(self) -> str:
+        if len(self.sections) == 1:
+            return self.sections[0]
+        return f"{self.sections[0]} – {self.sections[-1]}"
+
+
+def _split_text(title: str, text: str, budget: int, model: str) -> list:
+    """
+    Splits one section that has no subsections to fall back on into budget-sized (title, text, tokens)
+    parts, at paragraph boundaries where possible, then at line boundaries.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        if not paragraph.strip():
+            continue
+        if count_tokens(paragraph, model) <= budget:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            # A single line over budget (e.g. an extracted table) is cut by approximate characters.
+            step = budget * 3
+            pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+
+    parts, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece, model)
+        if current and current_tokens + tokens > budget:
+            parts.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        parts.append("\n\n".join(current))
+    if len(parts) == 1:
+        return [(title, parts[0], count_tokens(parts[0], model))]
+    return [(f"{title} (part {n})", part, count_tokens(part, model)) for n, part in enumerate(parts, start=1)]
+
+
+def section_units(protocol_server: ProtocolServer, titles: list, budget: int, model: str) -> list:
+    """
+    Returns (title, text, tokens) units that each fit the budget. A section that doesn't fit is
+    replaced by its introduction and its subsections, recursively.
+    """
+    buffer = protocol_server.get_all_content()
+    units = []
+    for title in titles:
+        span = protocol_server.section_span(title)
+        if span is None:
+            continue
+        start, end = span
+        text = buffer[start:end].strip("\n")
+        tokens = count_tokens(text, model)
+        if tokens <= budget:
+            units.append((title, text, tokens))
+            continue
+        children = protocol_server.child_sections(title) if title != "Preamble" else []
+        if not children:
+            units.extend(_split_text(title, text, budget, model))
+            continue
+        intro = buffer[start:protocol_server.section_span(children[0])[0]].strip("\n")
+        if intro:
+            units.extend(_split_text(title, intro, budget, model))
+        units.extend(section_units(protocol_server, children, budget, model))
+    return units
+
+
+def build_review_chunks(protocol_server: ProtocolServer, budget: int, model: str = "gpt-4o",
+                        section_titles: list = None) -> list:
+    """
+    Packs protocol sections, in document order, into as few chunks of at most budget tokens as
+    possible. Chunks only break at section boundaries unless a single section exceeds the budget.
+    Args:
+        protocol_server: An instance of ProtocolServer to access protocol content.
+        budget: Maximum protocol tokens per chunk.
+        model: Model name used for token counting.
+        section_titles: Sections to cover (e.g. an agent's routed sections); defaults to the whole protocol.
+    Returns:
+        A list of ReviewChunk.
+    """
+    titles = section_titles or protocol_server.child_sections()
+    chunks, current = [], []
+
+    def close():
+        text = "\n\n".join(text for _, text, _ in current)
+        chunks.append(ReviewChunk(len(chunks), [title for title, _, _ in current], text,
+                                  count_tokens(text, model)))
+
+    current_tokens = 0
+    for unit in section_units(protocol_server, titles, budget, model):
+        # Two tokens of slack for the blank line joining units.
+        if current and current_tokens + unit[2] + 2 > budget:
+            close()
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit[2] + 2
+    if current:
+        close()
+    return chunks
+
+
+def _parse_findings(feedback: str) -> tuple:
+    """
+    Splits an agent's feedback into (text before the first heading, [(heading key, heading line, body)]).
+    """
+    matches = list(_FINDING_HEADING_RE.finditer(feedback))
+    if not matches:
+        return feedback.strip(), []
+    findings = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        body = feedback[match.end():following.start() if following else len(feedback)].strip()
+        key = (match.group("number"), ProtocolServer.normalize_title(match.group("title")))
+        findings.append((key, match.group(0).strip(), body))
+    return feedback[:matches[0].start()].strip(), findings
+
+
+def has_concerns(feedback: str) -> bool:
+    """
+    False if every numbered heading of the feedback says "No major concerns"; True otherwise,
+    including for feedback that doesn't follow the agents' heading structure.
+    """
+    _, findings = _parse_findings(feedback or "")
+    if not findings:
+        return bool((feedback or "").strip())
+    return any(body.strip().strip("*").strip() != NO_CONCERNS for _, _, body in findings)
+
+
+def merge_chunk_feedback(feedbacks: list, chunks: list) -> str:
+    """
+    Merges the per-chunk feedback of one agent into its usual single response: findings under the
+    same numbered heading are combined in first-seen order, and "No major concerns" is dropped from
+    a heading when another chunk raised concerns under it. Text that doesn't follow the agent's
+    heading structure is kept under the name of the excerpt it came from.
+    """
+    intros, order, headings, bodies, unmatched = [], [], {}, {}, []
+    for feedback, chunk in zip(feedbacks, chunks):
+        if not feedback:
+            continue
+        intro, findings = _parse_findings(feedback)
+        if not findings:
+            unmatched.append(f"**Protocol excerpt {chunk.index + 1} ({chunk.label}):**\n{intro}")
+            continue
+        if intro and intro not in intros:
+            intros.append(intro)
+        for key, heading, body in findings:
+            if key not in headings:
+                order.append(key)
+                headings[key] = heading
+                bodies[key] = []
+            if body and body not in bodies[key]:
+                bodies[key].append(body)
+
+    sections = []
+    for key in order:
+        concerns = [body for body in bodies[key] if body.strip().strip("*").strip() != NO_CONCERNS]
+        body = "\n\n".join(concerns) if concerns else NO_CONCERNS
+        sections.append(f"{headings[key]}\n{body}")
+    return "\n\n".join(intros[:1] + sections + unmatched)
+
+
+def preflight_review(protocol_server: ProtocolServer, agents: dict) -> dict:
+    """
+    Estimates what a review will send before it starts.
+    Args:
+        protocol_server: An instance of ProtocolServer to access protocol content.
+        agents: {agent key: BaseReviewAgent}.
+    Returns:
+        {"agents": {agent key: {"chunks", "prompt_tokens", "budget", "context_window"}},
+         "chunks": total chunks (one LLM call each), "prompt_tokens": total prompt tokens}
+    """
+    report = {"agents": {}, "chunks": 0, "prompt_tokens": 0}
+    for agent_key, agent in agents.items():
+        plan = agent.plan_review(protocol_server)
+        model = agent.llm.model_name
+        instruction_tokens = count_tokens(agent.prompt_template.format(
+            protocol_content="", focus_instructions=plan["focus_instructions"][0]), model)
+        prompt_tokens = sum(chunk.tokens for chunk in plan["chunks"]) + instruction_tokens * len(plan["chunks"])
+        report["agents"][agent_key] = {
+            "chunks": len(plan["chunks"]),
+            "prompt_tokens": prompt_tokens,
+            "budget": plan["budget"],
+            "context_window": get_context_window(model),
+        }
+        report["chunks"] += len(plan["chunks"])
+        report["prompt_tokens"] += prompt_tokens
+    return report
@@ -1,28 +1,14 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from mcp_interface.protocol_server import ProtocolServer
-import os
+from agents.base_agent import BaseReviewAgent
 
 
-class HealthAuthorityAgent:
-    def __init__(self, llm_model="gpt-4o"):
-        """
-        Initializes the HealthAuthorityAgent with an LLM and a specific prompt.
-        """
-        self.llm = ChatOpenAI(model=llm_model, temperature=0.5, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        self.prompt_template = PromptTemplate(
-            template="""
-            You are a Health Authority/Regulatory Compliance Agent reviewing a clinical trial protocol.
+class HealthAuthorityAgent(BaseReviewAgent):
+    agent_key = "health_authority"
+    TEMPLATE_VERSION = "2"
+    ROLE_INSTRUCTIONS = """
+            You are a Health Authority/Regulatory Compliance Agent reviewing the clinical trial protocol above.
             Your focus is on adherence to regulatory guidelines (ICH-GCP, FDA, EMA as applicable), ethical considerations, and data integrity.
-            Identify any potential issues that could lead to amendments, suggest improvements, and provide a clear rationale.
             Provide your feedback as a section-level summary for each area of concern.
 
-            Review the following protocol content:
-            ---
-            {protocol_content}
-            ---
-
             Provide your feedback in a structured format, highlighting concerns and recommendations.
             Focus on these key areas, and for each, provide a summary of potential issues and regulatory-compliant recommendations for improvement.
             If a section has no major concerns from your perspective, state "No major concerns for this section."
@@ -54,21 +40,10 @@ class HealthAuthorityAgent:
             Recommendation: Add a statement affirming compliance with ICH Harmonised Tripartite Guideline for Good Clinical Practice (ICH-GCP).
 
             Now provide your full review based on the protocol:
-            """,
-            input_variables=["protocol_content"]
-        )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
+            """
 
-    def review_protocol(self, protocol_server: ProtocolServer) -> str:
+    def __init__(self, llm_model="gpt-4o"):
         """
-        Reviews the clinical protocol from a Health Authority/Regulatory Compliance perspective.
-        Args:
-            protocol_server: An instance of ProtocolServer to access protocol content.
-        Returns:
-            A string containing the health authority's feedback and recommendations.
+        Initializes the HealthAuthorityAgent with an LLM and a specific prompt.
         """
-        # For section-level summary, we still give the full protocol context for now
-        # but the agent is prompted to focus on certain aspects.
-        full_protocol = protocol_server.get_all_content()
-        response = self.chain.run(protocol_content=full_protocol)
-        return response
\ No newline at end of file
+        super().__init__(llm_model=llm_model, temperature=0.5)
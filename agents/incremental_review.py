@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+from mcp_interface.protocol_server import ProtocolServer
+from mcp_interface.review_tools import find_section_by_keyword, resolve_cross_references
+from utils.llm_runner import submit_with_context
+import re
+
+
+# Risk sources read "agent | section", like the per-section sources of a findings-store review.
+SOURCE_SEPARATOR = " | "
+
+
+class IncrementalReviewer:
+    def __init__(self, agents: dict, risk_assessor=None, max_workers: int = 4):
+        """
+        Tracks which section content each agent has reviewed so that, after an edit, only the
+        affected agent/section pairs are re-reviewed and findings for unchanged sections carry forward.
+        Args:
+            agents: Mapping of agent key to a BaseReviewAgent.
+            risk_assessor: Optional RiskAssessor used to re-assess only the changed feedback.
+            max_workers: Upper bound on concurrent section re-reviews.
+        """
+        self.agents = agents
+        self.risk_assessor = risk_assessor
+        self.max_workers = max_workers
+        self._baseline_feedback = {}
+        # agent_key -> {section title: content hash the agent last reviewed}
+        self._reviewed_hashes = {}
+        # agent_key -> {section title: feedback from a section-level re-review}
+        self._section_findings = {}
+        # "agent | section" (or just "agent" if no section could be attributed) -> risks
+        self._risks_by_source = {}
+        self.last_stats = {}
+
+    def record_baseline(self, protocol_server: ProtocolServer, feedback: dict, amendment_risks: list = None,
+                        routing_reports: dict = None):
+        """
+        Records a full review as the starting point for incremental re-reviews.
+        Args:
+            protocol_server: The ProtocolServer that was reviewed.
+            feedback: {agent_key: feedback} from the full review.
+            amendment_risks: Risks assessed from that feedback, if any. Each is attributed to the sections
+                             its agents reviewed, so amending a section replaces the risks raised about it.
+            routing_reports: {agent_key: routing report} from the review; agents without one are
+                             treated as having reviewed the full protocol.
+        """
+        routing_reports = routing_reports or {}
+        for agent_key, agent_feedback in feedback.items():
+            self._baseline_feedback[agent_key] = agent_feedback
+            self._section_findings[agent_key] = {}
+            self._reviewed_hashes[agent_key] = {
+                title: protocol_server.section_hash(title)
+                for title in self._reviewed_titles(protocol_server, routing_reports.get(agent_key))
+            }
+        self._risks_by_source = {}
+        for risk in amendment_risks or []:
+            for source in self._risk_sources(protocol_server, risk):
+                self._risks_by_source.setdefault(source, []).append(risk)
+
+    def _risk_sources(self, protocol_server: ProtocolServer, risk: dict) -> list:
+        """
+        Returns the "agent | section" sources of a baseline risk: for each agent that raised it, the reviewed
+        section it cites ("see Section 4.1", a section title) or else the one whose passages best match its text.
+        """
+        text = " ".join(risk.get(field) or "" for field in ("description", "rationale", "recommendation"))
+        lowered = text.lower()
+        cited = [item["section"] for item in resolve_cross_references(protocol_server, text) if item["section"]]
+        cited += [entry.key for entry in map(protocol_server.get_section_entry, protocol_server.section_titles())
+                  if entry is not None and entry.title.lower() in lowered]
+        hits = None
+        sources = []
+        for agent in risk.get("agents") or []:
+            reviewed = self._reviewed_hashes.get(agent)
+            if SOURCE_SEPARATOR in agent or reviewed is None:
+                # Already section-level (findings-store review), or not an agent tracked here.
+                sources.append(agent)
+                continue
+            section = next((title for title in cited if title in reviewed), None)
+            if section is None:
+                hits = hits if hits is not None else find_section_by_keyword(protocol_server, text, limit=10)
+                section = next((hit["section"] for hit in hits if hit["section"] in reviewed), None)
+            sources.append(f"{agent}{SOURCE_SEPARATOR}{section}" if section else agent)
+        return sources
+
+    @staticmethod
+    def _reviewed_titles(protocol_server: ProtocolServer, report: dict) -> list:
+        if report and not report["fallback"]:
+            titles = []
+            for title in report["sections"]:
+                # Subsections are tracked individually so an edit can be re-reviewed at the finest level.
+                titles.extend(protocol_server.subsection_titles(title))
+            return titles
+        return protocol_server.section_titles()
+
+    @staticmethod
+    def _narrowest(protocol_server: ProtocolServer, titles: list) -> list:
+        """Drops changed sections whose change is fully explained by a changed subsection."""
+        entries = {title: protocol_server.get_section_entry(title) for title in titles}
+        narrowest = []
+        for title, entry in entries.items():
+            if entry is not None and any(
+                other is not entry and other is not None and entry.start <= other.heading_start < entry.end
+                for other in entries.values()
+            ):
+                continue
+            narrowest.append(title)
+        return narrowest
+
+    def changed_sections(self, protocol_server: ProtocolServer) -> dict:
+        """
+        Returns {agent_key: [section titles changed since the agent last reviewed them]}.
+        """
+        changed = {}
+        for agent_key, reviewed in self._reviewed_hashes.items():
+            titles = [title for title, digest in reviewed.items()
+                      if protocol_server.section_hash(title) != digest]
+            if titles:
+                changed[agent_key] = self._narrowest(protocol_server, titles)
+        return changed
+
+    def rereview(self, protocol_server: ProtocolServer, bypass_cache: bool = False) -> dict:
+        """
+        Re-reviews only the changed agent/section pairs and returns the updated {agent_key: feedback}.
+        """
+        changed = self.changed_sections(protocol_server)
+        # Sections the edit removed (e.g. subsections of a replaced body) have nothing left to review.
+        pairs = [(agent_key, title) for agent_key, titles in changed.items() for title in titles
+                 if protocol_server.get_section_entry(title) is not None]
+
+        def review_pair(pair):
+            agent_key, title = pair
+            return self.agents[agent_key].review_section(protocol_server, title, bypass_cache=bypass_cache)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pairs) or 1))) as executor:
+            findings = [future.result() for future in [submit_with_context(executor, review_pair, pair) for pair in pairs]]
+
+        changed_feedback = {}
+        for (agent_key, title), finding in zip(pairs, findings):
+            self._section_findings[agent_key][title] = finding
+            changed_feedback[f"{agent_key}{SOURCE_SEPARATOR}{title}"] = finding
+        for agent_key in changed:
+            # Everything the agent covers is now up to date, including parents of the edited section.
+            self._reviewed_hashes[agent_key] = {
+                title: protocol_server.section_hash(title) for title in self._reviewed_hashes[agent_key]
+                if protocol_server.get_section_entry(title) is not None
+            }
+            for title in [title for title in self._section_findings[agent_key]
+                          if protocol_server.get_section_entry(title) is None]:
+                del self._section_findings[agent_key][title]
+
+        if self.risk_assessor is not None and changed_feedback:
+            # Risks raised about an amended section (or a section nested in it, or one the edit removed) are
+            # stale; the re-review's risks replace them.
+            for source in list(self._risks_by_source):
+                agent_key, _, section = source.partition(SOURCE_SEPARATOR)
+                if section and agent_key in changed and (
+                        protocol_server.get_section_entry(section) is None
+                        or any(section in protocol_server.subsection_titles(title) for title in changed[agent_key])):
+                    del self._risks_by_source[source]
+            self._risks_by_source = self.risk_assessor.assess_risk_delta(
+                self._risks_by_source, changed_feedback, bypass_cache=bypass_cache
+            )
+
+        self.last_stats = {
+            "protocol_version": protocol_server.version,
+            "sections_rereviewed": len(pairs),
+            "agents_affected": sorted(changed),
+            "agents_carried_forward": sorted(set(self._baseline_feedback) - set(changed)),
+        }
+        return self.current_feedback()
+
+    def current_feedback(self) -> dict:
+        """
+        Returns each agent's baseline feedback followed by its findings for amended sections. Paragraphs of the
+        baseline feedback that cite an amended section are left out, since the re-review supersedes them.
+        """
+        feedback = {}
+        for agent_key, baseline in self._baseline_feedback.items():
+            amended = list(self._section_findings.get(agent_key, {}))
+            parts = [self._without_sections(baseline, amended)] if amended else [baseline]
+            for title, finding in self._section_findings.get(agent_key, {}).items():
+                parts.append(f"**Re-review of amended section '{title}':**\n{finding}")
+            feedback[agent_key] = "\n\n".join(parts)
+        return feedback
+
+    @staticmethod
+    def _without_sections(feedback: str, titles: list) -> str:
+        """Drops the blank-line separated paragraphs of feedback that cite one of the sections by number or title."""
+        patterns = []
+        for title in titles:
+            match = re.match(r"(\d{1,3}(?:\.\d{1,3})*)\.?\s+(.*)", title)
+            number, name = (match.group(1), match.group(2)) if match else (None, title)
+            if number:
+                # "4.1" on its own; a top-level "4" only as "Section 4".
+                patterns.append(rf"(?<![\d.]){re.escape(number)}(?![\d]|\.\d)" if "." in number
+                                else rf"\bsections?\s+{re.escape(number)}(?![\d]|\.\d)")
+            patterns.append(re.escape(name))
+        cites = re.compile("|".join(patterns), re.IGNORECASE)
+        paragraphs = re.split(r"\n[ \t]*\n", feedback)
+        return "\n\n".join(paragraph for paragraph in paragraphs if not cites.search(paragraph)).strip()
+
+    def current_risks(self) -> list:
+        """
+        Returns the baseline risks still current merged with risks from the re-reviewed sections; a risk
+        raised by several sources is counted once.
+        """
+        risks = [risk for source_risks in self._risks_by_source.values() for risk in source_risks]
+        if self.risk_assessor is None:
+            # Without re-assessment nothing was re-raised, so only identical baseline risks repeat.
+            unique = {id(risk): risk for risk in risks}
+            return list(unique.values())
+        return self.risk_assessor._merge_risks([[risk] for risk in risks])
@@ -1,13 +1,120 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from langchain.chains import LLMChain
+from mcp_interface.protocol_server import PREAMBLE_TITLE, ProtocolServer
+from utils.llm_registry import get_chat_model, get_prompt
+from utils.llm_resilience import stage_deadline
+from utils.llm_runner import STREAM_UPDATE_INTERVAL, run_chain, submit_with_context
+from utils.tracing import trace_stage
 import os
+import threading
+
+
+# Sections drafted at once; each is its own completion, so this bounds concurrent requests per draft.
+MAX_PARALLEL_SECTIONS = int(os.getenv("DRAFT_SECTION_WORKERS", "5"))
+STUDY_VARIABLES = ("study_title", "indication", "objectives")
+
+# Study context and the full outline come first, so every section prompt of a draft shares one prefix.
+SECTION_PROMPT = """{preamble}
+
+Protocol outline:
+{outline}
+
+---
+Write only section {{section_heading}} of this protocol.
+Guidance for this section: {{section_guidance}}
+Write the section body in markdown, consistent with the study details and the outline above.
+Do not repeat the section heading and do not write any other section.
+"""
+
+
+class ProtocolTemplate:
+    def __init__(self, source: str, preamble: str, sections: list):
+        """
+        A protocol template parsed into its preamble and top-level sections.
+        Args:
+            source: Template path, or "base" for ProtocolGenerator.base_template.
+            preamble: Instructions before the first section; may use {study_title}, {indication}, {objectives}.
+            sections: (heading, guidance) pairs in template order, e.g. ("1. Introduction", "[Elaborate ...]").
+        """
+        self.source = source
+        self.preamble = preamble
+        self.sections = sections
+        self.headings = [heading for heading, _ in sections]
+        outline = "\n".join(f"{heading}: {guidance}" if guidance else heading for heading, guidance in sections)
+        study_context = "\n".join(
+            f"{name.replace('_', ' ').title()}: {{{name}}}" for name in STUDY_VARIABLES if f"{{{name}}}" not in preamble
+        )
+        # Compiled once per template. Template files use prompt-template syntax throughout, as before.
+        self.prompt = get_prompt(
+            template=SECTION_PROMPT.format(
+                preamble="\n".join(part for part in (preamble, study_context) if part),
+                outline=outline,
+            ),
+            input_variables=list(STUDY_VARIABLES) + ["section_heading", "section_guidance"]
+        )
+
+    def guidance(self, heading: str) -> str:
+        return dict(self.sections)[heading]
+
+
+def parse_template(text: str, source: str = "base") -> ProtocolTemplate:
+    """
+    Splits template text into its preamble and numbered top-level sections, using the same heading
+    rules as ProtocolServer ("**1. Introduction**", "## 2. Study Objectives", ...).
+    Returns a ProtocolTemplate, or None if the text has no sections.
+    """
+    server = ProtocolServer(text)
+    titles = [title for title in server.child_sections() if title != PREAMBLE_TITLE]
+    if not titles:
+        return None
+
+    def strip_rules(content: str) -> str:
+        # Horizontal rules only frame the outline in the single-prompt template.
+        return "\n".join(line.strip() for line in content.splitlines() if line.strip() not in ("---", "***")).strip()
+
+    preamble = strip_rules(server.get_section(PREAMBLE_TITLE)) if PREAMBLE_TITLE in server.child_sections() else ""
+    return ProtocolTemplate(source, preamble, [(title, strip_rules(server.get_section(title))) for title in titles])
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_protocol_template(template_path: str):
+    """
+    Returns the parsed template at a path, parsed and compiled once and re-read only when the file's
+    modification time or size changes. Returns None if the file is missing or has no sections, warning
+    once per path and file version.
+    """
+    try:
+        stat = os.stat(template_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = None
+    with _templates_lock:
+        cached = _templates.get(template_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    template = None
+    if version is not None:
+        with open(template_path, 'r') as f:
+            template = parse_template(f.read(), source=template_path)
+    if template is None:
+        print(f"Warning: Template at {template_path} is missing or has no numbered sections. "
+              f"Using default base template.")
+    with _templates_lock:
+        _templates[template_path] = (version, template)
+    return template
 
 
 class ProtocolGenerator:
+    TEMPLATE_VERSION = "2"
+
     def __init__(self, llm_model="gpt-4o"):
-        self.llm = ChatOpenAI(model=llm_model, temperature=0.7, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        # Placeholder for dynamic template loading
+        self.llm = get_chat_model(llm_model, 0.7)
+        self._chains = {}
+        self._lock = threading.Lock()
+        # Used when no template file is given, or the file is missing or empty
         self.base_template = """
         You are an AI assistant specialized in drafting clinical trial protocols.
         Generate a clinical protocol based on the following details and follow ICH/FDA guidelines implicitly.
@@ -48,30 +155,142 @@ class ProtocolGenerator:
         [Placeholder for references.]
         ---
         """
+        self._base = parse_template(self.base_template)
 
-    def load_template(self, template_path: str):
-        """Loads a template from a specified path."""
-        try:
-            with open(template_path, 'r') as f:
-                return f.read()
-        except FileNotFoundError:
-            print(f"Warning: Template not found at {template_path}. Using default base template.")
-            return self.base_template
-
-    def generate_protocol_draft(self, study_title: str, indication: str, objectives: str, template_path: str = None) -> str:
-        if template_path:
-            template = self.load_template(template_path)
-        else:
-            template = self.base_template
-
-        prompt = PromptTemplate(
-            template=template,
-            input_variables=["study_title", "indication", "objectives"]
-        )
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        response = chain.run(
-            study_title=study_title,
-            indication=indication,
-            objectives=objectives
-        )
-        return response
\ No newline at end of file
+    def get_template(self, template_path: str = None) -> ProtocolTemplate:
+        """
+        Returns the parsed template for a path (cached until the file changes), or the base template.
+        """
+        if not template_path:
+            return self._base
+        return load_protocol_template(template_path) or self._base
+
+    def _get_chain(self, template: ProtocolTemplate) -> LLMChain:
+        with self._lock:
+            chain = self._chains.get(id(template.prompt))
+            if chain is None or chain.prompt is not template.prompt:
+                chain = self._chains[id(template.prompt)] = LLMChain(llm=self.llm, prompt=template.prompt)
+            return chain
+
+    @staticmethod
+    def _section_text(heading: str, body: str) -> str:
+        lines = body.strip().splitlines()
+        # Drop the heading if the model repeated it anyway.
+        if lines and ProtocolServer.normalize_title(lines[0]) == ProtocolServer.normalize_title(heading):
+            lines = lines[1:]
+        return f"**{heading}**\n" + "\n".join(lines).strip() + "\n"
+
+    @staticmethod
+    def _assemble(study_title: str, indication: str, objectives: str, sections: list) -> str:
+        header = f"Study Title: {study_title}\nIndication: {indication}\nObjectives: {objectives}\n"
+        return "\n".join([header] + [section for section in sections if section])
+
+    def generate_section(self, study_title: str, indication: str, objectives: str, section_name: str,
+                         template_path: str = None, bypass_cache: bool = False, on_partial=None) -> str:
+        """
+        Drafts a single template section.
+        Args:
+            section_name: Heading or number of a template section, e.g. "7. Safety Reporting" or "7".
+            template_path: Optional template file; defaults to the base template.
+            bypass_cache: If True, skip the shared response cache (e.g. to get a different draft).
+            on_partial: Optional callback(text_so_far), invoked from the calling thread as the section streams in.
+        Returns:
+            The section with its bold heading line, e.g. "**7. Safety Reporting**\\n...".
+        """
+        template = self.get_template(template_path)
+        heading = ProtocolServer("\n".join(f"**{h}**" for h in template.headings)).find_section_title(section_name)
+        if heading is None:
+            raise ValueError(f"Section '{section_name}' is not in template {template.source}")
+        if on_partial is None:
+            return self._draft_section(template, heading, study_title, indication, objectives, bypass_cache, None)
+        latest = [None]
+        changed = threading.Event()
+
+        def update(text):
+            latest[0] = text
+            changed.set()
+
+        # A hedged stream arrives on a worker thread, and UI callbacks only work from the calling thread.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = submit_with_context(executor, self._draft_section, template, heading, study_title, indication,
+                                         objectives, bypass_cache, update)
+            while not future.done():
+                if changed.wait(STREAM_UPDATE_INTERVAL):
+                    changed.clear()
+                    on_partial(latest[0])
+        return future.result()
+
+    def _draft_section(self, template: ProtocolTemplate, heading: str, study_title: str, indication: str,
+                       objectives: str, bypass_cache: bool, on_partial) -> str:
+        with stage_deadline("draft_section"), trace_stage("protocol_generator.generate_section",
+                                                          model=self.llm.model_name, section=heading):
+            body = run_chain(
+                self._get_chain(template),
+                template_version=self.TEMPLATE_VERSION,
+                bypass_cache=bypass_cache,
+                on_partial=(lambda text: on_partial(self._section_text(heading, text))) if on_partial else None,
+                study_title=study_title,
+                indication=indication,
+                objectives=objectives,
+                section_heading=heading,
+                section_guidance=template.guidance(heading) or "(none)"
+            )
+        return self._section_text(heading, body)
+
+    def generate_protocol_draft(self, study_title: str, indication: str, objectives: str, template_path: str = None,
+                                bypass_cache: bool = False, on_partial=None) -> str:
+        """
+        Drafts every template section concurrently, each as its own completion with the shared study
+        context, and assembles them in template order.
+        Args:
+            on_partial: Optional callback(draft_so_far), invoked from the calling thread as sections stream in.
+        Returns:
+            The assembled draft.
+        """
+        template = self.get_template(template_path)
+        sections = [None] * len(template.headings)
+        changed = threading.Event()
+
+        def streamed(index):
+            def update(text):
+                sections[index] = text
+                changed.set()
+            return update
+
+        with trace_stage("protocol_generator.generate_draft", model=self.llm.model_name,
+                         sections=len(template.headings)):
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_SECTIONS, len(sections)))) as executor:
+                futures = {
+                    submit_with_context(
+                        executor, self._draft_section, template, heading, study_title, indication, objectives,
+                        bypass_cache, streamed(index) if on_partial is not None else None
+                    ): index
+                    for index, heading in enumerate(template.headings)
+                }
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=STREAM_UPDATE_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        sections[futures[future]] = future.result()
+                    # UI callbacks (e.g. Streamlit placeholders) only work from the calling thread.
+                    if on_partial is not None and (done or changed.is_set()):
+                        changed.clear()
+                        on_partial(self._assemble(study_title, indication, objectives, sections))
+        return self._assemble(study_title, indication, objectives, sections)
+
+    def regenerate_section(self, draft: str, section_name: str, study_title: str, indication: str,
+                           objectives: str, template_path: str = None, on_partial=None) -> str:
+        """
+        Redrafts one section of an existing draft, leaving the other sections untouched.
+        The cache is bypassed, so the section gets a fresh completion.
+        Returns:
+            The draft with the section replaced.
+        """
+        section = self.generate_section(study_title, indication, objectives, section_name,
+                                        template_path=template_path, bypass_cache=True, on_partial=on_partial)
+        protocol_server = ProtocolServer(draft)
+        title = protocol_server.find_section_title(section.splitlines()[0].strip("*"))
+        if title is None:
+            raise ValueError(f"Section '{section_name}' is not in the draft")
+        protocol_server.update_section(title, section.split("\n", 1)[1])
+        return protocol_server.get_all_content()
@@ -0,0 +1,244 @@
+"""
+Background review jobs, so reviews outlive the Streamlit script run that started them.
+
+A process-wide worker pool runs agents/review_pipeline.py for submitted protocols. Submitting returns a
+job id at once; identical submissions that are still queued or running share one job. Each stage's
+output (parsed sections, every agent's feedback, risks, score) is written to SQLite as it completes,
+so the UI can poll progress, pick a job up again after a browser refresh, and jobs interrupted by a
+restart are resumed. Feedback still streaming from an agent is held in memory only and returned by get()
+alongside the stages.
+
+    queue = get_review_job_queue()
+    job_id = queue.submit(protocol_text)
+    queue.get(job_id)["stages"]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "review_jobs.sqlite3")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+class ReviewJobQueue:
+    def __init__(self, path: str = None, workers: int = None, max_jobs: int = 1000, resume: bool = True):
+        """
+        Args:
+            path: Location of the SQLite file. Defaults to $REVIEW_JOBS_PATH or .cache/review_jobs.sqlite3.
+            workers: Reviews run at once. Defaults to $REVIEW_JOB_WORKERS or 2; each review already runs
+                     its agents concurrently.
+            max_jobs: Finished jobs kept before the oldest are deleted.
+            resume: Re-queue jobs left queued or running by a previous process.
+        """
+        self.path = path or os.getenv("REVIEW_JOBS_PATH", DEFAULT_JOBS_PATH)
+        self.workers = workers or int(os.getenv("REVIEW_JOB_WORKERS", "2"))
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._partials = {}  # job id -> {agent_key: feedback so far}, for agents still streaming
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS review_jobs (
+                id TEXT PRIMARY KEY,
+                dedupe_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                options TEXT NOT NULL,
+                protocol_text TEXT NOT NULL,
+                page_starts TEXT,
+                stages TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS review_jobs_dedupe ON review_jobs (dedupe_key, status)")
+        self._conn.commit()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="review-job")
+        if resume:
+            with self._lock:
+                interrupted = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM review_jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATUSES
+                ).fetchall()]
+                # Completed stages come back from the LLM response cache when the job runs again.
+                self._conn.execute(
+                    "UPDATE review_jobs SET status = ?, stages = '[]', started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+                )
+                self._conn.commit()
+            for job_id in interrupted:
+                self._executor.submit(self._run, job_id)
+
+    @staticmethod
+    def dedupe_key(protocol_text: str, page_starts: list, options: dict) -> str:
+        """Submissions with the same protocol, page offsets and review options share a key."""
+        payload = json.dumps([protocol_text, page_starts, options], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def submit(self, protocol_text: str, page_starts: list = None, llm_model: str = "gpt-4o",
+               bypass_cache: bool = False, reuse_findings: bool = False, triage: bool = False) -> str:
+        """
+        Queues a review and returns its job id without waiting for it. If an identical review is already
+        queued or running, its id is returned instead of starting another.
+        Args:
+            protocol_text: Full protocol text.
+            page_starts: Optional page offsets from DocumentProcessor.
+            llm_model: Model used by the agents and the risk assessor.
+            bypass_cache: If True, skip the shared LLM response cache.
+            reuse_findings: Review against the process-wide findings store (utils/findings_store.py).
+            triage: Screen sections with the process-wide cheap-model triager first (agents/triage.py).
+        """
+        options = {"llm_model": llm_model, "bypass_cache": bypass_cache, "reuse_findings": reuse_findings,
+                   "triage": triage}
+        key = self.dedupe_key(protocol_text, page_starts, options)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM review_jobs WHERE dedupe_key = ? AND status IN (?, ?)", (key,) + ACTIVE_STATUSES
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            job_id = uuid.uuid4().hex[:12]
+            self._conn.execute(
+                "INSERT INTO review_jobs (id, dedupe_key, status, options, protocol_text, page_starts, stages, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, '[]', ?)",
+                (job_id, key, QUEUED, json.dumps(options), protocol_text,
+                 json.dumps(page_starts) if page_starts is not None else None, time.time()),
+            )
+            self._prune_locked()
+            self._conn.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _prune_locked(self):
+        finished = self._conn.execute(
+            "SELECT COUNT(*) FROM review_jobs WHERE status NOT IN (?, ?)", ACTIVE_STATUSES
+        ).fetchone()[0]
+        if finished > self.max_jobs:
+            self._conn.execute(
+                "DELETE FROM review_jobs WHERE id IN (SELECT id FROM review_jobs WHERE status NOT IN (?, ?) "
+                "ORDER BY created_at ASC LIMIT ?)", ACTIVE_STATUSES + (finished - self.max_jobs,)
+            )
+
+    def _update(self, job_id: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE review_jobs SET {columns} WHERE id = ?", tuple(fields.values()) + (job_id,))
+            self._conn.commit()
+
+    def _run(self, job_id: str):
+        # Deferred: the agents (LangChain, OpenAI client) load when the first job runs.
+        from agents.review_pipeline import run_review_pipeline
+        from agents.triage import get_default_triager
+        from utils.findings_store import get_default_findings_store
+
+        protocol_text, page_starts = self.protocol(job_id)
+        job = self.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        options = job["options"]
+        stages = []
+        self._update(job_id, status=RUNNING, started_at=time.time(), stages="[]")
+
+        def on_stage(stage, payload):
+            stages.append({"stage": stage, "payload": payload, "at": time.time()})
+            with self._lock:
+                if stage == "agent":
+                    self._partials.get(job_id, {}).pop(payload["agent"], None)
+                self._conn.execute("UPDATE review_jobs SET stages = ? WHERE id = ?", (json.dumps(stages), job_id))
+                self._conn.commit()
+
+        def on_partial(agent_key, text):
+            with self._lock:
+                self._partials.setdefault(job_id, {})[agent_key] = text
+
+        try:
+            result = run_review_pipeline(
+                protocol_text, page_starts=page_starts, llm_model=options["llm_model"],
+                bypass_cache=options["bypass_cache"], on_stage=on_stage,
+                findings_store=get_default_findings_store() if options["reuse_findings"] else None,
+                triage=get_default_triager() if options.get("triage") else None,
+                on_partial=on_partial
+            )
+            self._update(job_id, status=DONE, result=json.dumps(result), finished_at=time.time())
+        except Exception as e:
+            print(f"Review job {job_id} failed: {e}")
+            self._update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", finished_at=time.time())
+        finally:
+            with self._lock:
+                self._partials.pop(job_id, None)
+
+    def get(self, job_id: str):
+        """
+        Returns a job as a dict (id, status, options, stages, partial_feedback, result, error, created_at,
+        started_at, finished_at), or None if it doesn't exist. stages lists {"stage", "payload", "at"} in
+        completion order; partial_feedback maps agents still streaming to their feedback so far; result is
+        run_review_pipeline's output once the job is done.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, options, stages, result, error, created_at, started_at, finished_at "
+                "FROM review_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            partial_feedback = dict(self._partials.get(job_id, {}))
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "options": json.loads(row[2]),
+            "stages": json.loads(row[3]),
+            "partial_feedback": partial_feedback,
+            "result": json.loads(row[4]) if row[4] is not None else None,
+            "error": row[5],
+            "created_at": row[6],
+            "started_at": row[7],
+            "finished_at": row[8],
+        }
+
+    def protocol(self, job_id: str):
+        """Returns (protocol_text, page_starts) of a job, or (None, None) if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute("SELECT protocol_text, page_starts FROM review_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    def stats(self) -> dict:
+        """Returns the number of jobs per status and the worker count."""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM review_jobs GROUP BY status").fetchall())
+        return {"workers": self.workers, **{status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}}
+
+    def shutdown(self, wait: bool = True):
+        """Stops the workers; queued jobs stay in the database and resume in the next process."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_review_job_queue() -> ReviewJobQueue:
+    """
+    Returns the process-wide review job queue, shared by every Streamlit session.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = ReviewJobQueue()
+        return _default_queue
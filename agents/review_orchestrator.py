@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+from mcp_interface.protocol_server import ProtocolServer
+from utils.llm_runner import submit_with_context
+import time
+
+
+class AgentReviewResult:
+    """
+    Outcome of a single agent's review, successful or not.
+    """
+    def __init__(self, agent_key: str, feedback: str = None, error: Exception = None, elapsed: float = 0.0,
+                 routing_report: dict = None, section_findings: list = None):
+        self.agent_key = agent_key
+        self.feedback = feedback
+        self.error = error
+        self.elapsed = elapsed
+        self.routing_report = routing_report
+        # Per-section findings when the review ran against a findings store.
+        self.section_findings = section_findings
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ReviewOrchestrator:
+    def __init__(self, agents: dict = None, max_workers: int = None, warm_first: bool = True):
+        """
+        Fans a protocol review out to every registered agent concurrently.
+        Args:
+            agents: Mapping of agent key (e.g. "pi") to an agent exposing review_protocol(protocol_server).
+            max_workers: Upper bound on concurrent agent calls. Defaults to one thread per agent.
+            warm_first: When the agents share a cacheable prompt prefix, start the first agent alone and
+                        the others once its prompt has been processed, so they hit the provider's prompt cache.
+        """
+        self.agents = dict(agents or {})
+        self.max_workers = max_workers
+        self.warm_first = warm_first
+
+    def register(self, agent_key: str, agent):
+        """Registers an agent under the given key."""
+        self.agents[agent_key] = agent
+
+    def _run_agent(self, agent_key: str, agent, protocol_server: ProtocolServer, review_kwargs: dict) -> AgentReviewResult:
+        start = time.perf_counter()
+        try:
+            feedback = agent.review_protocol(protocol_server, **review_kwargs)
+            return AgentReviewResult(agent_key, feedback=feedback, elapsed=time.perf_counter() - start,
+                                     routing_report=getattr(agent, "last_routing_report", None),
+                                     section_findings=getattr(agent, "last_section_findings", None))
+        except Exception as e:
+            # Isolate failures so one agent's timeout doesn't discard the other reviews.
+            print(f"Agent '{agent_key}' failed during review: {e}")
+            return AgentReviewResult(agent_key, error=e, elapsed=time.perf_counter() - start)
+
+    def _warm_up_key(self, protocol_server: ProtocolServer, review_kwargs: dict):
+        """Key of the agent that should run first to warm the prompt cache, or None."""
+        # Section-by-section reviews (findings store, triage) don't send the shared prefix.
+        if (not self.warm_first or len(self.agents) < 2 or review_kwargs.get("findings_store") is not None
+                or review_kwargs.get("triage") is not None):
+            return None
+        agent_key, agent = next(iter(self.agents.items()))
+        shares_prefix = getattr(agent, "shares_prompt_prefix", None)
+        return agent_key if shares_prefix is not None and shares_prefix(protocol_server) else None
+
+    def _dispatch(self, executor, task, protocol_server: ProtocolServer, review_kwargs: dict) -> list:
+        """
+        Submits task(agent_key, agent, on_token) for every agent and returns the futures. on_token is a
+        callback the warm-up agent's task must call when its first token arrives; None for the others.
+        """
+        pending = list(self.agents.items())
+        futures = []
+        if self._warm_up_key(protocol_server, review_kwargs) is not None:
+            agent_key, agent = pending.pop(0)
+            warmed = threading.Event()
+            futures.append(submit_with_context(executor, task, agent_key, agent, warmed.set))
+            # The provider caches the prompt prefix once the first request's prompt has been processed,
+            # i.e. by the time its first token streams back. Waiting only for that keeps the delay short.
+            while not warmed.wait(0.05) and not futures[0].done():
+                pass
+        futures += [submit_with_context(executor, task, agent_key, agent, None) for agent_key, agent in pending]
+        return futures
+
+    def iter_reviews(self, protocol_server: ProtocolServer, **review_kwargs):
+        """
+        Runs all agents at once and yields each AgentReviewResult as soon as it finishes.
+        Args:
+            protocol_server: An instance of ProtocolServer shared by all agents.
+            **review_kwargs: Passed through to each agent's review_protocol (e.g. bypass_cache=True).
+        """
+        if not self.agents:
+            return
+        def task(agent_key, agent, on_token):
+            kwargs = dict(review_kwargs)
+            if on_token is not None:
+                kwargs["on_partial"] = lambda text: on_token()
+            return self._run_agent(agent_key, agent, protocol_server, kwargs)
+
+        workers = self.max_workers or len(self.agents)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review-agent") as executor:
+            futures = self._dispatch(executor, task, protocol_server, review_kwargs)
+            for future in as_completed(futures):
+                yield future.result()
+
+    def stream_reviews(self, protocol_server: ProtocolServer, **review_kwargs):
+        """
+        Runs all agents at once and yields progress events for the UI thread:
+        ("partial", agent_key, text_so_far) while an agent's feedback is streaming, and
+        ("done", agent_key, AgentReviewResult) when it finishes. Partial updates are coalesced
+        so a slow consumer only sees the latest text per agent.
+        """
+        if not self.agents:
+            return
+        events = queue.Queue()
+
+        def run(agent_key, agent, on_token):
+            def on_partial(text):
+                if on_token is not None:
+                    on_token()
+                events.put(("partial", agent_key, text))
+            kwargs = dict(review_kwargs, on_partial=on_partial)
+            events.put(("done", agent_key, self._run_agent(agent_key, agent, protocol_server, kwargs)))
+
+        workers = self.max_workers or len(self.agents)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review-agent") as executor:
+            self._dispatch(executor, run, protocol_server, review_kwargs)
+            remaining = len(self.agents)
+            while remaining:
+                pending = [events.get()]
+                while True:
+                    try:
+                        pending.append(events.get_nowait())
+                    except queue.Empty:
+                        break
+                latest_partial = {}
+                for kind, agent_key, payload in pending:
+                    if kind == "partial":
+                        latest_partial[agent_key] = payload
+                    else:
+                        latest_partial.pop(agent_key, None)
+                        remaining -= 1
+                        yield kind, agent_key, payload
+                for agent_key, text in latest_partial.items():
+                    yield "partial", agent_key, text
+
+    def review(self, protocol_server: ProtocolServer, **review_kwargs) -> dict:
+        """
+        Runs all agents concurrently and returns {agent_key: AgentReviewResult} in registration order.
+        """
+        results = {result.agent_key: result for result in self.iter_reviews(protocol_server, **review_kwargs)}
+        return {agent_key: results[agent_key] for agent_key in self.agents if agent_key in results}
+
+    @staticmethod
+    def collect_feedback(results: dict) -> dict:
+        """
+        Builds the {agent_key: feedback} dict consumed by RiskAssessor, skipping failed agents.
+        """
+        return {agent_key: result.feedback for agent_key, result in results.items() if result.ok}
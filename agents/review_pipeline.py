@@ -0,0 +1,151 @@
+from agents.chunked_review import NO_CONCERNS, has_concerns
+from agents.pi_agent import PIAgent
+from agents.site_physician_agent import SitePhysicianAgent
+from agents.health_authority_agent import HealthAuthorityAgent
+from agents.review_orchestrator import ReviewOrchestrator
+from mcp_interface.protocol_store import get_default_protocol_store
+from utils.risk_assessor import RiskAssessor, UNASSESSED
+from utils.scoring_engine import ScoringEngine
+from utils.llm_registry import get_agent
+from utils.llm_runner import track_usage
+from utils.tracing import trace_stage
+import time
+
+
+def build_review_agents(llm_model: str = "gpt-4o") -> dict:
+    """
+    Returns the standard reviewer panel, keyed the way RiskAssessor expects.
+    Agents come from the process-wide registry, so clients and prompts are built once.
+    """
+    return {
+        "pi": get_agent(PIAgent, llm_model),
+        "site_physician": get_agent(SitePhysicianAgent, llm_model),
+        "health_authority": get_agent(HealthAuthorityAgent, llm_model),
+    }
+
+
+def assess_review_risks(risk_assessor, results: dict, bypass_cache: bool = False, findings_store=None) -> list:
+    """
+    Assesses the amendment risks of a review's AgentReviewResults.
+    With a findings store, risks are assessed per agent and section: sections whose findings were
+    reused bring their stored risks, sections without concerns are skipped, and the risks of newly
+    reviewed sections are stored alongside their findings.
+    """
+    feedback = ReviewOrchestrator.collect_feedback(results)
+    if findings_store is None:
+        # Agents whose sections were all cleared by triage have nothing to assess.
+        clear = {agent_key: [] for agent_key, agent_feedback in feedback.items() if agent_feedback.strip() == NO_CONCERNS}
+        fresh = {agent_key: agent_feedback for agent_key, agent_feedback in feedback.items() if agent_key not in clear}
+        return risk_assessor.assess_risks(fresh, bypass_cache=bypass_cache, known_risks=clear)
+
+    fresh, known, entry_ids = {}, {}, {}
+    for agent_key, result in results.items():
+        if not result.ok:
+            continue
+        if result.section_findings is None:
+            fresh[agent_key] = feedback[agent_key]
+            continue
+        for item in result.section_findings:
+            source = f"{agent_key} | {item['section']}"
+            if item["risks"] is not None:
+                known[source] = [dict(risk, agents=[source]) for risk in item["risks"]]
+            elif not has_concerns(item["findings"]):
+                known[source] = []
+                entry_ids[source] = item["entry_id"]
+            else:
+                fresh[source] = item["findings"]
+                entry_ids[source] = item["entry_id"]
+    risks = risk_assessor.assess_risks(fresh, bypass_cache=bypass_cache, known_risks=known)
+    for source, entry_id in entry_ids.items():
+        source_risks = [dict(risk, agents=[source]) for risk in risks if source in risk["agents"]]
+        # Failed assessments are not stored, so the next review of this section retries them.
+        if entry_id is not None and not any(risk["severity"] == UNASSESSED for risk in source_risks):
+            findings_store.attach_risks(entry_id, source_risks)
+    return risks
+
+
+def run_review_pipeline(protocol_text: str, page_starts: list = None, llm_model: str = "gpt-4o",
+                        bypass_cache: bool = False, on_stage=None, findings_store=None, triage=None,
+                        on_partial=None) -> dict:
+    """
+    Runs ProtocolServer -> the three agents -> RiskAssessor -> ScoringEngine on one protocol.
+    Args:
+        protocol_text: Full protocol text.
+        page_starts: Optional page offsets from DocumentProcessor.
+        llm_model: Model used by the agents and the risk assessor.
+        bypass_cache: If True, skip the shared LLM response cache.
+        on_stage: Optional callback(stage_name, payload) invoked as each stage completes.
+        findings_store: Optional utils.findings_store.FindingsStore to reuse findings of near-identical
+                        sections reviewed before (see BaseReviewAgent.review_protocol).
+        triage: Optional agents.triage.SectionTriager; a cheap model screens each section and only flagged
+                sections are reviewed by llm_model.
+        on_partial: Optional callback(agent_key, text_so_far) to stream each agent's feedback as it is
+                    generated; the "agent" stage still reports the finished feedback.
+    Returns:
+        A JSON-serializable dict with feedback, risks, score (None if the risk assessment failed for any
+        agent), per-agent errors, routing reports, token usage and timing.
+    """
+    start = time.perf_counter()
+    notify = on_stage or (lambda stage, payload: None)
+    # One root span per protocol, so every stage's span carries the same trace_id.
+    with track_usage() as usage, trace_stage("review_pipeline", model=llm_model):
+        # Shared read-only snapshot: a protocol already previewed or reviewed in this process isn't parsed again.
+        _, protocol_server = get_default_protocol_store().open(protocol_text, page_starts=page_starts)
+        notify("parsed", {"sections": protocol_server.section_titles()})
+
+        orchestrator = ReviewOrchestrator(build_review_agents(llm_model))
+        review_kwargs = {"bypass_cache": bypass_cache}
+        if findings_store is not None:
+            review_kwargs["findings_store"] = findings_store
+        if triage is not None:
+            review_kwargs["triage"] = triage
+        results = {}
+        if on_partial is None:
+            events = (("done", result.agent_key, result)
+                      for result in orchestrator.iter_reviews(protocol_server, **review_kwargs))
+        else:
+            events = orchestrator.stream_reviews(protocol_server, **review_kwargs)
+        for kind, agent_key, result in events:
+            if kind == "partial":
+                on_partial(agent_key, result)
+                continue
+            results[agent_key] = result
+            notify("agent", {"agent": result.agent_key, "feedback": result.feedback,
+                             "error": str(result.error) if result.error else None,
+                             "routing_report": result.routing_report})
+        feedback = ReviewOrchestrator.collect_feedback(results)
+        agent_errors = {key: str(result.error) for key, result in results.items() if not result.ok}
+        if not feedback:
+            raise RuntimeError(f"All review agents failed: {agent_errors}")
+
+        amendment_risks = assess_review_risks(get_agent(RiskAssessor, llm_model), results, bypass_cache, findings_store)
+        for risk in amendment_risks:
+            if risk.get("severity") == UNASSESSED:
+                agent_errors["risk_assessor"] = risk.get("rationale", "")
+        notify("risks", {"risks": amendment_risks})
+
+        # None if any agent's risks couldn't be assessed; see agent_errors["risk_assessor"].
+        score = ScoringEngine().score_if_assessed(amendment_risks)
+        notify("score", {"score": score})
+
+    reused = [item for result in results.values() for item in result.section_findings or [] if item["reused"]]
+    triaged = [result.routing_report for result in results.values() if (result.routing_report or {}).get("triage")]
+    return {
+        "feedback": feedback,
+        "agent_errors": agent_errors,
+        "risks": amendment_risks,
+        "score": score,
+        "routing_reports": {key: result.routing_report for key, result in results.items() if result.ok},
+        "usage": usage.as_dict(),
+        "findings_reuse": {
+            "sections": sum(len(result.section_findings or []) for result in results.values()),
+            "reused": len(reused),
+            "tokens_saved": sum((result.routing_report or {}).get("reused_tokens", 0) for result in results.values()),
+        } if findings_store is not None else None,
+        "triage": {
+            "sections": sum(len(report["triage"]["escalated"]) + len(report["triage"]["skipped"]) for report in triaged),
+            "escalated": sum(len(report["triage"]["escalated"]) for report in triaged),
+            "skipped_tokens": sum(report["triage"]["skipped_tokens"] for report in triaged),
+        } if triage is not None else None,
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+    }
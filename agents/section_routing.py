@@ -0,0 +1,83 @@
+from mcp_interface.protocol_server import ProtocolServer
+from utils.token_counter import count_tokens
+
+
+# Declarative map of the protocol sections each agent is responsible for.
+# Each entry is a group of alternative headings for one area of the protocol; an agent mapped to
+# None receives the full protocol. If any area can't be matched, the agent falls back to the full text.
+AGENT_SECTION_MAP = {
+    "pi": None,
+    "site_physician": [
+        ("Study Population", "Eligibility", "Inclusion Criteria", "Exclusion Criteria", "Selection of Subjects"),
+        ("Study Procedures", "Schedule of Assessments", "Study Assessments", "Study Visits"),
+        ("Dosing", "Study Treatment", "Investigational Product", "Study Drug", "Treatment", "Study Design"),
+    ],
+    "health_authority": [
+        ("Safety Reporting", "Adverse Events", "Safety"),
+        ("Ethical Considerations", "Informed Consent", "Ethics"),
+        ("Statistical Considerations", "Statistical Analysis", "Statistics", "Sample Size"),
+        ("Data Management and Quality Control", "Data Management", "Quality Control", "Quality Assurance"),
+    ],
+}
+
+
+def route_protocol_content(protocol_server: ProtocolServer, agent_key: str, model: str = "gpt-4o"):
+    """
+    Builds the protocol text an agent should review from its entry in AGENT_SECTION_MAP.
+    Args:
+        protocol_server: An instance of ProtocolServer to access protocol content.
+        agent_key: Key of the agent in AGENT_SECTION_MAP.
+        model: Model name used for token counting.
+    Returns:
+        A (content, report) tuple. The report holds the matched sections, whether the full text was
+        used as a fallback, and the input tokens saved relative to sending the full protocol.
+    """
+    full_protocol = protocol_server.get_all_content()
+    full_tokens = count_tokens(full_protocol, model)
+    routes = AGENT_SECTION_MAP.get(agent_key)
+
+    titles = []
+    fallback = routes is None
+    for aliases in routes or []:
+        matched = [protocol_server.find_section_title(alias) for alias in aliases]
+        matched = [title for title in matched if title is not None]
+        if not matched:
+            fallback = True
+            break
+        for title in matched:
+            if title not in titles:
+                titles.append(title)
+
+    if fallback:
+        content = full_protocol
+        titles = []
+    else:
+        # Keep document order so the excerpt reads like the original protocol, and drop subsections
+        # already included through their parent (e.g. "4.1 Inclusion Criteria" under "4. Study Population").
+        order = protocol_server.section_titles()
+        titles.sort(key=order.index)
+        spans = [protocol_server.get_section_entry(title) for title in titles]
+        titles = [
+            title for title, entry in zip(titles, spans)
+            if entry is None or not any(
+                other is not entry and other is not None and other.start <= entry.heading_start < other.end
+                for other in spans
+            )
+        ]
+        parts = [f"[Protocol sections provided for this review: {'; '.join(titles)}]"]
+        parts.extend(f"{title}\n{protocol_server.get_section(title)}" for title in titles)
+        content = "\n\n".join(parts)
+
+    routed_tokens = full_tokens if fallback else count_tokens(content, model)
+    if routed_tokens >= full_tokens:
+        # Short protocols with little outside the routed sections: the full text is no more expensive.
+        content, titles, fallback, routed_tokens = full_protocol, [], True, full_tokens
+    report = {
+        "agent": agent_key,
+        "sections": titles,
+        "fallback": fallback,
+        "full_tokens": full_tokens,
+        "routed_tokens": routed_tokens,
+        "saved_tokens": max(0, full_tokens - routed_tokens),
+    }
+    return content, report
@@ -1,27 +1,14 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from mcp_interface.protocol_server import ProtocolServer
-import os
+from agents.base_agent import BaseReviewAgent
 
-class SitePhysicianAgent:
-    def __init__(self, llm_model="gpt-4o"):
-        """
-        Initializes the SitePhysicianAgent with an LLM and a specific prompt.
-        """
-        self.llm = ChatOpenAI(model=llm_model, temperature=0.5, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        self.prompt_template = PromptTemplate(
-            template="""
-            You are a Site Physician reviewing a clinical trial protocol.
+
+class SitePhysicianAgent(BaseReviewAgent):
+    agent_key = "site_physician"
+    TEMPLATE_VERSION = "2"
+    ROLE_INSTRUCTIONS = """
+            You are a Site Physician reviewing the clinical trial protocol above.
             Your focus is on the practical implementation at a clinical site, patient management, and operational challenges.
-            Identify any potential issues that could lead to amendments, suggest improvements, and provide a clear rationale.
             Provide your feedback as a section-level summary for each area of concern.
 
-            Review the following protocol content:
-            ---
-            {protocol_content}
-            ---
-
             Provide your feedback in a structured format, highlighting concerns and recommendations.
             Focus on these key areas, and for each, provide a summary of potential issues and practical recommendations for improvement.
             If a section has no major concerns from your perspective, state "No major concerns for this section."
@@ -53,21 +40,10 @@ class SitePhysicianAgent:
             Recommendation: Specify which psychiatric disorders are relevant (e.g., unstable, severe psychiatric disorders requiring hospitalization within 6 months).
 
             Now provide your full review based on the protocol:
-            """,
-            input_variables=["protocol_content"]
-        )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
+            """
 
-    def review_protocol(self, protocol_server: ProtocolServer) -> str:
+    def __init__(self, llm_model="gpt-4o"):
         """
-        Reviews the clinical protocol from a Site Physician's perspective.
-        Args:
-            protocol_server: An instance of ProtocolServer to access protocol content.
-        Returns:
-            A string containing the site physician's feedback and recommendations.
+        Initializes the SitePhysicianAgent with an LLM and a specific prompt.
         """
-        # For section-level summary, we still give the full protocol context for now
-        # but the agent is prompted to focus on certain aspects.
-        full_protocol = protocol_server.get_all_content()
-        response = self.chain.run(protocol_content=full_protocol)
-        return response
\ No newline at end of file
+        super().__init__(llm_model=llm_model, temperature=0.5)
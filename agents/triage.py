@@ -0,0 +1,202 @@
+"""
+Two-tier review: a cheap model screens each section from a reviewer's perspective, and only the
+sections it flags are reviewed by the reviewer's own (expensive) model.
+
+Every screening decision is appended to an audit log, so what was skipped, and why, can be checked
+later. Recall against full reviews is measured by running with threshold 0 (every section is then
+also reviewed by the expensive model) and replaying the recorded scores with triage_recall.
+
+    triager = SectionTriager(threshold=0.3)
+    run_review_pipeline(protocol_text, triage=triager)
+    triage_recall(load_audit_log(), threshold=0.3)
+"""
+from pydantic import BaseModel, Field
+from agents.chunked_review import has_concerns
+from utils.llm_registry import get_chat_model, get_prompt
+from utils.llm_runner import run_structured
+from utils.token_counter import count_tokens
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_TRIAGE_MODEL = os.getenv("TRIAGE_MODEL", "gpt-4o-mini")
+DEFAULT_TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.3"))
+DEFAULT_AUDIT_PATH = os.path.join(".cache", "triage_audit.jsonl")
+
+
+class SectionTriage(BaseModel):
+    """Screening verdict for one protocol section."""
+    concern_score: float = Field(ge=0, le=1, description=(
+        "Likelihood (0-1) that a detailed expert review of this section from the reviewer's perspective "
+        "finds an issue that could lead to a protocol amendment."))
+    concerns: list[str] = Field(description="Brief notes on the possible issues; empty if there are none.")
+
+
+class SectionTriager:
+    TEMPLATE_VERSION = "1"
+
+    def __init__(self, llm_model: str = None, threshold: float = None, agent_thresholds: dict = None,
+                 audit_path: str = None, escalate_on_error: bool = True):
+        """
+        Args:
+            llm_model: Cheap screening model. Defaults to $TRIAGE_MODEL or gpt-4o-mini.
+            threshold: concern_score at or above which a section is escalated to the reviewer's model.
+                       Defaults to $TRIAGE_THRESHOLD or 0.3; 0 escalates every section.
+            agent_thresholds: Optional per-agent thresholds, e.g. {"health_authority": 0.1}.
+            audit_path: JSON lines file every decision is appended to. Defaults to $TRIAGE_AUDIT_PATH or
+                        .cache/triage_audit.jsonl; pass "" to keep decisions in memory only.
+            escalate_on_error: Escalate sections whose screening failed rather than skipping them.
+        """
+        self.llm = get_chat_model(llm_model or DEFAULT_TRIAGE_MODEL, 0.0)
+        self.threshold = threshold if threshold is not None else DEFAULT_TRIAGE_THRESHOLD
+        self.agent_thresholds = dict(agent_thresholds or {})
+        self.audit_path = audit_path if audit_path is not None else os.getenv("TRIAGE_AUDIT_PATH", DEFAULT_AUDIT_PATH)
+        self.escalate_on_error = escalate_on_error
+        self.decisions = []
+        self._lock = threading.Lock()
+        self.prompt_template = get_prompt(
+            template="""
+            You are screening one section of a clinical trial protocol before an expert review.
+            Judge whether the expert, whose brief is given below, would find issues in this section that
+            could lead to a protocol amendment. Be conservative: when in doubt, give a higher score.
+
+            Expert's brief:
+            {role_instructions}
+
+            Protocol section ({section_title}):
+            ---
+            {section_text}
+            ---
+            """,
+            input_variables=["role_instructions", "section_title", "section_text"]
+        )
+
+    def threshold_for(self, agent_key: str) -> float:
+        return self.agent_thresholds.get(agent_key, self.threshold)
+
+    def screen(self, agent, section_title: str, section_text: str, bypass_cache: bool = False) -> dict:
+        """
+        Screens one section for an agent. Returns the decision (agent, section, score, concerns,
+        threshold, escalated, error, section_tokens, ...); record it with record() once known.
+        """
+        threshold = self.threshold_for(agent.agent_key)
+        score, concerns, error = None, [], None
+        try:
+            verdict = run_structured(
+                self.llm,
+                self.prompt_template,
+                SectionTriage,
+                template_version=self.TEMPLATE_VERSION,
+                bypass_cache=bypass_cache,
+                role_instructions=agent.ROLE_INSTRUCTIONS.strip(),
+                section_title=section_title,
+                section_text=section_text
+            )
+            score, concerns = verdict["concern_score"], verdict["concerns"]
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Triage of '{section_title}' for '{agent.agent_key}' failed: {e}")
+        escalated = score >= threshold if score is not None else self.escalate_on_error
+        return {
+            "time": time.time(),
+            "agent": agent.agent_key,
+            "section": section_title,
+            "triage_model": self.llm.model_name,
+            "review_model": agent.llm.model_name,
+            "score": score,
+            "concerns": concerns,
+            "threshold": threshold,
+            "escalated": escalated,
+            "error": error,
+            "section_tokens": count_tokens(section_text, agent.llm.model_name),
+        }
+
+    def record(self, decision: dict, review_findings: str = None):
+        """
+        Adds a decision to the audit log. For escalated sections, pass the expensive model's findings so
+        the decision records whether that review raised concerns (used by triage_recall).
+        """
+        entry = dict(decision, review_has_concerns=has_concerns(review_findings) if review_findings is not None else None)
+        with self._lock:
+            self.decisions.append(entry)
+            if self.audit_path:
+                directory = os.path.dirname(self.audit_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.audit_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def stats(self) -> dict:
+        """Returns the sections screened, escalated and skipped, and the section tokens kept from the reviewer's model."""
+        with self._lock:
+            decisions = list(self.decisions)
+        skipped = [decision for decision in decisions if not decision["escalated"]]
+        return {
+            "sections": len(decisions),
+            "escalated": len(decisions) - len(skipped),
+            "skipped": len(skipped),
+            "escalation_rate": (len(decisions) - len(skipped)) / len(decisions) if decisions else 0.0,
+            "skipped_tokens": sum(decision["section_tokens"] for decision in skipped),
+            "errors": sum(1 for decision in decisions if decision["error"]),
+        }
+
+
+def load_audit_log(path: str = None) -> list:
+    """Reads the decisions of a triage audit log."""
+    path = path or os.getenv("TRIAGE_AUDIT_PATH", DEFAULT_AUDIT_PATH)
+    decisions = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                decisions.append(json.loads(line))
+            except ValueError:
+                continue
+    return decisions
+
+
+def triage_recall(decisions: list, threshold: float = None) -> dict:
+    """
+    Measures how many of the sections the expensive model raised concerns about were escalated by triage.
+    Only decisions whose section was also reviewed by the expensive model count, so for a full picture
+    record them with threshold 0 (a calibration run reviewing every section) and pass the threshold to
+    evaluate here.
+    Args:
+        decisions: Triage decisions, e.g. from SectionTriager.decisions or load_audit_log().
+        threshold: Threshold to replay on the recorded scores. Defaults to each decision's own outcome.
+    Returns:
+        {"sections", "flagged" (sections the expensive model raised concerns about), "caught" (of those,
+         escalated), "recall", "escalation_rate"}
+    """
+    labelled = [decision for decision in decisions if decision.get("review_has_concerns") is not None]
+
+    def escalated(decision):
+        if threshold is None:
+            return decision["escalated"]
+        return decision["score"] is None or decision["score"] >= threshold
+
+    flagged = [decision for decision in labelled if decision["review_has_concerns"]]
+    caught = sum(1 for decision in flagged if escalated(decision))
+    return {
+        "sections": len(labelled),
+        "flagged": len(flagged),
+        "caught": caught,
+        "recall": caught / len(flagged) if flagged else 1.0,
+        "escalation_rate": sum(1 for decision in labelled if escalated(decision)) / len(labelled) if labelled else 0.0,
+    }
+
+
+_default_triager = None
+_default_triager_lock = threading.Lock()
+
+
+def get_default_triager() -> SectionTriager:
+    """
+    Returns the process-wide triager, configured from $TRIAGE_MODEL and $TRIAGE_THRESHOLD.
+    """
+    global _default_triager
+    with _default_triager_lock:
+        if _default_triager is None:
+            _default_triager = SectionTriager()
+        return _default_triager
@@ -0,0 +1,259 @@
+"""
+Headless batch review of a protocol library.
+
+Runs DocumentProcessor -> ProtocolServer -> the three agents -> RiskAssessor -> ScoringEngine on every
+PDF/TXT/MD protocol in the given directories, files or manifest, and appends one JSON line per protocol
+to the output file. Re-running with the same output file skips protocols that already succeeded;
+failed and partial reviews are retried.
+
+    python batch_review.py protocols/ --output results.jsonl --concurrency 4
+    python batch_review.py --manifest manifest.txt --output results.jsonl
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+import threading
+import time
+
+from agents.chunked_review import preflight_review
+from agents.review_pipeline import build_review_agents, run_review_pipeline
+from mcp_interface.protocol_store import get_default_protocol_store
+from utils.document_processor import DocumentProcessor
+from utils.llm_resilience import get_call_guard
+from utils.llm_runner import global_usage
+from utils.rate_limiter import BATCH, get_scheduler, request_priority
+from utils.tracing import get_tracer
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+def discover_protocols(inputs: list, manifest: str = None) -> list:
+    """
+    Returns a list of (protocol_id, path) pairs from directories, files and an optional manifest.
+    A manifest is either one path per line or JSON lines with "path" and optional "id", "study" and
+    "indication" (see read_manifest_metadata).
+    """
+    protocols = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        path = os.path.join(root, name)
+                        protocols.append((os.path.relpath(path, item), path))
+        elif os.path.isfile(item):
+            protocols.append((os.path.basename(item), item))
+        else:
+            print(f"Warning: {item} does not exist, skipping.")
+    if manifest:
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    path = record["path"]
+                    protocol_id = record.get("id", path)
+                else:
+                    path = protocol_id = line
+                protocols.append((protocol_id, path if os.path.isabs(path) else os.path.join(base_dir, path)))
+    return sorted(set(protocols))
+
+
+def read_manifest_metadata(manifest: str = None) -> dict:
+    """
+    Returns {protocol_id: {"study", "indication"}} from a JSON lines manifest, for the portfolio
+    aggregates of portfolio_report.py. Plain path lines carry no metadata.
+    """
+    metadata = {}
+    if not manifest:
+        return metadata
+    with open(manifest, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):
+                record = json.loads(line)
+                fields = {key: record[key] for key in ("study", "indication") if record.get(key)}
+                if fields:
+                    metadata[record.get("id", record["path"])] = fields
+    return metadata
+
+
+def load_completed_ids(output_path: str) -> set:
+    """Returns the ids of protocols already reviewed successfully in a previous run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run.
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def read_protocol(path: str, doc_processor: DocumentProcessor):
+    """Returns (text, page_starts) for a protocol file."""
+    if path.lower().endswith(".pdf"):
+        with open(path, "rb") as f:
+            document = doc_processor.extract_pdf_document(f)
+        return document.text, document.page_starts
+    with open(path, "r", encoding="utf-8") as f:
+        return doc_processor.process_text_file(f), None
+
+
+def review_file(protocol_id: str, path: str, doc_processor: DocumentProcessor, llm_model: str, bypass_cache: bool,
+                findings_store=None, metadata: dict = None, triage=None) -> dict:
+    record = {"id": protocol_id, "path": path, **(metadata or {})}
+    record["reviewed_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    try:
+        text, page_starts = read_protocol(path, doc_processor)
+        # Batch work yields to interactive reviews sharing the same rate limits.
+        with request_priority(BATCH):
+            record.update(run_review_pipeline(text, page_starts=page_starts, llm_model=llm_model,
+                                              bypass_cache=bypass_cache, findings_store=findings_store,
+                                              triage=triage))
+        # Partial reviews (some agents failed) are kept but retried on the next run.
+        record["status"] = "ok" if not record["agent_errors"] else "partial"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def print_preflight(protocols: list, doc_processor: DocumentProcessor, llm_model: str):
+    """Prints the chunks and prompt tokens each protocol's review will take, without calling the LLM."""
+    agents = build_review_agents(llm_model)
+    total_chunks = total_tokens = 0
+    for protocol_id, path in protocols:
+        try:
+            text, page_starts = read_protocol(path, doc_processor)
+            _, protocol_server = get_default_protocol_store().open(text, page_starts=page_starts)
+            plan = preflight_review(protocol_server, agents)
+        except Exception as e:
+            print(f"  {protocol_id}: {type(e).__name__}: {e}")
+            continue
+        per_agent = ", ".join(f"{key} {agent['chunks']}" for key, agent in plan["agents"].items())
+        print(f"  {protocol_id}: {plan['chunks']} calls ({per_agent}), {plan['prompt_tokens']:,} prompt tokens")
+        total_chunks += plan["chunks"]
+        total_tokens += plan["prompt_tokens"]
+    print(f"Preflight total: {total_chunks} calls, {total_tokens:,} prompt tokens.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch multi-agent review of clinical protocols.")
+    parser.add_argument("inputs", nargs="*", help="Protocol files or directories (PDF, TXT, MD).")
+    parser.add_argument("--manifest", help="File listing protocols, one path per line or JSON lines.")
+    parser.add_argument("--output", default="review_results.jsonl", help="Resumable JSONL results file.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Protocols reviewed at once.")
+    parser.add_argument("--model", default="gpt-4o", help="LLM model for agents and risk assessment.")
+    parser.add_argument("--bypass-cache", action="store_true", help="Ignore cached LLM responses.")
+    parser.add_argument("--trace-output", help="Append per-stage trace spans to this JSON lines file.")
+    parser.add_argument("--metrics-output", help="Write per-stage totals to this Prometheus text-format file.")
+    parser.add_argument("--reuse-findings", choices=["off", "reuse", "context"], default="off",
+                        help="Review section by section and reuse (or pass as context) the findings of near-identical "
+                             "sections reviewed before.")
+    parser.add_argument("--reuse-threshold", type=float, help="Similarity (0-1) for --reuse-findings; default 0.9.")
+    parser.add_argument("--triage", action="store_true",
+                        help="Screen each section with a cheap model first; only flagged sections get a full review.")
+    parser.add_argument("--triage-model", help="Screening model for --triage; default $TRIAGE_MODEL or gpt-4o-mini.")
+    parser.add_argument("--triage-threshold", type=float,
+                        help="concern_score (0-1) at which --triage escalates a section; default 0.3.")
+    parser.add_argument("--preflight", action="store_true",
+                        help="Only print the chunks and prompt tokens each pending review would take.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    protocols = discover_protocols(args.inputs, args.manifest)
+    if not protocols:
+        parser.error("no protocols found; pass files, directories or --manifest")
+    metadata = read_manifest_metadata(args.manifest)
+    completed = load_completed_ids(args.output)
+    pending = [(protocol_id, path) for protocol_id, path in protocols if protocol_id not in completed]
+    print(f"{len(protocols)} protocols found, {len(protocols) - len(pending)} already done, {len(pending)} to review.")
+
+    doc_processor = DocumentProcessor()
+    if args.preflight:
+        print_preflight(pending, doc_processor, args.model)
+        return 0
+    findings_store = None
+    if args.reuse_findings != "off":
+        # Deferred: only needed (with NumPy) when findings reuse is on.
+        from utils.findings_store import FindingsStore
+        findings_store = FindingsStore(threshold=args.reuse_threshold, mode=args.reuse_findings)
+    triager = None
+    if args.triage:
+        from agents.triage import SectionTriager
+        triager = SectionTriager(args.triage_model, threshold=args.triage_threshold)
+    write_lock = threading.Lock()
+    succeeded = failed = 0
+    start = time.perf_counter()
+    with open(args.output, "a") as out, ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [
+            executor.submit(review_file, protocol_id, path, doc_processor, args.model, args.bypass_cache, findings_store,
+                            metadata.get(protocol_id), triager)
+            for protocol_id, path in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            if record["status"] in ("ok", "partial"):
+                succeeded += 1
+                partial = f", failed agents: {', '.join(record['agent_errors'])}" if record["agent_errors"] else ""
+                score = f"score {record['score']}/100" if record["score"] is not None else "score not computed"
+                print(f"[{done}/{len(pending)}] {record['id']}: {score} "
+                      f"({record['elapsed_seconds']:.1f}s, {record['usage']['total_tokens']:,} tokens{partial})")
+            else:
+                failed += 1
+                print(f"[{done}/{len(pending)}] {record['id']}: FAILED {record['error']}")
+
+    elapsed = time.perf_counter() - start
+    usage = global_usage.as_dict()
+    scheduler_metrics = get_scheduler().metrics()
+    guard_metrics = get_call_guard().metrics()
+    throughput = (succeeded + failed) / (elapsed / 60) if elapsed > 0 else 0.0
+    print(
+        f"\nReviewed {succeeded} protocols ({failed} failed) in {elapsed:.1f}s, {throughput:.2f} protocols/min.\n"
+        f"LLM calls: {usage['calls']} ({usage['cache_hits']} cache hits), tokens: {usage['prompt_tokens']:,} prompt "
+        f"({usage['cached_prompt_tokens']:,} prompt-cached) + {usage['completion_tokens']:,} completion = {usage['total_tokens']:,} total.\n"
+        f"Rate limiting: {scheduler_metrics['rate_limited']} 429s, {scheduler_metrics['retries']} retries, "
+        f"p95 queue wait {scheduler_metrics['wait_p95_seconds']:.1f}s.\n"
+        f"Call latency: p50 {guard_metrics['latency_p50_seconds']:.1f}s, p95 {guard_metrics['latency_p95_seconds']:.1f}s, "
+        f"p99 {guard_metrics['latency_p99_seconds']:.1f}s; {guard_metrics['hedged']} hedged "
+        f"({guard_metrics['hedge_rate']:.1%}), {guard_metrics['deadline_exceeded']} past deadline, "
+        f"{guard_metrics['fallbacks']} fallbacks.\n"
+        f"Results: {args.output}"
+    )
+    if findings_store is not None:
+        reuse = findings_store.stats()
+        print(f"Findings reuse: {reuse['reused']} of {reuse['lookups']} sections ({reuse['reuse_rate']:.0%}), "
+              f"~{reuse['tokens_saved']:,} tokens saved; {reuse['entries']} sections stored.")
+    if triager is not None:
+        triage = triager.stats()
+        print(f"Triage ({triager.llm.model_name}): escalated {triage['escalated']} of {triage['sections']} agent sections "
+              f"({triage['escalation_rate']:.0%}), ~{triage['skipped_tokens']:,} section tokens kept from {args.model}; "
+              f"decisions in {triager.audit_path or 'memory only'}.")
+    if args.trace_output:
+        get_tracer().export_jsonl(args.trace_output)
+        print(f"Trace spans: {args.trace_output}")
+    if args.metrics_output:
+        get_tracer().export_prometheus(args.metrics_output)
+        print(f"Stage metrics: {args.metrics_output}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
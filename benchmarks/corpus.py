@@ -0,0 +1,244 @@
+"""
+Synthetic clinical protocols for benchmarks.
+
+Generates ICH-style protocols of a given page count, with numbered sections and subsections the
+ProtocolServer and the agents' section routing recognise, and writes them as plain text or PDF.
+
+    python -m benchmarks.corpus --output benchmarks/corpus --pages 5 50 200 500
+"""
+import argparse
+import os
+import random
+import textwrap
+
+
+LINES_PER_PAGE = 60
+LINE_WIDTH = 95
+
+# (section title, subsection titles), in the order of an ICH E6 protocol.
+PROTOCOL_OUTLINE = [
+    ("Introduction", ["Background", "Study Rationale", "Benefit and Risk Assessment"]),
+    ("Study Objectives and Endpoints", ["Primary Objective", "Secondary Objectives", "Exploratory Objectives"]),
+    ("Study Design", ["Overall Design", "Justification for Dose", "End of Study Definition"]),
+    ("Study Population", ["Inclusion Criteria", "Exclusion Criteria", "Screen Failures"]),
+    ("Study Treatment", ["Investigational Product", "Dose Modifications", "Concomitant Therapy"]),
+    ("Schedule of Assessments", ["Screening Visit", "Treatment Visits", "Follow-up Visits"]),
+    ("Safety Reporting", ["Adverse Events", "Serious Adverse Events", "Pregnancy Reporting"]),
+    ("Statistical Considerations", ["Sample Size", "Analysis Populations", "Interim Analysis"]),
+    ("Data Management and Quality Control", ["Case Report Forms", "Source Documents", "Monitoring"]),
+    ("Ethical Considerations", ["Informed Consent", "Institutional Review Board", "Confidentiality"]),
+    ("References", ["Literature Cited"]),
+]
+
+# Numbered lists that run past their section's number (section 4), as eligibility criteria usually do.
+# The parser must keep items such as "5. Signed informed consent" out of the section outline.
+NUMBERED_LISTS = {
+    "Inclusion Criteria": [
+        "Age 18 years or older at the time of signing informed consent",
+        "Histologically confirmed advanced or metastatic solid tumor",
+        "Measurable disease per RECIST version 1.1",
+        "ECOG performance status of 0 or 1",
+        "Adequate bone marrow, liver and renal function",
+        "Signed informed consent",
+        "Negative pregnancy test for participants of childbearing potential",
+    ],
+    "Exclusion Criteria": [
+        "Prior treatment with Drug X or another agent of the same class",
+        "Active central nervous system metastases",
+        "Major surgery within 4 weeks before the first dose",
+        "Known hypersensitivity to Drug X or its excipients",
+        "Uncontrolled intercurrent illness",
+        "Pregnant or breastfeeding",
+    ],
+}
+
+# Prose whose line wrap puts a section-like number at the start of a line (section 1, after 1.3).
+# The parser must not read "1.1. An independent ..." as a subsection heading.
+WRAPPED_PROSE = {
+    "Benefit and Risk Assessment": [
+        "Tumor response will be assessed by the investigator according to RECIST version",
+        "1.1. An independent data monitoring committee will review unblinded safety data every six",
+        "months.",
+    ],
+}
+
+SENTENCES = [
+    "Participants will receive Drug X 200 mg orally once daily in continuous 28-day cycles.",
+    "Tumor response will be assessed by the investigator according to RECIST version 1.1.",
+    "Adverse events will be graded according to CTCAE version 5.0 and recorded from the first dose.",
+    "The sponsor will be notified of any serious adverse event within 24 hours of awareness.",
+    "Eligible participants must have an ECOG performance status of 0 or 1 at screening.",
+    "Participants with active central nervous system metastases are excluded from enrollment.",
+    "Hematology and serum chemistry will be collected at screening and on Day 1 of every cycle.",
+    "A dose reduction to 100 mg once daily is permitted for Grade 3 non-hematologic toxicity.",
+    "The primary analysis will be performed on the full analysis set using a two-sided alpha of 0.05.",
+    "Approximately 450 participants will be randomized in a 2:1 ratio to Drug X or placebo.",
+    "An independent data monitoring committee will review unblinded safety data every six months.",
+    "Written informed consent must be obtained before any study-specific procedure is performed.",
+    "Source data verification will be performed for all primary endpoint and safety data.",
+    "Concomitant use of strong CYP3A4 inhibitors is prohibited during the treatment period.",
+    "Visits on Day 15 of Cycles 1 and 2 may be conducted within a window of plus or minus 2 days.",
+    "Pharmacokinetic samples will be drawn predose and 2, 4 and 8 hours after dosing on Day 1.",
+    "Participants who discontinue treatment will be followed for survival every 12 weeks.",
+    "Case report forms will be completed in the electronic data capture system within 5 days of the visit.",
+]
+
+
+def generate_protocol_pages(pages: int, seed: int = 0, title: str = "A Phase III Study of Drug X in Disease Y") -> list[str]:
+    """
+    Returns the text of each page of a synthetic protocol with the given page count.
+    The outline is always complete; longer protocols have more paragraphs per subsection.
+    """
+    rng = random.Random(seed)
+    subsection_count = sum(len(subsections) for _, subsections in PROTOCOL_OUTLINE)
+    # Each paragraph wraps to about 5 lines; the headings take the remaining space.
+    paragraphs_per_subsection = max(1, (pages * LINES_PER_PAGE) // (subsection_count * 6))
+
+    lines = [title, ""]
+    for number, (section, subsections) in enumerate(PROTOCOL_OUTLINE, start=1):
+        lines += [f"{number}. {section}", ""]
+        for sub_number, subsection in enumerate(subsections, start=1):
+            lines += [f"{number}.{sub_number} {subsection}"]
+            if subsection in NUMBERED_LISTS:
+                lines += ["Participants must meet all of the following criteria:"]
+                lines += [f"{item}. {text}" for item, text in enumerate(NUMBERED_LISTS[subsection], start=1)] + [""]
+            if subsection in WRAPPED_PROSE:
+                lines += WRAPPED_PROSE[subsection] + [""]
+            for _ in range(paragraphs_per_subsection):
+                paragraph = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 5)))
+                lines += textwrap.wrap(paragraph, LINE_WIDTH) + [""]
+
+    lines = lines[:pages * LINES_PER_PAGE]
+    lines += [""] * (pages * LINES_PER_PAGE - len(lines))
+    return ["\n".join(lines[i:i + LINES_PER_PAGE]).rstrip() for i in range(0, len(lines), LINES_PER_PAGE)]
+
+
+def generate_protocol_text(pages: int, seed: int = 0) -> str:
+    """Returns a synthetic protocol as one string, pages separated by newlines."""
+    return "\n".join(generate_protocol_pages(pages, seed))
+
+
+def expected_section_titles() -> list:
+    """Section titles ProtocolServer should find in a generated protocol, in order."""
+    titles = ["Preamble"]
+    for number, (section, subsections) in enumerate(PROTOCOL_OUTLINE, start=1):
+        titles.append(f"{number}. {section}")
+        titles += [f"{number}.{sub_number} {subsection}" for sub_number, subsection in enumerate(subsections, start=1)]
+    return titles
+
+
+def check_outline(pages: int, seed: int = 0) -> list:
+    """
+    Parses a generated protocol as text and as extracted PDF text; returns a description of each form
+    whose section outline differs from expected_section_titles() (numbered lists and wrapped prose
+    included), or an empty list.
+    """
+    import io
+    import tempfile
+    from mcp_interface.protocol_server import ProtocolServer
+    from utils.document_processor import DocumentProcessor
+
+    page_texts = generate_protocol_pages(pages, seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        document = DocumentProcessor(cache_dir=cache_dir).extract_pdf_document(io.BytesIO(build_pdf(page_texts)))
+    expected = expected_section_titles()
+    problems = []
+    for form, text in (("text", "\n".join(page_texts)), ("pdf", document.text)):
+        titles = ProtocolServer(text).section_titles()
+        if titles != expected:
+            extra = [title for title in titles if title not in expected]
+            missing = [title for title in expected if title not in titles]
+            problems.append(f"{pages}p {form}: {len(titles)} sections, expected {len(expected)}; "
+                            f"unexpected {extra}, missing {missing}")
+    return problems
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: list[str]) -> bytes:
+    """
+    Builds a minimal single-font PDF with one text page per entry, readable by pypdf.
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # Filled in once the page tree exists.
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page_text in pages:
+        operations = ["BT", "/F1 9 Tf", "12 TL", "40 760 Td"]
+        operations += [f"({_pdf_escape(line)}) Tj T*" for line in page_text.split("\n")]
+        operations.append("ET")
+        stream = "\n".join(operations).encode("latin-1", errors="replace")
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (page_tree, content, font)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref_offset)
+    return bytes(output)
+
+
+def write_corpus(output_dir: str, page_counts: list, seed: int = 0, formats=("pdf", "txt")) -> list:
+    """Writes one protocol per page count and format; returns the written paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for pages in page_counts:
+        page_texts = generate_protocol_pages(pages, seed)
+        if "txt" in formats:
+            path = os.path.join(output_dir, f"protocol_{pages:03d}p.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(page_texts))
+            paths.append(path)
+        if "pdf" in formats:
+            path = os.path.join(output_dir, f"protocol_{pages:03d}p.pdf")
+            with open(path, "wb") as f:
+                f.write(build_pdf(page_texts))
+            paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic clinical protocols for benchmarks.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "corpus"), help="Output directory.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 200, 500], help="Page counts to generate.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["pdf", "txt", "both"], default="both")
+    parser.add_argument("--check", action="store_true",
+                        help="Instead of writing files, check that ProtocolServer parses each size to the expected outline.")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        problems = [problem for pages in args.pages for problem in check_outline(pages, args.seed)]
+        for problem in problems:
+            print(problem)
+        if not problems:
+            print(f"Outline parsed as expected for {', '.join(map(str, args.pages))} pages (text and PDF).")
+        return 1 if problems else 0
+
+    formats = ("pdf", "txt") if args.format == "both" else (args.format,)
+    for path in write_corpus(args.output, args.pages, args.seed, formats):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
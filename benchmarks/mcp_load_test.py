@@ -0,0 +1,164 @@
+"""
+Load test of the MCP protocol server (mcp_interface/mcp_server.py) over streamable HTTP.
+
+Starts the server in a subprocess, then runs --clients concurrent MCP sessions. Every client opens the same
+synthetic protocol and issues --requests reads (sections, section list, search, full text); a fraction of
+them amend a section with expected_version, retrying on version conflicts. Prints throughput, per-tool
+latency percentiles and the server's store counters: one parse however many sessions opened the protocol.
+
+    python -m benchmarks.mcp_load_test --clients 50 --requests 40 --pages 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.corpus import generate_protocol_text
+from benchmarks.run_benchmarks import percentile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"MCP server did not start listening on port {port}")
+
+
+class ToolFailed(Exception):
+    pass
+
+
+async def call(session, latencies: dict, tool: str, arguments: dict) -> dict:
+    start = time.perf_counter()
+    result = await session.call_tool(tool, arguments)
+    latencies.setdefault(tool, []).append(time.perf_counter() - start)
+    if result.isError:
+        raise ToolFailed(result.content[0].text if result.content else tool)
+    return json.loads(result.content[0].text)
+
+
+async def run_client(url: str, protocol_text: str, requests: int, update_rate: float, seed: int,
+                     latencies: dict, counters: dict):
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    rng = random.Random(seed)
+    async with streamablehttp_client(url) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            opened = await call(session, latencies, "open_protocol", {"text": protocol_text})
+            protocol_id, sections = opened["protocol_id"], opened["sections"]
+            # Replacing a section's body drops its subsections, so only leaf sections are amended.
+            leaves = [title for title, following in zip(sections, sections[1:] + [""])
+                      if title != "Preamble" and not following.startswith(title.split()[0].rstrip(".") + ".")]
+            for _ in range(requests):
+                roll = rng.random()
+                if roll < update_rate:
+                    section = rng.choice(leaves)
+                    while True:
+                        version = (await call(session, latencies, "list_sections", {"protocol_id": protocol_id}))["version"]
+                        try:
+                            await call(session, latencies, "update_section",
+                                       {"protocol_id": protocol_id, "section": section,
+                                        "content": f"Amended by client {seed}.", "expected_version": version})
+                            break
+                        except ToolFailed as e:
+                            if "is at version" not in str(e):
+                                raise
+                            counters["conflicts"] += 1
+                elif roll < 0.75:
+                    await call(session, latencies, "read_section",
+                               {"protocol_id": protocol_id, "section": rng.choice(sections)})
+                elif roll < 0.85:
+                    await call(session, latencies, "search_protocol",
+                               {"protocol_id": protocol_id, "query": rng.choice(["adverse event", "inclusion criteria",
+                                                                                  "dose", "informed consent"])})
+                elif roll < 0.95:
+                    await call(session, latencies, "list_sections", {"protocol_id": protocol_id})
+                else:
+                    await call(session, latencies, "get_full_text", {"protocol_id": protocol_id})
+            if seed == 0:
+                counters["store"] = await call(session, latencies, "store_stats", {})
+
+
+async def run_load(url: str, args) -> tuple:
+    protocol_text = generate_protocol_text(args.pages, args.seed)
+    latencies, counters = {}, {"conflicts": 0}
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(url, protocol_text, args.requests, args.update_rate, n,
+                                                latencies, counters)
+                                     for n in range(args.clients)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    failures = [result for result in results if isinstance(result, BaseException)]
+    return elapsed, latencies, counters, failures, protocol_text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent MCP clients against the protocol server.")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent MCP sessions.")
+    parser.add_argument("--requests", type=int, default=40, help="Tool calls per session after open_protocol.")
+    parser.add_argument("--pages", type=int, default=100, help="Synthetic protocol size.")
+    parser.add_argument("--update-rate", type=float, default=0.02, help="Fraction of calls that amend a section.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    server = subprocess.Popen([sys.executable, "-m", "mcp_interface.mcp_server", "--transport", "http",
+                               "--port", str(port)], env=env)
+    try:
+        wait_for_port(port)
+        client_cpu = time.process_time()
+        elapsed, latencies, counters, failures, protocol_text = asyncio.run(run_load(f"http://127.0.0.1:{port}/mcp", args))
+        client_cpu = time.process_time() - client_cpu
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server_cpu = children.ru_utime + children.ru_stime
+
+    calls = sum(len(values) for values in latencies.values())
+    print(f"{args.clients} sessions x {args.requests} calls on a {args.pages}-page protocol "
+          f"({len(protocol_text) / 1e6:.1f} MB): {calls} calls in {elapsed:.2f}s, {calls / elapsed:.0f} calls/s")
+    # Clients and server share the machine; the server's CPU per call bounds its throughput on its own.
+    print(f"  CPU: server {server_cpu:.2f}s ({server_cpu / calls * 1000:.1f}ms/call), clients {client_cpu:.2f}s "
+          f"on {os.cpu_count()} core(s)")
+    for tool, values in sorted(latencies.items()):
+        print(f"  {tool:>16}: {len(values):5d} calls  p50 {percentile(values, 50) * 1000:7.1f}ms  "
+              f"p95 {percentile(values, 95) * 1000:7.1f}ms  p99 {percentile(values, 99) * 1000:7.1f}ms")
+    store = counters.get("store")
+    if store:
+        print(f"  store: {store['parses']} parse(s), {store['hits']} shared opens, {store['updates']} updates "
+              f"({counters['conflicts']} version conflicts retried), {store['versions']} versions held, "
+              f"~{store['bytes'] / 1e6:.1f} MB")
+    # What each session would pay to parse its own copy.
+    from mcp_interface.protocol_server import ProtocolServer
+    start = time.perf_counter()
+    ProtocolServer(protocol_text)
+    parse_seconds = time.perf_counter() - start
+    print(f"  per-session parsing would cost {args.clients} x {parse_seconds * 1000:.1f}ms and "
+          f"{args.clients} copies of the protocol")
+    if failures:
+        print(f"  {len(failures)} session(s) failed: {failures[0]!r}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
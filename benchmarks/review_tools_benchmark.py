@@ -0,0 +1,71 @@
+"""
+Timing check of the review tools (mcp_interface/review_tools.py) on a large synthetic protocol.
+
+Builds the section index once, then times keyword searches and cross-reference resolution, which are
+expected to stay under --max-lookup-ms at p95, and term-consistency checks, which scan every passage
+mentioning the term and are only reported. Exits with code 1 if a lookup misses its budget.
+
+    python -m benchmarks.review_tools_benchmark --pages 1000 --iterations 200
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.corpus import generate_protocol_text
+from benchmarks.run_benchmarks import percentile, time_stage
+
+
+QUERIES = ["adverse event", "inclusion criteria", "dose", "informed consent",
+           "serious adverse event reporting timeline"]
+REFERENCES = ["see Section 7.2", "Sections 4.1 and 4.2", "§ 8.1", "see section 99.9"]
+TERMS = ["Drug X", "dose reduction"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timing check of keyword search, cross-references and consistency checks.")
+    parser.add_argument("--pages", type=int, default=1000, help="Synthetic protocol size.")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per lookup (after one warm-up call).")
+    parser.add_argument("--max-lookup-ms", type=float, default=1.0,
+                        help="p95 budget for searches and cross-reference lookups.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from mcp_interface.protocol_server import ProtocolServer
+    from mcp_interface.review_tools import (check_term_consistency, find_section_by_keyword, get_section_index,
+                                            resolve_cross_references)
+
+    protocol_server = ProtocolServer(generate_protocol_text(args.pages, args.seed))
+    start = time.perf_counter()
+    index = get_section_index(protocol_server)
+    print(f"{args.pages}-page protocol: index of {len(index.passages):,} passages in {len(index.titles)} sections "
+          f"built in {(time.perf_counter() - start) * 1000:.0f}ms (once per protocol version)")
+
+    lookups = [(f"search '{query}'", lambda query=query: find_section_by_keyword(protocol_server, query))
+               for query in QUERIES]
+    lookups += [(f"resolve '{reference}'", lambda reference=reference: resolve_cross_references(protocol_server, reference))
+                for reference in REFERENCES]
+    slow = []
+    for name, fn in lookups:
+        durations, _, errors = time_stage(fn, args.iterations)
+        p50, p95 = percentile(durations, 50) * 1000, percentile(durations, 95) * 1000
+        if p95 > args.max_lookup_ms or errors:
+            slow.append(name)
+        print(f"  {name:>48}: p50 {p50:7.3f}ms  p95 {p95:7.3f}ms" + (f"  {errors} errors" if errors else ""))
+
+    # Proportional to the passages mentioning the term, so not held to the lookup budget.
+    for term in TERMS:
+        durations, result, _ = time_stage(lambda term=term: check_term_consistency(protocol_server, term),
+                                          max(1, args.iterations // 10))
+        print(f"  {f'consistency {term!r}':>48}: p50 {percentile(durations, 50) * 1000:7.3f}ms  "
+              f"p95 {percentile(durations, 95) * 1000:7.3f}ms  ({len(result['mentions']):,} mentions, "
+              f"{'consistent' if result['consistent'] else 'inconsistent'})")
+
+    if slow:
+        print(f"{len(slow)} lookup(s) over the {args.max_lookup_ms}ms p95 budget: {', '.join(slow)}")
+        return 1
+    print(f"All searches and cross-reference lookups within the {args.max_lookup_ms}ms p95 budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
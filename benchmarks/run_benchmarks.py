@@ -0,0 +1,227 @@
+"""
+Offline performance benchmark of the review pipeline.
+
+Starts the stub OpenAI server (benchmarks/stub_server.py), generates synthetic protocols of each page
+count (benchmarks/corpus.py) and times every stage: PDF extraction, ProtocolServer parsing, each agent's
+review, RiskAssessor, ScoringEngine and the end-to-end pipeline. Reports p50/p95 latency, throughput
+and peak Python memory per stage, and writes the results as JSON that can be diffed between releases.
+
+    python -m benchmarks.run_benchmarks --pages 5 50 500 --iterations 5 --output results/v1.2.json
+    python -m benchmarks.run_benchmarks --compare results/v1.2.json    # exit code 1 on regressions
+"""
+from datetime import datetime, timezone
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import build_pdf, generate_protocol_pages
+from benchmarks.stub_server import StubConfig, StubOpenAIServer
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def time_stage(fn, iterations: int, warmup: int = 1) -> tuple:
+    """
+    Calls fn warmup + iterations times. Returns (durations of the timed calls, last result, error count).
+    """
+    durations, result, errors = [], None, 0
+    for i in range(warmup + iterations):
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            errors += 1
+            print(f"  {type(e).__name__}: {e}")
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            durations.append(elapsed)
+    return durations, result, errors
+
+
+def peak_memory(fn) -> int:
+    """
+    Peak bytes allocated by Python code during one call of fn. Allocations in worker processes
+    (parallel PDF extraction) are not included.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+    except Exception:
+        pass
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak
+
+
+def summarize(durations: list, errors: int, peak_bytes: int, units: float, unit: str) -> dict:
+    mean = statistics.mean(durations)
+    return {
+        "iterations": len(durations),
+        "errors": errors,
+        "p50_ms": round(percentile(durations, 50) * 1000, 2),
+        "p95_ms": round(percentile(durations, 95) * 1000, 2),
+        "mean_ms": round(mean * 1000, 2),
+        "throughput": round(units / mean, 3) if mean > 0 else None,
+        "throughput_unit": unit,
+        "peak_memory_kb": round(peak_bytes / 1024, 1) if peak_bytes is not None else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def configure_environment(stub: StubOpenAIServer, cache_dir: str):
+    """
+    Points the app's clients at the stub and isolates the benchmark from the user's cache and rate limits.
+    Must run before the first LLM client, cache or scheduler is created.
+    """
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["LLM_CACHE_PATH"] = os.path.join(cache_dir, "llm_cache.sqlite3")
+    os.environ["OPENAI_RPM_LIMIT"] = "1000000000"
+    os.environ["OPENAI_TPM_LIMIT"] = "1000000000000"
+
+
+def benchmark_protocol(page_count: int, iterations: int, llm_model: str, measure_memory: bool, seed: int) -> dict:
+    """Times every pipeline stage on one synthetic protocol; returns {stage/pages: summary}."""
+    from agents.review_pipeline import build_review_agents, run_review_pipeline
+    from mcp_interface.protocol_server import ProtocolServer
+    from utils.document_processor import DocumentProcessor
+    from utils.llm_registry import get_agent
+    from utils.risk_assessor import RiskAssessor
+    from utils.scoring_engine import ScoringEngine
+
+    pdf_bytes = build_pdf(generate_protocol_pages(page_count, seed))
+    results = {}
+
+    def run(stage: str, fn, units: float = 1, unit: str = "calls/s"):
+        durations, result, errors = time_stage(fn, iterations)
+        peak = peak_memory(fn) if measure_memory else None
+        summary = summarize(durations, errors, peak, units, unit)
+        results[f"{stage}/{page_count}p"] = summary
+        print(f"{stage:>28} {page_count:>4}p  p50 {summary['p50_ms']:>10.2f} ms  p95 {summary['p95_ms']:>10.2f} ms  "
+              f"{summary['throughput']} {unit}" + (f"  peak {summary['peak_memory_kb']:,.0f} KB" if measure_memory else "")
+              + (f"  {errors} errors" if errors else ""))
+        return result
+
+    def extract():
+        # A fresh cache directory per call, so every iteration measures a cold extraction.
+        with tempfile.TemporaryDirectory() as cache_dir:
+            return DocumentProcessor(cache_dir=cache_dir).extract_pdf_document(io.BytesIO(pdf_bytes))
+
+    document = run("document_processor", extract, page_count, "pages/s")
+    protocol_server = run("protocol_server", lambda: ProtocolServer(document.text, page_starts=document.page_starts),
+                          page_count, "pages/s")
+
+    feedback = {}
+    for agent_key, agent in build_review_agents(llm_model).items():
+        feedback[agent_key] = run(f"agent:{agent_key}",
+                                  lambda agent=agent: agent.review_protocol(protocol_server, bypass_cache=True))
+    feedback = {key: value for key, value in feedback.items() if value}
+
+    risk_assessor = get_agent(RiskAssessor, llm_model)
+    risks = run("risk_assessor", lambda: risk_assessor.assess_risks(feedback, bypass_cache=True)) or []
+    run("scoring_engine", lambda: ScoringEngine().score_protocol(risks))
+    run("review_pipeline", lambda: run_review_pipeline(document.text, page_starts=document.page_starts,
+                                                       llm_model=llm_model, bypass_cache=True), 60, "protocols/min")
+    return results
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> list:
+    """Returns (stage, baseline p50, current p50) for stages whose p50 grew by more than tolerance."""
+    regressions = []
+    for stage, summary in current["results"].items():
+        previous = baseline.get("results", {}).get(stage)
+        if previous and previous["p50_ms"] > 0 and summary["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append((stage, previous["p50_ms"], summary["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the protocol review pipeline.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 200, 500], help="Synthetic protocol sizes.")
+    parser.add_argument("--iterations", type=int, default=3, help="Timed runs per stage (after one warm-up run).")
+    parser.add_argument("--model", default="gpt-4o", help="Model name sent to the stub.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Stub seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Stub completion token rate (0 = instant).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail.")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Stub rate for processing uncached prompt tokens (0 = instant).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and error injection.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory runs.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Baseline results file; exit code 1 if any stage's p50 regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before flagging (0.2 = 20%%).")
+    args = parser.parse_args(argv)
+
+    config = StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                        error_rate=args.error_rate, seed=args.seed,
+                        prefill_tokens_per_second=args.prefill_tokens_per_second)
+    with StubOpenAIServer(config) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        configure_environment(stub, cache_dir)
+        print(f"Stub OpenAI API on {stub.base_url}, {args.iterations} iterations per stage.")
+        results = {}
+        for page_count in args.pages:
+            results.update(benchmark_protocol(page_count, args.iterations, args.model, not args.no_memory, args.seed))
+        stub_stats = stub.stats()
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": args.model,
+            "iterations": args.iterations,
+            "pages": args.pages,
+            "seed": args.seed,
+            "stub": config.as_dict(),
+            "stub_requests": stub_stats["requests"],
+            "stub_prompt_tokens": stub_stats["prompt_tokens"],
+            "stub_cached_prompt_tokens": stub_stats["cached_prompt_tokens"],
+        },
+        "results": results,
+    }
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        # Sorted, indented keys keep files from different releases line-diffable.
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.tolerance)
+        for stage, before, after in regressions:
+            print(f"REGRESSION {stage}: p50 {before:.2f} ms -> {after:.2f} ms ({after / before - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"No p50 regressions beyond {args.tolerance:.0%} against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""
+Local stub of the OpenAI chat completions API for offline benchmarks.
+
+Serves POST /v1/chat/completions (plain, streamed and tool-calling responses) with configurable
+latency, token rate, injected slow responses (stragglers), error rate and canned responses, and simulates
+the provider's prompt cache: prompt prefixes seen before are reported as cached_tokens and skip the
+simulated prefill time. Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m benchmarks.stub_server --port 8765 --latency 0.2 --tokens-per-second 50
+"""
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+
+DEFAULT_RESPONSE = (
+    "**Feedback:**\n"
+    "1. The primary endpoint definition lacks a time frame for the response assessment.\n"
+    "2. Inclusion criterion 3 conflicts with the washout period described in the study design.\n"
+    "3. The schedule of assessments does not specify visit windows for safety laboratory tests.\n"
+    "4. Dose modification rules for Grade 3 toxicities are missing.\n"
+    "5. The sample size justification does not state the assumed dropout rate."
+)
+
+DEFAULT_TOOL_ARGUMENTS = {
+    "risks": [
+        {"description": "Primary endpoint lacks a defined assessment time frame.", "severity": "High",
+         "rationale": "Regulators will request clarification before approval.",
+         "recommendation": "Define the response assessment window in the endpoints section."},
+        {"description": "Visit windows for safety laboratory tests are not specified.", "severity": "Medium",
+         "rationale": "Sites will deviate from the schedule of assessments.",
+         "recommendation": "Add visit windows to the schedule of assessments."},
+    ]
+}
+
+# Rough characters-per-token ratio used for the usage block of each response.
+CHARS_PER_TOKEN = 4
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.1, tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, responses: list = None, tool_arguments: dict = None, seed: int = None,
+                 prefill_tokens_per_second: float = 0.0, prompt_cache: bool = True, cache_min_tokens: int = 1024,
+                 cache_block_tokens: int = 128, model_latency: dict = None, tool_arguments_by_name: dict = None,
+                 slow_rate: float = 0.0, slow_latency: float = 5.0, model_error_rate: dict = None):
+        """
+        Args:
+            latency: Seconds before the first token of every response, on top of the prefill time.
+            tokens_per_second: Completion token rate after the first token; 0 returns the whole completion at once.
+            error_rate: Probability (0-1) that a request fails with error_status.
+            error_status: HTTP status of injected failures (500 for server errors, 429 for rate limits).
+            responses: Canned completion texts, served round-robin. Defaults to a generic reviewer answer.
+            tool_arguments: Arguments returned for tool-calling (structured output) requests.
+            seed: Seed for error and straggler injection, so runs are reproducible.
+            prefill_tokens_per_second: Rate at which uncached prompt tokens are processed before the first
+                                       token; 0 disables prefill time.
+            prompt_cache: Simulate the provider's prompt cache (OpenAI-style: prompts of at least
+                          cache_min_tokens, prefix matched in cache_block_tokens increments).
+            model_latency: Optional {model name prefix: latency} overriding latency per model, e.g. a faster
+                           gpt-4o-mini. The longest matching prefix wins.
+            tool_arguments_by_name: Optional {tool (schema) name: arguments} overriding tool_arguments.
+            slow_rate: Probability (0-1) that a request is a straggler, delayed by slow_latency extra seconds.
+                       Decided per request content, so the same requests meet the same stragglers whatever
+                       order they arrive in; a repeat of a request (e.g. a hedge) gets its own draw.
+            slow_latency: Extra seconds before the first token of a straggler.
+            model_error_rate: Optional {model name prefix: error rate} overriding error_rate per model, e.g. to
+                              take the primary model down while its fallback keeps answering.
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responses = responses or [DEFAULT_RESPONSE]
+        self.tool_arguments = tool_arguments or DEFAULT_TOOL_ARGUMENTS
+        self.seed = seed
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.prompt_cache = prompt_cache
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_block_tokens = cache_block_tokens
+        self.model_latency = dict(model_latency or {})
+        self.tool_arguments_by_name = dict(tool_arguments_by_name or {})
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.model_error_rate = dict(model_error_rate or {})
+
+    @staticmethod
+    def _for_model(values: dict, model: str, default: float) -> float:
+        matches = [name for name in values if (model or "").startswith(name)]
+        return values[max(matches, key=len)] if matches else default
+
+    def latency_for(self, model: str) -> float:
+        return self._for_model(self.model_latency, model, self.latency)
+
+    def error_rate_for(self, model: str) -> float:
+        return self._for_model(self.model_error_rate, model, self.error_rate)
+
+    def as_dict(self) -> dict:
+        return {
+            "latency": self.latency,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+            "slow_rate": self.slow_rate,
+            "slow_latency": self.slow_latency,
+            "prefill_tokens_per_second": self.prefill_tokens_per_second,
+            "prompt_cache": self.prompt_cache,
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        try:
+            self.server.stub.handle(self, request)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (deadline or losing hedge) before the response was sent.
+            self.close_connection = True
+
+
+class StubOpenAIServer:
+    def __init__(self, config: StubConfig = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        OpenAI-compatible chat completions stub running on a background thread.
+        Port 0 picks a free port; see base_url once started.
+        """
+        self.config = config or StubConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._response_index = 0
+        self.requests = 0
+        self.errors = 0
+        self.slow_responses = 0
+        self._request_repeats = Counter()
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self._seen_prompts = deque(maxlen=64)
+        self._httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def serve_forever(self):
+        """Serves on the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "slow_responses": self.slow_responses,
+                    "prompt_chars": self.prompt_chars,
+                    "prompt_tokens": self.prompt_tokens, "cached_prompt_tokens": self.cached_prompt_tokens}
+
+    def _next_response(self) -> str:
+        with self._lock:
+            text = self.config.responses[self._response_index % len(self.config.responses)]
+            self._response_index += 1
+            return text
+
+    def _should_fail(self, model: str) -> bool:
+        error_rate = self.config.error_rate_for(model)
+        with self._lock:
+            return error_rate > 0 and self._random.random() < error_rate
+
+    def reset_stragglers(self):
+        """Forgets the requests seen so far, so replaying them meets the same stragglers as the first time."""
+        with self._lock:
+            self._request_repeats.clear()
+
+    def _straggler_delay(self, model: str, prompt_text: str) -> float:
+        if self.config.slow_rate <= 0:
+            return 0.0
+        digest = hashlib.sha256(f"{model}\0{prompt_text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            repeat = self._request_repeats[digest]
+            self._request_repeats[digest] += 1
+        if random.Random(f"{self.config.seed}:{digest}:{repeat}").random() >= self.config.slow_rate:
+            return 0.0
+        with self._lock:
+            self.slow_responses += 1
+        return self.config.slow_latency
+
+    @staticmethod
+    def _common_prefix_length(a: str, b: str) -> int:
+        # Binary search on slice equality keeps this fast for protocol-sized prompts.
+        low, high = 0, min(len(a), len(b))
+        while low < high:
+            mid = (low + high + 1) // 2
+            if a[:mid] == b[:mid]:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def _cached_tokens(self, prompt_text: str) -> int:
+        """Prompt tokens a provider-side prompt cache would serve for this prompt."""
+        if not self.config.prompt_cache:
+            return 0
+        with self._lock:
+            seen = list(self._seen_prompts)
+        prefix_chars = max((self._common_prefix_length(prompt_text, other) for other in seen), default=0)
+        tokens = prefix_chars // CHARS_PER_TOKEN
+        if tokens < self.config.cache_min_tokens:
+            return 0
+        return tokens - tokens % self.config.cache_block_tokens
+
+    def handle(self, handler: _StubHandler, request: dict):
+        prompt_text = "\n".join(message.get("content") or "" for message in request.get("messages", []))
+        prompt_tokens = max(1, len(prompt_text) // CHARS_PER_TOKEN)
+        cached_tokens = self._cached_tokens(prompt_text)
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += len(prompt_text)
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_tokens
+        prefill = 0.0
+        if self.config.prefill_tokens_per_second > 0:
+            prefill = (prompt_tokens - cached_tokens) / self.config.prefill_tokens_per_second
+        model = request.get("model", "gpt-4o")
+        time.sleep(self.config.latency_for(model) + prefill + self._straggler_delay(model, prompt_text))
+        # Like the real cache, a prompt is only reusable once its prefill has finished.
+        with self._lock:
+            self._seen_prompts.append(prompt_text)
+        if self._should_fail(model):
+            with self._lock:
+                self.errors += 1
+            handler._send_json(self.config.error_status, {
+                "error": {"message": "Injected failure from the benchmark stub.", "type": "server_error"}
+            })
+            return
+
+        if request.get("tools"):
+            self._send_tool_call(handler, request, model, prompt_tokens, cached_tokens)
+        elif request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            self._send_stream(handler, model, self._next_response(), prompt_tokens, cached_tokens, include_usage)
+        else:
+            self._send_completion(handler, model, self._next_response(), prompt_tokens, cached_tokens)
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> dict:
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+    def _generation_delay(self, text: str) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0.0
+        return (len(text) / CHARS_PER_TOKEN) / self.config.tokens_per_second
+
+    def _send_completion(self, handler, model: str, text: str, prompt_tokens: int, cached_tokens: int):
+        time.sleep(self._generation_delay(text))
+        completion_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        handler._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": self._usage(prompt_tokens, completion_tokens, cached_tokens),
+        })
+
+    def _send_tool_call(self, handler, request: dict, model: str, prompt_tokens: int, cached_tokens: int):
+        tool_choice = request.get("tool_choice")
+        if isinstance(tool_choice, dict):
+            name = tool_choice["function"]["name"]
+        else:
+            name = request["tools"][0]["function"]["name"]
+        arguments = json.dumps(self.config.tool_arguments_by_name.get(name, self.config.tool_arguments))
+        time.sleep(self._generation_delay(arguments))
+        completion_tokens = max(1, len(arguments) // CHARS_PER_TOKEN)
+        handler._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                                    "function": {"name": name, "arguments": arguments}}],
+                },
+                "finish_reason": "tool_calls",
+            }],
+            "usage": self._usage(prompt_tokens, completion_tokens, cached_tokens),
+        })
+
+    def _send_stream(self, handler, model: str, text: str, prompt_tokens: int, cached_tokens: int,
+                     include_usage: bool):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = text.split(" ")
+        per_word = self._generation_delay(text) / len(words)
+
+        def send(delta, finish_reason=None, usage=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage is not None:
+                chunk["choices"] = []
+                chunk["usage"] = usage
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            time.sleep(per_word)
+            send({"content": word if i == 0 else " " + word})
+        send({}, finish_reason="stop")
+        if include_usage:
+            send(None, usage=self._usage(prompt_tokens, max(1, len(text) // CHARS_PER_TOKEN), cached_tokens))
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Completion token rate (0 = instant).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures.")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests answered slowly.")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Extra seconds before a slow response.")
+    parser.add_argument("--response-file", action="append", help="File with a canned completion; repeat to rotate.")
+    parser.add_argument("--seed", type=int, help="Seed for error injection.")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Uncached prompt tokens processed per second before the first token (0 = instant).")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="Disable the simulated prompt cache.")
+    args = parser.parse_args(argv)
+
+    responses = None
+    if args.response_file:
+        responses = []
+        for path in args.response_file:
+            with open(path, "r", encoding="utf-8") as f:
+                responses.append(f.read())
+    config = StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                        error_status=args.error_status, responses=responses, seed=args.seed,
+                        prefill_tokens_per_second=args.prefill_tokens_per_second, prompt_cache=not args.no_prompt_cache,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    server = StubOpenAIServer(config, host=args.host, port=args.port)
+    print(f"Stub OpenAI API listening on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
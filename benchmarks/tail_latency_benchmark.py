@@ -0,0 +1,126 @@
+"""
+Offline check of the tail-latency controls (utils/llm_resilience.py) against the stub OpenAI server.
+
+Three scenarios, one process:
+- stragglers: the stub answers --slow-rate of requests --slow-latency seconds late. Reviews run with hedging
+  off, then on; prints review latency percentiles and the hedge rate. Stragglers are chosen per request
+  content and the stub is reset before each run, so both runs meet the same stragglers; only the hedges
+  themselves get fresh draws.
+- outage: the primary model fails every request. With a fallback model configured, the first review pays
+  for the retries that open the circuit; later reviews go straight to the fallback.
+- deadlines: every request is a straggler and hedging is off; reviews end at the agent deadline with the
+  agents reported as failed instead of waiting for the slow answers.
+
+    python -m benchmarks.tail_latency_benchmark --reviews 40 --slow-rate 0.02 --slow-latency 3
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import generate_protocol_text
+from benchmarks.run_benchmarks import configure_environment, percentile
+from benchmarks.stub_server import StubConfig, StubOpenAIServer
+
+
+def run_reviews(protocols: list, concurrency: int) -> list:
+    """Reviews each protocol (cache bypassed); returns (seconds, agent_errors) per review."""
+    from agents.review_pipeline import run_review_pipeline
+
+    def review(protocol_text):
+        start = time.perf_counter()
+        try:
+            errors = run_review_pipeline(protocol_text, bypass_cache=True)["agent_errors"]
+        except Exception as e:
+            errors = {"pipeline": f"{type(e).__name__}: {e}"}
+        return time.perf_counter() - start, errors
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(review, protocols))
+
+
+def latency_line(name: str, runs: list) -> str:
+    seconds = [elapsed for elapsed, _ in runs]
+    failed = sum(1 for _, errors in runs if errors)
+    return (f"  {name:>16}: p50 {percentile(seconds, 50):5.2f}s  p95 {percentile(seconds, 95):5.2f}s  "
+            f"p99 {percentile(seconds, 99):5.2f}s  max {max(seconds):5.2f}s  ({failed} of {len(runs)} with errors)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deadlines, hedging and circuit breaking on the stub OpenAI API.")
+    parser.add_argument("--reviews", type=int, default=40, help="Reviews per measured run.")
+    parser.add_argument("--pages", type=int, default=3, help="Synthetic protocol size.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Reviews run at once.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds before the first token.")
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="Fraction of stub responses that are stragglers.")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="Extra seconds before a straggler answers.")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.5, help="Lower bound on the hedge delay.")
+    parser.add_argument("--fallback-model", default="gpt-4o-mini", help="Fallback for gpt-4o in the outage scenario.")
+    parser.add_argument("--agent-deadline", type=float, default=1.0, help="Agent deadline in the deadline scenario.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and the stub's stragglers.")
+    args = parser.parse_args(argv)
+
+    config = StubConfig(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency, seed=args.seed)
+    with StubOpenAIServer(config) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        configure_environment(stub, cache_dir)
+        from utils.llm_resilience import STAGE_DEADLINES, get_call_guard
+        from utils.rate_limiter import get_scheduler
+
+        guard = get_call_guard()
+        guard.hedge_min_delay = args.hedge_min_delay
+        protocols = [generate_protocol_text(args.pages, args.seed + n) for n in range(args.reviews)]
+
+        print(f"Stragglers: {args.slow_rate:.0%} of responses {args.slow_latency}s late, "
+              f"{args.reviews} reviews of {args.pages} pages, {args.concurrency} at once:")
+        guard.hedging = False
+        # Fills the latency windows the hedge delay is computed from, with stragglers drawn independently of
+        # the measured runs so the same slow requests don't make up the window's tail.
+        stub.config.seed = args.seed + 1
+        run_reviews(protocols[:guard.hedge_min_samples], args.concurrency)
+        stub.config.seed = args.seed
+        stub.reset_stragglers()
+        stragglers = stub.stats()["slow_responses"]
+        unhedged = run_reviews(protocols, args.concurrency)
+        unhedged_stragglers = stub.stats()["slow_responses"] - stragglers
+        print(latency_line("hedging off", unhedged) + f"  {unhedged_stragglers} stragglers")
+        guard.hedging = True
+        stub.reset_stragglers()
+        before, stragglers = guard.metrics(), stub.stats()["slow_responses"]
+        hedged = run_reviews(protocols, args.concurrency)
+        after = guard.metrics()
+        calls = after["calls"] - before["calls"]
+        print(latency_line("hedging on", hedged) + f"  {stub.stats()['slow_responses'] - stragglers} stragglers")
+        print(f"  hedged {after['hedged'] - before['hedged']} of {calls} calls "
+              f"({(after['hedged'] - before['hedged']) / max(1, calls):.1%}), "
+              f"{after['hedge_wins'] - before['hedge_wins']} answered by the hedge")
+
+        print(f"\nOutage: gpt-4o fails every request, fallback {args.fallback_model}:")
+        stub.config.slow_rate = 0.0
+        stub.config.model_error_rate = {"gpt-4o": 1.0, args.fallback_model: 0.0}
+        guard.fallback_models["gpt-4o"] = args.fallback_model
+        scheduler = get_scheduler()
+        scheduler.max_retries, scheduler.base_delay = 2, 0.2
+        outage = [run_reviews([protocol], 1)[0] for protocol in protocols[:5]]
+        for n, (elapsed, errors) in enumerate(outage, start=1):
+            print(f"  review {n}: {elapsed:5.2f}s{'  errors: ' + ', '.join(errors) if errors else ''}")
+        primary, fallback = guard.metrics()["models"]["gpt-4o"], guard.metrics()["models"][args.fallback_model]
+        print(f"  gpt-4o circuit {primary['circuit']} (opened {primary['circuit_opened']}x), "
+              f"{primary['fallbacks']} calls sent to {args.fallback_model} ({fallback['calls']} answered)")
+
+        print(f"\nDeadlines: every response {args.slow_latency}s late, agent deadline {args.agent_deadline}s, hedging off:")
+        stub.config.model_error_rate = {}
+        stub.config.slow_rate = 1.0
+        guard.fallback_models.clear()
+        guard.breaker("gpt-4o").record_success()
+        guard.hedging = False
+        STAGE_DEADLINES["agent"] = args.agent_deadline
+        before = guard.metrics()["deadline_exceeded"]
+        deadline_runs = run_reviews(protocols[:args.concurrency], args.concurrency)
+        print(latency_line("agent deadline", deadline_runs))
+        print(f"  {guard.metrics()['deadline_exceeded'] - before} calls ended at the deadline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
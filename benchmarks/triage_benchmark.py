@@ -0,0 +1,92 @@
+"""
+Offline comparison of the full review against the two-tier triage review.
+
+Runs the review pipeline on a synthetic protocol three ways against the stub OpenAI server: every
+agent on gpt-4o, with triage at the given threshold, and a calibration run with threshold 0 whose
+triage scores and full per-section reviews give the recall of the threshold. Prints wall time and
+estimated cost (utils/tracing.py prices) of each.
+
+The stub answers every screening call with the same --triage-score, so the default models a clean
+protocol (every section cleared); raise it above --threshold to model one where everything escalates.
+
+    python -m benchmarks.triage_benchmark --pages 50 --latency 2.0 --triage-latency 0.4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import generate_protocol_text
+from benchmarks.run_benchmarks import configure_environment
+from benchmarks.stub_server import StubConfig, StubOpenAIServer
+
+CLEAN_REVIEW = "**1. Overall Assessment:**\nNo major concerns for this section."
+
+
+def run_pipeline(protocol_text: str, llm_model: str, triage=None) -> dict:
+    """Runs one bypass-cache review; returns its wall time, estimated cost and LLM calls."""
+    from agents.review_pipeline import run_review_pipeline
+    from utils.tracing import get_tracer
+
+    tracer = get_tracer()
+    tracer.clear()
+    start = time.perf_counter()
+    result = run_review_pipeline(protocol_text, llm_model=llm_model, bypass_cache=True, triage=triage)
+    elapsed = time.perf_counter() - start
+    totals = tracer.summary().values()
+    return {
+        "seconds": elapsed,
+        "cost_usd": sum(stage["cost_usd"] for stage in totals),
+        "calls": sum(stage["calls"] for stage in totals),
+        "score": result["score"],
+        "triage": result["triage"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full versus triage review on the stub OpenAI API.")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic protocol size.")
+    parser.add_argument("--model", default="gpt-4o", help="Reviewer model.")
+    parser.add_argument("--triage-model", default="gpt-4o-mini", help="Screening model.")
+    parser.add_argument("--latency", type=float, default=2.0, help="Stub seconds before the first token for the reviewer model.")
+    parser.add_argument("--triage-latency", type=float, default=0.4, help="Stub latency for the screening model.")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Stub rate for processing uncached prompt tokens (0 = instant).")
+    parser.add_argument("--triage-score", type=float, default=0.05, help="concern_score the stub returns for every section.")
+    parser.add_argument("--threshold", type=float, default=0.3, help="Triage escalation threshold.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus.")
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        latency=args.latency, prefill_tokens_per_second=args.prefill_tokens_per_second,
+        model_latency={args.triage_model: args.triage_latency}, responses=[CLEAN_REVIEW],
+        tool_arguments_by_name={"SectionTriage": {"concern_score": args.triage_score, "concerns": []}},
+    )
+    with StubOpenAIServer(config) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        configure_environment(stub, cache_dir)
+        from agents.triage import SectionTriager, triage_recall
+
+        protocol_text = generate_protocol_text(args.pages, args.seed)
+        audit_path = os.path.join(cache_dir, "triage_audit.jsonl")
+        full = run_pipeline(protocol_text, args.model)
+        triaged = run_pipeline(protocol_text, args.model, SectionTriager(
+            args.triage_model, threshold=args.threshold, audit_path=audit_path))
+        calibration_triager = SectionTriager(args.triage_model, threshold=0.0, audit_path="")
+        run_pipeline(protocol_text, args.model, calibration_triager)
+        recall = triage_recall(calibration_triager.decisions, threshold=args.threshold)
+
+    print(f"{args.pages}-page protocol, reviewer {args.model}, triage {args.triage_model} at threshold {args.threshold}:")
+    for name, run in (("full review", full), ("triage review", triaged)):
+        print(f"  {name:>14}: {run['seconds']:6.2f}s  ${run['cost_usd']:.4f}  {run['calls']} LLM calls")
+    print(f"  full/triage ratio: {full['seconds'] / triaged['seconds']:.1f}x wall time"
+          + (f", {full['cost_usd'] / triaged['cost_usd']:.1f}x cost" if triaged["cost_usd"] else ""))
+    print(f"  escalated {triaged['triage']['escalated']} of {triaged['triage']['sections']} agent sections, "
+          f"~{triaged['triage']['skipped_tokens']:,} section tokens kept from {args.model}")
+    print(f"  recall against full per-section reviews: {recall['caught']}/{recall['flagged']} flagged sections "
+          f"({recall['recall']:.0%}), escalation rate {recall['escalation_rate']:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
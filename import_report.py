@@ -0,0 +1,83 @@
+"""
+Import-time report: shows where process startup time goes.
+
+Imports each target module in a fresh interpreter with `python -X importtime` and prints the total
+import time and the most expensive top-level packages. By default it measures the Streamlit app's
+startup imports next to the modules it defers until a feature is used.
+
+    python import_report.py
+    python import_report.py streamlit_app agents.review_pipeline --top 15
+    python import_report.py streamlit_app --budget 1.0    # exit code 1 if startup imports exceed 1s
+"""
+from collections import defaultdict
+import argparse
+import os
+import subprocess
+import sys
+
+
+DEFAULT_TARGETS = [
+    "streamlit_app",               # What every cold start pays before the first page paint.
+    "agents.protocol_generator",   # Deferred until a draft is generated.
+    "agents.review_pipeline",      # Deferred until a review starts (agents, LangChain, OpenAI client).
+    "utils.risk_assessor",         # Deferred until a review starts.
+    "utils.document_processor",    # pypdf itself is deferred until a PDF is read.
+    "pypdf",
+]
+
+
+def measure_imports(module: str) -> list:
+    """
+    Imports module in a fresh interpreter and returns its -X importtime records as
+    (self_us, cumulative_us, depth, name) tuples, in the order the interpreter reported them.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+        print(f"Warning: importing {module} failed: {error}")
+    return records
+
+
+def summarize(module: str, records: list, top: int) -> float:
+    """Prints the report for one module and returns its total import time in seconds."""
+    total = next((cumulative for _, cumulative, _, name in records if name == module), 0)
+    if not total:
+        total = sum(self_us for self_us, _, _, _ in records)
+    by_package = defaultdict(int)
+    for self_us, _, _, name in records:
+        by_package[name.split(".")[0]] += self_us
+    print(f"\n{module}: {total / 1e6:.3f}s total import time, {len(records)} modules")
+    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {self_us / 1e6:8.3f}s  {100 * self_us / total if total else 0:5.1f}%  {package}")
+    return total / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report where import time goes at startup.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS, help="Modules to import (default: app and deferred modules).")
+    parser.add_argument("--top", type=int, default=10, help="Packages listed per module.")
+    parser.add_argument("--budget", type=float, help="Fail if the first module takes longer than this many seconds.")
+    args = parser.parse_args(argv)
+
+    totals = {module: summarize(module, measure_imports(module), args.top) for module in args.modules}
+    if args.budget is not None:
+        first = args.modules[0]
+        if totals[first] > args.budget:
+            print(f"\n{first} imports in {totals[first]:.3f}s, over the {args.budget:.3f}s budget.")
+            return 1
+        print(f"\n{first} imports in {totals[first]:.3f}s, within the {args.budget:.3f}s budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
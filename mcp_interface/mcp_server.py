@@ -0,0 +1,189 @@
+"""
+MCP server exposing parsed protocols to any number of concurrent agent sessions.
+
+Every session reads from the process-wide ProtocolStore, so a protocol opened by one client is parsed once
+and served to all others from the same snapshot. Updates create a new protocol version; clients pass the
+version they read as expected_version to detect concurrent edits.
+
+    python -m mcp_interface.mcp_server                                  # stdio, for a local agent
+    python -m mcp_interface.mcp_server --transport http --port 8765     # streamable HTTP at /mcp
+    python -m mcp_interface.mcp_server --transport http --preload protocols/*.pdf
+
+Tools: open_protocol, list_sections, read_section, get_full_text, search_protocol, resolve_references,
+check_consistency, update_section, store_stats.
+Resources: protocol://{protocol_id}/full, protocol://{protocol_id}/sections and
+protocol://{protocol_id}/sections/{section} (URL-encoded section title or number).
+"""
+from contextlib import asynccontextmanager, redirect_stdout
+from functools import partial
+from urllib.parse import unquote
+import argparse
+import json
+import sys
+
+import anyio
+from mcp.server.fastmcp import FastMCP
+
+from .protocol_store import get_default_protocol_store
+from .review_tools import check_term_consistency, find_section_by_keyword, resolve_cross_references
+
+
+def _protocol_summary(protocol_id: str, protocol_server) -> dict:
+    return {"protocol_id": protocol_id, "version": protocol_server.version,
+            "sections": protocol_server.section_titles()}
+
+
+def _resolve_section(protocol_server, section: str) -> str:
+    title = protocol_server.find_section_title(section)
+    if title is None:
+        raise ValueError(f"Section '{section}' not found; list_sections returns the parsed titles")
+    return title
+
+
+def read_protocol_file(path: str):
+    """Returns (text, page_starts) for a .pdf or text protocol file."""
+    from utils.document_processor import DocumentProcessor
+    doc_processor = DocumentProcessor()
+    if path.lower().endswith(".pdf"):
+        with open(path, "rb") as f:
+            document = doc_processor.extract_pdf_document(f)
+        return document.text, document.page_starts
+    with open(path, "r", encoding="utf-8") as f:
+        return doc_processor.process_text_file(f), None
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8765, stdio: bool = False, log_level: str = "WARNING") -> FastMCP:
+    """
+    Builds the FastMCP server. Tool handlers are async and return JSON text; parsing, index builds and updates run on worker
+    threads so one large protocol doesn't stall the other sessions.
+    Args:
+        host, port: Bind address for the HTTP transport.
+        stdio: Set when serving over stdio, where stdout carries JSON-RPC and print() output is sent to stderr.
+        log_level: Server log level; INFO logs every request.
+    """
+    store = get_default_protocol_store()
+
+    @asynccontextmanager
+    async def lifespan(server):
+        # The stdio transport already holds its own handle on stdout.
+        if stdio:
+            with redirect_stdout(sys.stderr):
+                yield
+        else:
+            yield
+
+    server = FastMCP("clinical-protocol-review", host=host, port=port, lifespan=lifespan, log_level=log_level, json_response=True,
+                     instructions="Open a protocol once with open_protocol, then read it by protocol_id. "
+                                  "Sections resolve by exact title, number ('7.2') or loose title.")
+    # Results are returned once, as JSON text. Structured output would also send them as structuredContent
+    # and validate every result against its schema, which costs more CPU than the read itself.
+    tool = partial(server.tool, structured_output=False)
+
+    @tool()
+    async def open_protocol(text: str, page_starts: list[int] | None = None) -> dict:
+        """Loads a protocol text (parsed once, shared by all sessions); returns its protocol_id, version and sections."""
+        protocol_id, protocol_server = await anyio.to_thread.run_sync(store.open, text, page_starts)
+        return _protocol_summary(protocol_id, protocol_server)
+
+    @tool()
+    async def list_sections(protocol_id: str, version: int | None = None) -> dict:
+        """Lists the section titles of a protocol version (default: latest)."""
+        return _protocol_summary(protocol_id, store.get(protocol_id, version))
+
+    @tool()
+    async def read_section(protocol_id: str, section: str, version: int | None = None) -> dict:
+        """Returns one section's text (including subsections), its content hash and source pages."""
+        protocol_server = store.get(protocol_id, version)
+        title = _resolve_section(protocol_server, section)
+        return {"protocol_id": protocol_id, "version": protocol_server.version, "section": title,
+                "text": protocol_server.get_section(title), "hash": protocol_server.section_hash(title),
+                "pages": protocol_server.get_section_pages(title)}
+
+    @tool()
+    async def get_full_text(protocol_id: str, version: int | None = None) -> dict:
+        """Returns the full protocol text of a version (default: latest)."""
+        protocol_server = store.get(protocol_id, version)
+        return {"protocol_id": protocol_id, "version": protocol_server.version,
+                "text": protocol_server.get_all_content()}
+
+    @tool()
+    async def search_protocol(protocol_id: str, query: str, limit: int = 5,
+                              version: int | None = None) -> list:
+        """Keyword search (BM25) over the protocol's passages; returns excerpts with their sections."""
+        protocol_server = store.get(protocol_id, version)
+        return await anyio.to_thread.run_sync(find_section_by_keyword, protocol_server, query, limit)
+
+    @tool()
+    async def resolve_references(protocol_id: str, text: str | None = None, version: int | None = None) -> list:
+        """
+        Resolves cross-references such as "see Section 7.2" in a text (default: the whole protocol) to parsed
+        sections; dangling references have a null section.
+        """
+        protocol_server = store.get(protocol_id, version)
+        return await anyio.to_thread.run_sync(resolve_cross_references, protocol_server, text)
+
+    @tool()
+    async def check_consistency(protocol_id: str, term: str, version: int | None = None) -> dict:
+        """Lists the doses/quantities stated next to a term (e.g. a drug name) in each section and whether they agree."""
+        protocol_server = store.get(protocol_id, version)
+        return await anyio.to_thread.run_sync(check_term_consistency, protocol_server, term)
+
+    @tool()
+    async def update_section(protocol_id: str, section: str, content: str,
+                             expected_version: int | None = None) -> dict:
+        """
+        Replaces a section's body, creating a new protocol version. Pass the version you read as
+        expected_version to fail instead of overwriting a concurrent edit.
+        """
+        updated = await anyio.to_thread.run_sync(store.update_section, protocol_id, section, content,
+                                                 expected_version)
+        return _protocol_summary(protocol_id, updated)
+
+    @tool()
+    async def store_stats() -> dict:
+        """Protocols held by the shared store, estimated memory, and parse/hit/update/eviction counters."""
+        return store.stats()
+
+    @server.resource("protocol://{protocol_id}/full", mime_type="text/plain")
+    def protocol_text(protocol_id: str) -> str:
+        """Full text of the latest protocol version."""
+        return store.get(protocol_id).get_all_content()
+
+    @server.resource("protocol://{protocol_id}/sections", mime_type="application/json")
+    def protocol_sections(protocol_id: str) -> str:
+        """Section titles of the latest protocol version."""
+        return json.dumps(_protocol_summary(protocol_id, store.get(protocol_id)))
+
+    @server.resource("protocol://{protocol_id}/sections/{section}", mime_type="text/plain")
+    def protocol_section(protocol_id: str, section: str) -> str:
+        """Text of one section of the latest protocol version."""
+        protocol_server = store.get(protocol_id)
+        return protocol_server.get_section(_resolve_section(protocol_server, unquote(section)))
+
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve parsed clinical protocols over MCP.")
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio",
+                        help="stdio for a single local client, http for concurrent clients (streamable HTTP at /mcp).")
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address.")
+    parser.add_argument("--port", type=int, default=8765, help="HTTP port.")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--preload", nargs="*", default=[], metavar="PATH",
+                        help="Protocol files (.pdf or text) to parse at startup.")
+    args = parser.parse_args(argv)
+
+    store = get_default_protocol_store()
+    for path in args.preload:
+        protocol_id, protocol_server = store.open(*read_protocol_file(path))
+        print(f"Loaded {path} as {protocol_id} ({len(protocol_server.section_titles())} sections).", file=sys.stderr)
+
+    server = create_server(args.host, args.port, stdio=args.transport == "stdio",
+                           log_level=args.log_level)
+    server.run("stdio" if args.transport == "stdio" else "streamable-http")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,77 +1,420 @@
-import json
+from bisect import bisect_right
+from collections.abc import Mapping
+import hashlib
+import re
+from utils.tracing import trace_stage
+
+
+# One pass over the buffer finds every candidate heading line: markdown ("## 4.1 Inclusion Criteria"),
+# bold ("**1. Introduction**", as emitted by ProtocolGenerator) and plain numbered ("7.2 SAE Reporting").
+# The lookahead keeps ordinary prose lines from being tried against the full pattern.
+_HEADING_RE = re.compile(
+    r'^(?=[ \t]*(?:#|\*\*[ \t]*\d|\d))[ \t]*'
+    r'(?:(?P<hashes>#{1,6})[ \t]+)?'
+    r'(?P<bold>\*\*)?[ \t]*'
+    r'(?:(?P<number>\d{1,3}(?:\.\d{1,3}){0,4})\.?[ \t]+)?'
+    r'(?P<title>[A-Za-z][^\n]{0,150}?)'
+    r'[ \t:*]*$',
+    re.MULTILINE
+)
+# A numbered list item such as "5. Signed informed consent" or "2) ECOG 0 or 1".
+_LIST_ITEM_RE = re.compile(r'[ \t]*(?P<number>\d{1,3})[.)][ \t]+\S')
+PREAMBLE_TITLE = "Preamble"
+
+
+def _section_key(number: str, title: str) -> str:
+    if not number:
+        return title
+    # Top-level headings keep the "4. Study Population" form; subsections read "4.1 Inclusion Criteria".
+    return f"{number}. {title}" if "." not in number else f"{number} {title}"
+
+
+class SectionEntry:
+    """
+    A heading in the protocol, stored as offsets into the shared protocol buffer.
+    """
+    __slots__ = ("key", "number", "title", "level", "heading_start", "start", "end")
+
+    def __init__(self, number: str, title: str, level: int, heading_start: int, start: int):
+        self.key = _section_key(number, title)
+        self.number = number
+        self.title = title
+        self.level = level
+        self.heading_start = heading_start
+        # Body runs from start to end, and includes any subsections.
+        self.start = start
+        self.end = start
+
+
+class _SectionsView(Mapping):
+    """
+    Read-only {section title: text} view that slices the protocol buffer on access.
+    """
+    def __init__(self, server):
+        self._server = server
+
+    def __getitem__(self, key):
+        entry = self._server._entries_by_key.get(key)
+        if entry is None:
+            if key == PREAMBLE_TITLE and self._server._preamble_end:
+                return self._server._buffer[:self._server._preamble_end].strip()
+            raise KeyError(key)
+        return self._server._buffer[entry.start:entry.end].strip()
+
+    def __iter__(self):
+        return iter(self._server.section_titles())
+
+    def __len__(self):
+        return len(self._server.section_titles())
 
 
 class ProtocolServer:
-    def __init__(self, protocol_content: str):
-        self.protocol_content = protocol_content
-        # In a real MCP, this would parse and structure the protocol
-        # For now, we'll simulate basic access to sections.
-        self.structured_protocol = self._parse_protocol(protocol_content)
+    def __init__(self, protocol_content: str, page_starts: list = None):
+        """
+        Args:
+            protocol_content: Full protocol text.
+            page_starts: Optional offsets where each source page begins (see DocumentProcessor),
+                         used to map sections back to PDF pages.
+        """
+        self._buffer = protocol_content
+        self.page_starts = page_starts
+        # Bumped on every update_section; section_versions tracks edits per section title.
+        self.version = 1
+        self.section_versions = {}
+        # Set on snapshots shared through ProtocolStore, which must not change under other sessions.
+        self.read_only = False
+        self._section_hashes = {}
+        # Parsed once into an offset index; sections are served lazily as slices of the buffer.
+        self._entries = []
+        self._preamble_end = 0
+        # Set once any top-level heading is bold or markdown; plain "N." lines are then list items.
+        self._styled_top_level = False
+        with trace_stage("protocol_server.parse", chars=len(protocol_content)) as span:
+            self._build_index()
+            span.attributes["sections"] = len(self._entries)
+
+    @property
+    def protocol_content(self) -> str:
+        return self._buffer
+
+    @property
+    def structured_protocol(self) -> dict:
+        """
+        Structured view of the protocol. Both entries reference the single shared buffer.
+        """
+        return {"full_protocol_text": self._buffer, "sections": _SectionsView(self)}
+
+    def _scan_headings(self, start: int, end: int, last_top: int = None, last_top_title: str = None) -> list:
+        """
+        Tokenizes buffer[start:end] in a single pass and returns the accepted SectionEntry list.
+        Args:
+            last_top: Number of the enclosing top-level section, used to reject numbered list items
+                      (e.g. inclusion criterion "1. Age 18 or older" inside section 4).
+            last_top_title: Title of that section, so a repeated heading is kept as a duplicate.
+        """
+        candidates = []
+        for match in _HEADING_RE.finditer(self._buffer, start, end):
+            number, hashes = match.group("number"), match.group("hashes")
+            if not number and not hashes:
+                continue
+            title = match.group("title").strip().rstrip(":*").strip()
+            if not title or title[-1] in ".,;" or (number and not title[0].isupper()):
+                continue
+            candidates.append((match, number, title))
+        # Bold and markdown headings outrank plain numbered lines.
+        if any((match.group("hashes") or match.group("bold")) and number and "." not in number
+               for match, number, _ in candidates):
+            self._styled_top_level = True
+
+        earlier = [entry for entry in self._entries if entry.heading_start < start]
+        accepted = {entry.heading_start for entry in earlier}
+        # Last accepted child number per parent number, so subsections must count upwards within their parent.
+        last_child = {}
+        for entry in earlier:
+            if entry.number:
+                self._record_child(last_child, entry.number)
+        entries = []
+        for match, number, title in candidates:
+            hashes = match.group("hashes")
+            if number:
+                parts = number.split(".")
+                top = int(parts[0])
+                if len(parts) > 1 and (
+                        last_child.get(number.rpartition(".")[0], 0) >= int(parts[-1])
+                        or (not hashes and not match.group("bold") and self._is_prose(match, title))):
+                    continue
+                if len(parts) == 1:
+                    if not hashes and not match.group("bold") and (
+                            self._styled_top_level or self._in_numbered_list(match, top, accepted)):
+                        continue
+                    if last_top is not None and (top < last_top or (top == last_top and title != last_top_title)):
+                        continue
+                    last_top, last_top_title = top, title
+                elif last_top is not None and top != last_top:
+                    continue
+                level = len(parts)
+            else:
+                level = len(hashes)
+            body_start = match.end()
+            if body_start < len(self._buffer) and self._buffer[body_start] == "\n":
+                body_start += 1
+            accepted.add(match.start())
+            if number:
+                self._record_child(last_child, number)
+            entries.append(SectionEntry(number, title, level, match.start(), body_start))
+        return entries
+
+    @staticmethod
+    def _record_child(last_child: dict, number: str):
+        parent, _, child = number.rpartition(".")
+        last_child[parent] = int(child)
+        # A (repeated) section starts its own subsection count.
+        last_child.pop(number, None)
+
+    def _is_prose(self, match, title: str) -> bool:
+        """
+        True if a plain numbered subsection line reads as wrapped prose, e.g. "RECIST version" wrapped onto
+        "1.1. An independent data monitoring committee will review ... every six": a long title of mostly
+        lowercase words, or one ending in a lowercase word that carries on into a lowercase next line.
+        """
+        words = title.split()
+        lowercase = sum(word[0].islower() for word in words)
+        if len(words) > 8 and lowercase * 2 > len(words):
+            return True
+        below = self._buffer[match.end() + 1:match.end() + 2]
+        return words[-1][0].islower() and below.islower()
+
+    def _in_numbered_list(self, match, number: int, accepted: set) -> bool:
+        """
+        True if a plain "N." line is inside a run of consecutive numbered lines: the line right above is item
+        N-1 (and not a heading), or the line right below is item N+1. Blank lines can't be required around
+        headings, since PDF text has none; a blank line after a list does end the run, so the heading that
+        follows a list ending in item N-1 is kept.
+        """
+        buffer = self._buffer
+        line_start = match.start()
+        if line_start > 0:
+            above_start = buffer.rfind("\n", 0, line_start - 1) + 1
+            item = _LIST_ITEM_RE.match(buffer, above_start, line_start - 1)
+            if item and above_start not in accepted and int(item.group("number")) == number - 1:
+                return True
+        below_start = match.end() + 1
+        below_end = buffer.find("\n", below_start)
+        item = _LIST_ITEM_RE.match(buffer, below_start, below_end if below_end != -1 else len(buffer))
+        return bool(item) and int(item.group("number")) == number + 1
 
-    def _parse_protocol(self, content: str) -> dict:
+    def _build_index(self):
+        self._styled_top_level = False
+        self._entries = []
+        self._entries = self._scan_headings(0, len(self._buffer))
+        self._finalize_index()
+
+    def _finalize_index(self):
         """
-        Parses the raw protocol content into a structured dictionary.
-        This is a placeholder and will need robust implementation based on actual protocol structure.
-        For now, it just returns the whole content or can try to find simple sections.
+        Derives section end offsets and lookup tables from the ordered entry list.
+        This only walks the headings, never the text, so it is cheap to repeat after edits.
         """
-        # A more sophisticated parser would use regex or NLP to identify sections
-        # For a basic start, we can just return the full content
-        return {"full_protocol_text": content, "sections": self._extract_sections(content)}
+        buffer_end = len(self._buffer)
+        self._preamble_end = self._entries[0].heading_start if self._entries else buffer_end
+        if not self._buffer[:self._preamble_end].strip():
+            self._preamble_end = 0
+
+        # A section ends where the next heading at the same or a higher level begins.
+        open_entries = []
+        for entry in self._entries:
+            while open_entries and open_entries[-1].level >= entry.level:
+                open_entries.pop().end = entry.heading_start
+            open_entries.append(entry)
+        for entry in open_entries:
+            entry.end = buffer_end
 
-    def _extract_sections(self, content: str) -> dict:
+        self._entries_by_key = {}
+        self._entries_by_number = {}
+        self._entries_by_title = {}
+        for entry in self._entries:
+            base_key = _section_key(entry.number, entry.title)
+            key, duplicate = base_key, 2
+            # Duplicate headings are kept rather than overwritten.
+            while key in self._entries_by_key or key == PREAMBLE_TITLE:
+                key = f"{base_key} ({duplicate})"
+                duplicate += 1
+            entry.key = key
+            self._entries_by_key[key] = entry
+            if entry.number:
+                self._entries_by_number.setdefault(entry.number, entry)
+            self._entries_by_title.setdefault(self.normalize_title(entry.title), []).append(entry)
+
+    def section_titles(self) -> list:
         """
-        A very basic section extractor. Will need refinement.
+        Returns the parsed section titles in document order.
         """
-        sections = {}
-        # Example: look for numbered headings
-        import re
-        section_titles = re.findall(r'^\s*(\d+\.\s*[A-Za-z\s]+)', content, re.MULTILINE)
-        current_section = "Introduction" # Default for initial text
-        start_index = 0
+        titles = [PREAMBLE_TITLE] if self._preamble_end else []
+        titles.extend(entry.key for entry in self._entries)
+        return titles
 
-        for title in section_titles:
-            start_idx = content.find(title, start_index)
-            if start_idx != -1:
-                if current_section:
-                    sections[current_section] = content[start_index:start_idx].strip()
-                current_section = title.strip()
-                start_index = start_idx + len(title) # Move past the title to get content
+    def subsection_titles(self, section_name: str) -> list:
+        """
+        Returns the title of a section followed by the titles of all sections nested in it.
+        """
+        entry = self.get_section_entry(section_name)
+        if entry is None:
+            return []
+        return [e.key for e in self._entries if entry.heading_start <= e.heading_start < entry.end]
 
-        # Add the last section
-        if current_section:
-            sections[current_section] = content[start_index:].strip()
+    def child_sections(self, section_name: str = None) -> list:
+        """
+        Returns the titles of the sections directly nested in a section, or the top-level sections
+        (preceded by the Preamble, if any) when no section is given.
+        """
+        if section_name is None:
+            start, end, parent = 0, len(self._buffer), None
+            children = [PREAMBLE_TITLE] if self._preamble_end else []
+        else:
+            parent = self.get_section_entry(section_name)
+            if parent is None:
+                return []
+            start, end, children = parent.heading_start, parent.end, []
+        covered_until = start
+        for entry in self._entries:
+            if entry is parent or not start <= entry.heading_start < end:
+                continue
+            # Entries inside an earlier child are grandchildren.
+            if entry.heading_start >= covered_until:
+                children.append(entry.key)
+                covered_until = entry.end
+        return children
 
-        return sections
+    def section_span(self, section_name: str):
+        """
+        Returns the (start, end) buffer offsets of a section including its heading line and
+        subsections, or None if it doesn't exist.
+        """
+        if section_name == PREAMBLE_TITLE and self._preamble_end:
+            return 0, self._preamble_end
+        entry = self.get_section_entry(section_name)
+        return (entry.heading_start, entry.end) if entry is not None else None
 
+    def get_section_entry(self, section_name: str):
+        """
+        Resolves a section by exact title, number ("7.2", "Section 7.2") or normalized title.
+        Returns the SectionEntry, or None if nothing matches.
+        """
+        entry = self._entries_by_key.get(section_name)
+        if entry is not None:
+            return entry
+        number = re.fullmatch(r'\s*(?:section\s+)?(\d+(?:\.\d+)*)\.?\s*', section_name, re.IGNORECASE)
+        if number:
+            return self._entries_by_number.get(number.group(1))
+        wanted = self.normalize_title(section_name)
+        if not wanted:
+            return None
+        matches = self._entries_by_title.get(wanted)
+        if matches:
+            return matches[0]
+        pattern = re.compile(r'\b' + re.escape(wanted) + r'\b')
+        for normalized, entries in self._entries_by_title.items():
+            if pattern.search(normalized):
+                return entries[0]
+        return None
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """
+        Normalizes a heading for loose matching: drops numbering/markdown and lowercases.
+        """
+        title = re.sub(r'^[\s#*]*(\d+(\.\d+)*)?\.?\s*', '', title)
+        return re.sub(r'[^a-z0-9]+', ' ', title.lower()).strip()
+
+    def find_section_title(self, section_name: str):
+        """
+        Resolves a loose section name (e.g. "Study Population") to the parsed section title.
+        Returns None if no section matches.
+        """
+        if section_name == PREAMBLE_TITLE and self._preamble_end:
+            return PREAMBLE_TITLE
+        entry = self.get_section_entry(section_name)
+        return entry.key if entry is not None else None
 
     def get_section(self, section_name: str) -> str:
         """
         Retrieves a specific section of the protocol.
         """
-        if section_name in self.structured_protocol["sections"]:
-            return self.structured_protocol["sections"][section_name]
+        title = self.find_section_title(section_name)
+        if title is not None:
+            return self.structured_protocol["sections"][title]
         elif section_name == "full_protocol":
-            return self.structured_protocol["full_protocol_text"]
+            return self._buffer
         else:
             return f"Section '{section_name}' not found or not explicitly parsed."
 
+    def section_hash(self, section_name: str):
+        """
+        Returns a content hash of a section, or None if it doesn't exist. Memoized until the next edit.
+        """
+        title = self.find_section_title(section_name)
+        if title is None:
+            return None
+        if title not in self._section_hashes:
+            text = self.structured_protocol["sections"][title]
+            self._section_hashes[title] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return self._section_hashes[title]
+
+    def section_hashes(self) -> dict:
+        """
+        Returns {section title: content hash} for every section.
+        """
+        return {title: self.section_hash(title) for title in self.section_titles()}
+
+    def get_section_pages(self, section_name: str):
+        """
+        Returns the (first_page, last_page) source pages spanned by a section, or None if page
+        offsets are unknown or the section doesn't exist.
+        """
+        entry = self.get_section_entry(section_name)
+        if entry is None or not self.page_starts:
+            return None
+        first_page = max(1, bisect_right(self.page_starts, entry.heading_start))
+        last_page = max(1, bisect_right(self.page_starts, max(entry.heading_start, entry.end - 1)))
+        return first_page, last_page
+
     def get_all_content(self) -> str:
         """
         Retrieves the entire protocol content.
         """
-        return self.protocol_content
+        return self._buffer
 
-    # Future methods for updating sections based on agent recommendations
     def update_section(self, section_name: str, new_content: str):
         """
-        Simulates updating a section of the protocol.
-        In a real MCP, this would be more complex, involving versioning.
+        Replaces the body of a section in the protocol text and re-indexes only the edited region.
         """
-        # This simple implementation will just update the dictionary, not the raw string
-        # A more robust solution would regenerate the full protocol string
-        if section_name in self.structured_protocol["sections"]:
-            self.structured_protocol["sections"][section_name] = new_content
-            # You'd also need logic to regenerate self.protocol_content from self.structured_protocol
-            print(f"Section '{section_name}' updated (in internal representation).")
-        else:
-            print(f"Section '{section_name}' not found for update.")
\ No newline at end of file
+        if self.read_only:
+            raise RuntimeError("This protocol is shared through ProtocolStore; use ProtocolStore.update_section "
+                               "or edit a ProtocolStore.checkout() copy.")
+        entry = self.get_section_entry(section_name)
+        if entry is None:
+            print(f"Section '{section_name}' not found for update.")
+            return
+        body = new_content.strip("\n") + "\n"
+        if entry.end < len(self._buffer):
+            body += "\n"
+        old_start, old_end = entry.start, entry.end
+        self._buffer = self._buffer[:old_start] + body + self._buffer[old_end:]
+        delta = len(body) - (old_end - old_start)
+
+        # Headings before the edit are untouched, headings after it shift by delta,
+        # and only the new body is re-tokenized.
+        before = [e for e in self._entries if e.heading_start < old_start]
+        after = [e for e in self._entries if e.heading_start >= old_end]
+        for later in after:
+            later.heading_start += delta
+            later.start += delta
+        tops = [e for e in before if e.number and "." not in e.number]
+        last_top = int(tops[-1].number) if tops else None
+        last_top_title = tops[-1].title if tops else None
+        rescanned = self._scan_headings(old_start, old_start + len(body), last_top, last_top_title)
+        self._entries = before + rescanned + after
+        self._finalize_index()
+        self._section_hashes = {}
+        self.version += 1
+        self.section_versions[entry.key] = self.section_versions.get(entry.key, 1) + 1
+        print(f"Section '{entry.key}' updated (protocol version {self.version}).")
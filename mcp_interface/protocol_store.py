@@ -0,0 +1,274 @@
+"""
+Process-wide store of parsed protocols, shared by every review and MCP session.
+
+A protocol is parsed once per distinct text and kept as immutable ProtocolServer snapshots keyed by
+(protocol_id, version). update_section never edits a snapshot in place. It derives the next version,
+so sessions still reading an older version are unaffected. Memory is bounded: whole protocols are
+evicted least-recently-used first when the store grows past its byte budget or sits idle too long.
+
+    store = get_default_protocol_store()
+    protocol_id, protocol_server = store.open(protocol_text)
+    store.update_section(protocol_id, "7. Safety Reporting", new_text, expected_version=protocol_server.version)
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from .protocol_server import ProtocolServer
+
+
+# Rough per-section cost of the offset index (SectionEntry, lookup tables), on top of the text itself.
+INDEX_BYTES_PER_SECTION = 600
+
+
+class ProtocolNotFound(KeyError):
+    """Raised for an unknown (or evicted) protocol id or version."""
+
+
+class VersionConflict(ValueError):
+    """Raised when an update expected a different latest version than the store holds."""
+
+
+def protocol_digest(protocol_text: str, page_starts: list = None) -> str:
+    """Content id of a protocol text (and its page offsets)."""
+    payload = protocol_text if page_starts is None else protocol_text + "\0" + json.dumps(page_starts)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _estimate_bytes(protocol_server: ProtocolServer) -> int:
+    return sys.getsizeof(protocol_server.get_all_content()) + INDEX_BYTES_PER_SECTION * len(protocol_server.section_titles())
+
+
+class _StoredProtocol:
+    __slots__ = ("protocol_id", "versions", "last_access", "lock")
+
+    def __init__(self, protocol_id: str):
+        self.protocol_id = protocol_id
+        self.versions = OrderedDict()  # version -> (ProtocolServer, estimated bytes), oldest first
+        self.last_access = time.monotonic()
+        # Serializes updates of one protocol; reads never take it.
+        self.lock = threading.Lock()
+
+    @property
+    def latest(self) -> int:
+        return next(reversed(self.versions))
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size in self.versions.values())
+
+
+class ProtocolStore:
+    def __init__(self, max_bytes: int = None, idle_seconds: float = None, max_versions: int = None):
+        """
+        Args:
+            max_bytes: Estimated memory budget. Defaults to $PROTOCOL_STORE_MAX_MB (256) MB.
+            idle_seconds: Protocols not accessed for this long are dropped. Defaults to
+                          $PROTOCOL_STORE_IDLE_SECONDS or 3600; 0 keeps them until memory runs short.
+            max_versions: Versions kept per protocol, newest first. Defaults to $PROTOCOL_STORE_MAX_VERSIONS or 5.
+        """
+        self.max_bytes = max_bytes or int(float(os.getenv("PROTOCOL_STORE_MAX_MB", "256")) * 1024 * 1024)
+        self.idle_seconds = idle_seconds if idle_seconds is not None else float(os.getenv("PROTOCOL_STORE_IDLE_SECONDS", "3600"))
+        self.max_versions = max_versions or int(os.getenv("PROTOCOL_STORE_MAX_VERSIONS", "5"))
+        self._lock = threading.Lock()
+        self._protocols = OrderedDict()  # protocol_id -> _StoredProtocol, least recently used first
+        self._by_digest = {}  # content digest -> (protocol_id, version)
+        self._pending = {}  # content digest -> Future of a parse in progress
+        self._bytes = 0
+        self.hits = 0
+        self.parses = 0
+        self.evictions = 0
+        self.updates = 0
+
+    def _touch_locked(self, stored: _StoredProtocol):
+        stored.last_access = time.monotonic()
+        self._protocols.move_to_end(stored.protocol_id)
+
+    def _lookup_locked(self, protocol_id: str, version: int = None) -> ProtocolServer:
+        stored = self._protocols.get(protocol_id)
+        if stored is None:
+            raise ProtocolNotFound(f"Protocol '{protocol_id}' is not loaded (unknown or evicted); open it again")
+        version = stored.latest if version is None else version
+        if version not in stored.versions:
+            raise ProtocolNotFound(f"Version {version} of protocol '{protocol_id}' is not held; latest is {stored.latest}")
+        self._touch_locked(stored)
+        return stored.versions[version][0]
+
+    def _add_version_locked(self, stored: _StoredProtocol, protocol_server: ProtocolServer, digest: str):
+        size = _estimate_bytes(protocol_server)
+        stored.versions[protocol_server.version] = (protocol_server, size)
+        self._by_digest[digest] = (stored.protocol_id, protocol_server.version)
+        self._bytes += size
+        while len(stored.versions) > self.max_versions:
+            _, (old_server, old_size) = stored.versions.popitem(last=False)
+            self._bytes -= old_size
+            self._forget_digest_locked(stored.protocol_id, old_server.version)
+        self._touch_locked(stored)
+        self._evict_locked(keep=stored.protocol_id)
+
+    def _forget_digest_locked(self, protocol_id: str, version: int = None):
+        for digest, (held_id, held_version) in list(self._by_digest.items()):
+            if held_id == protocol_id and (version is None or held_version == version):
+                del self._by_digest[digest]
+
+    def _drop_locked(self, protocol_id: str):
+        stored = self._protocols.pop(protocol_id)
+        self._bytes -= stored.size
+        self._forget_digest_locked(protocol_id)
+        self.evictions += 1
+
+    def _evict_locked(self, keep: str = None):
+        """Drops idle protocols, then the least recently used ones until the store fits its budget."""
+        if self.idle_seconds:
+            cutoff = time.monotonic() - self.idle_seconds
+            for protocol_id in [pid for pid, stored in self._protocols.items() if stored.last_access < cutoff]:
+                if protocol_id != keep:
+                    self._drop_locked(protocol_id)
+        for protocol_id in list(self._protocols):
+            if self._bytes <= self.max_bytes:
+                break
+            # The protocol just added or read stays even if it alone exceeds the budget.
+            if protocol_id != keep:
+                self._drop_locked(protocol_id)
+
+    def open(self, protocol_text: str, page_starts: list = None):
+        """
+        Returns (protocol_id, ProtocolServer) for a protocol text, parsing it only if no session has
+        loaded it yet. Concurrent opens of the same text wait for one parse. If the text equals a held
+        version of an amended protocol, that version is returned; the original text of an amended protocol
+        whose first version is no longer held is added as its next version. The ProtocolServer is shared
+        and read-only; amend it with update_section, or edit a checkout().
+        """
+        digest = protocol_digest(protocol_text, page_starts)
+        with self._lock:
+            held = self._by_digest.get(digest)
+            if held is not None:
+                self.hits += 1
+                return held[0], self._lookup_locked(*held)
+            pending = self._pending.get(digest)
+            owner = pending is None
+            if owner:
+                pending = self._pending[digest] = Future()
+        if not owner:
+            protocol_id, protocol_server = pending.result()
+            with self._lock:
+                self.hits += 1
+            return protocol_id, protocol_server
+        try:
+            protocol_server = ProtocolServer(protocol_text, page_starts=page_starts)
+            protocol_server.read_only = True
+            with self._lock:
+                self.parses += 1
+                stored = self._protocols.get(digest)
+            if stored is not None:
+                # The original text of an amended protocol whose first version was trimmed: it comes back as
+                # that protocol's next version, keeping the amendments and the version numbering.
+                with stored.lock, self._lock:
+                    if self._protocols.get(digest) is stored:
+                        protocol_server.version = stored.latest + 1
+                        self._add_version_locked(stored, protocol_server, digest)
+                    else:
+                        stored = None
+            if stored is None:
+                with self._lock:
+                    stored = self._protocols[digest] = _StoredProtocol(digest)
+                    self._add_version_locked(stored, protocol_server, digest)
+            pending.set_result((digest, protocol_server))
+            return digest, protocol_server
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def get(self, protocol_id: str, version: int = None) -> ProtocolServer:
+        """
+        Returns a held version (default: the latest) of a protocol.
+        Raises:
+            ProtocolNotFound: If the protocol or version isn't held (never opened, evicted or superseded).
+        """
+        with self._lock:
+            return self._lookup_locked(protocol_id, version)
+
+    def update_section(self, protocol_id: str, section_name: str, new_content: str,
+                       expected_version: int = None) -> ProtocolServer:
+        """
+        Creates the next version of a protocol with one section's body replaced; older versions stay readable.
+        Args:
+            expected_version: If given, the update is rejected unless it is still the latest version,
+                              so concurrent editors don't overwrite each other's changes unseen.
+        Returns:
+            The new version's ProtocolServer.
+        Raises:
+            ProtocolNotFound, VersionConflict, or KeyError if the section doesn't exist.
+        """
+        with self._lock:
+            stored = self._protocols.get(protocol_id)
+        if stored is None:
+            raise ProtocolNotFound(f"Protocol '{protocol_id}' is not loaded (unknown or evicted); open it again")
+        with stored.lock:
+            current = self.get(protocol_id)
+            if expected_version is not None and current.version != expected_version:
+                raise VersionConflict(f"Protocol '{protocol_id}' is at version {current.version}, not {expected_version}")
+            if current.get_section_entry(section_name) is None:
+                raise KeyError(f"Section '{section_name}' not found in protocol '{protocol_id}' (the Preamble can't be edited)")
+            # Index entries are copied; the text buffer is shared until the edit replaces it.
+            updated = copy.deepcopy(current)
+            updated.read_only = False
+            updated.update_section(section_name, new_content)
+            updated.read_only = True
+            digest = protocol_digest(updated.get_all_content(), updated.page_starts)
+            with self._lock:
+                if protocol_id not in self._protocols:
+                    raise ProtocolNotFound(f"Protocol '{protocol_id}' was evicted during the update; open it again")
+                self.updates += 1
+                self._add_version_locked(stored, updated, digest)
+        return updated
+
+    def checkout(self, protocol_text: str, page_starts: list = None) -> ProtocolServer:
+        """
+        Returns a private, editable copy of a protocol, parsed through the store (e.g. for a session that
+        amends sections locally).
+        """
+        _, protocol_server = self.open(protocol_text, page_starts)
+        private = copy.deepcopy(protocol_server)
+        private.read_only = False
+        return private
+
+    def stats(self) -> dict:
+        """Returns protocols and versions held, estimated bytes, and hit/parse/update/eviction counters."""
+        with self._lock:
+            self._evict_locked()
+            return {
+                "protocols": len(self._protocols),
+                "versions": sum(len(stored.versions) for stored in self._protocols.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "parses": self.parses,
+                "updates": self.updates,
+                "evictions": self.evictions,
+            }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_protocol_store() -> ProtocolStore:
+    """
+    Returns the process-wide protocol store, configured from $PROTOCOL_STORE_MAX_MB,
+    $PROTOCOL_STORE_IDLE_SECONDS and $PROTOCOL_STORE_MAX_VERSIONS.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ProtocolStore()
+        return _default_store
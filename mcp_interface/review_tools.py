@@ -1,14 +1,279 @@
-# This file can contain LangChain tools that agents can use to interact with the MCP.
-# For example, tools to:
-# - Search for specific sections
-# - Propose specific text changes (more advanced)
-# - Log a specific type of issue
-#
-# from langchain.tools import tool
-# from .protocol_server import ProtocolServer
-#
-# @tool
-# def find_section_by_keyword(protocol_server: ProtocolServer, keyword: str) -> str:
-#    """Searches the protocol for a keyword and returns the relevant section."""
-#    # Implement search logic using protocol_server.get_all_content()
-#    pass
\ No newline at end of file
+"""
+Tools agents can use to pull targeted excerpts from the protocol instead of receiving the full text:
+keyword search, cross-reference resolution ("see Section 7.2") and term-consistency checks. Agents reach
+them over MCP (mcp_interface/mcp_server.py).
+
+Searches run against a BM25 inverted index over the paragraphs of each ProtocolServer section, built once
+per protocol version and rebuilt automatically after update_section.
+"""
+from bisect import bisect_right
+from collections import Counter
+import heapq
+import math
+import re
+import threading
+import weakref
+
+from .protocol_server import ProtocolServer
+from utils.tracing import trace_stage
+
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+EXCERPT_CHARS = 600
+# Paragraphs shorter than this (e.g. a heading line) are joined with the next one.
+MIN_PASSAGE_CHARS = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "which who may must should shall not no all any each per".split()
+)
+
+# "Section 7.2", "see section 4", "Sections 5.1 and 5.3", "§ 8.1".
+_CROSS_REFERENCE_RE = re.compile(
+    r"\b(?:see\s+)?(?:sections?|§)\s*(?P<numbers>\d{1,3}(?:\.\d{1,3})*(?:\s*(?:,|and|or|-|–)\s*\d{1,3}(?:\.\d{1,3})*)*)",
+    re.IGNORECASE
+)
+_SECTION_NUMBER_RE = re.compile(r"\d{1,3}(?:\.\d{1,3})*")
+
+# Doses and other quantities with units, e.g. "200 mg orally once daily", "1.5 mg/kg", "75 mg/m2 Q3W".
+_QUANTITY_RE = re.compile(
+    r"(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit>mg/m2|mg/m²|mg/kg|mcg/kg|µg/kg|mg|mcg|µg|ng|g|ml|mL|L|IU|units?|%)"
+    r"(?![A-Za-z0-9])"
+    r"(?:\s+(?:orally|by mouth|intravenously|IV|subcutaneously|SC|PO))?"
+    r"(?:\s+(?P<frequency>once daily|twice daily|three times daily|daily|weekly|every \d+ (?:days|weeks)|QD|BID|TID|QW|Q\dW))?",
+)
+_FREQUENCY_SYNONYMS = {"qd": "once daily", "daily": "once daily", "bid": "twice daily", "tid": "three times daily",
+                       "qw": "weekly"}
+# How far after a term a quantity is attributed to it.
+TERM_CONTEXT_CHARS = 120
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word and number tokens without stopwords; section numbers like 7.2 stay whole."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class SectionIndex:
+    """
+    BM25 inverted index over the passages (paragraphs) of one protocol version. Each passage belongs to
+    the most specific section containing it, so hits point at e.g. "4.1 Inclusion Criteria" rather
+    than "4. Study Population", and the passage itself is the excerpt returned.
+    """
+    def __init__(self, protocol_server: ProtocolServer):
+        self.version = protocol_server.version
+        self._buffer = protocol_server.get_all_content()
+        self.titles = protocol_server.section_titles()
+        # Own text of each section: its heading and body up to its first subsection.
+        self.section_starts = []
+        self.section_ends = []
+        spans = [protocol_server.section_span(title) for title in self.titles]
+        for position, (start, end) in enumerate(spans):
+            if position + 1 < len(spans):
+                # The next heading is either this section's first subsection or its successor.
+                end = min(end, spans[position + 1][0])
+            self.section_starts.append(start)
+            self.section_ends.append(end)
+
+        self.passages = []  # (section position, start, end)
+        lengths = []
+        term_counts = []
+        for section, (start, end) in enumerate(zip(self.section_starts, self.section_ends)):
+            for passage_start, passage_end in self._split_passages(start, end):
+                counts = Counter(tokenize(self._buffer[passage_start:passage_end]))
+                self.passages.append((section, passage_start, passage_end))
+                lengths.append(sum(counts.values()))
+                term_counts.append(counts)
+
+        # BM25 scores are precomputed per (term, passage) and postings are sorted by score, so a query
+        # walks only the head of each posting list (threshold algorithm) instead of every match.
+        average = (sum(lengths) / len(lengths)) if lengths else 0.0
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+        passage_count = len(self.passages)
+        self._impacts = {}
+        for passage, (counts, length) in enumerate(zip(term_counts, lengths)):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average) if average else BM25_K1
+            for term, frequency in counts.items():
+                frequency_docs = document_frequency[term]
+                idf = math.log(1 + (passage_count - frequency_docs + 0.5) / (frequency_docs + 0.5))
+                self._impacts.setdefault(term, {})[passage] = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        self._postings = {
+            term: sorted(((score, passage) for passage, score in impacts.items()), reverse=True)
+            for term, impacts in self._impacts.items()
+        }
+
+    def _split_passages(self, start: int, end: int):
+        """Yields (start, end) of the paragraphs in buffer[start:end]; headings join the paragraph after them."""
+        passage_start = start
+        for separator in re.finditer(r"\n[ \t]*\n", self._buffer[start:end]):
+            cut = start + separator.start()
+            if len(self._buffer[passage_start:cut].strip()) >= MIN_PASSAGE_CHARS:
+                yield passage_start, cut
+                passage_start = start + separator.end()
+        if self._buffer[passage_start:end].strip():
+            yield passage_start, end
+
+    def section_of(self, offset: int):
+        """Title of the section whose own text contains a buffer offset, or None."""
+        position = bisect_right(self.section_starts, offset) - 1
+        if position >= 0 and offset < self.section_ends[position]:
+            return self.titles[position]
+        return None
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """
+        Ranks passages against a keyword query.
+        Returns:
+            Up to limit {"section", "score", "excerpt"} dicts, best first.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self._postings]
+        if not terms or limit <= 0:
+            return []
+        postings = [self._postings[term] for term in terms]
+        impacts = [self._impacts[term] for term in terms]
+        best, seen = [], set()
+        for depth in range(max(len(posting) for posting in postings)):
+            threshold = 0.0
+            for posting in postings:
+                if depth >= len(posting):
+                    continue
+                score, passage = posting[depth]
+                threshold += score
+                if passage in seen:
+                    continue
+                seen.add(passage)
+                total = sum(impact.get(passage, 0.0) for impact in impacts)
+                if len(best) < limit:
+                    heapq.heappush(best, (total, -passage))
+                elif total > best[0][0]:
+                    heapq.heapreplace(best, (total, -passage))
+            # No unseen passage can score more than the sum of the scores at the current depth.
+            if len(best) == limit and best[0][0] >= threshold:
+                break
+        return [self._hit(-negative_passage, score) for score, negative_passage in sorted(best, reverse=True)]
+
+    def passages_containing(self, phrase: str) -> list:
+        """Passages containing every token of the phrase, as (section title, start, end), in document order."""
+        terms = set(tokenize(phrase))
+        passages = None
+        for term in terms:
+            found = set(self._impacts.get(term, ()))
+            passages = found if passages is None else passages & found
+            if not passages:
+                return []
+        return [(self.titles[self.passages[p][0]], self.passages[p][1], self.passages[p][2])
+                for p in sorted(passages or ())]
+
+    def _hit(self, passage: int, score: float) -> dict:
+        section, start, end = self.passages[passage]
+        excerpt = self._buffer[start:end].strip()
+        if len(excerpt) > EXCERPT_CHARS:
+            excerpt = excerpt[:EXCERPT_CHARS].rsplit(" ", 1)[0] + " ..."
+        return {"section": self.titles[section], "score": round(score, 4), "excerpt": excerpt}
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_section_index(protocol_server: ProtocolServer) -> SectionIndex:
+    """
+    Returns the SectionIndex of the server's current protocol version, building it on first use.
+    """
+    with _indexes_lock:
+        index = _indexes.get(protocol_server)
+        if index is not None and index.version == protocol_server.version:
+            return index
+    with trace_stage("review_tools.build_index", version=protocol_server.version) as span:
+        index = SectionIndex(protocol_server)
+        span.attributes["sections"] = len(index.titles)
+        span.attributes["passages"] = len(index.passages)
+    with _indexes_lock:
+        _indexes[protocol_server] = index
+    return index
+
+
+def find_section_by_keyword(protocol_server: ProtocolServer, keyword: str, limit: int = 5) -> list:
+    """
+    Searches the protocol for keywords and returns the best-matching passages with their sections.
+    """
+    return get_section_index(protocol_server).search(keyword, limit)
+
+
+def resolve_cross_references(protocol_server: ProtocolServer, text: str = None) -> list:
+    """
+    Finds section cross-references such as "see Section 7.2" and resolves them to parsed sections.
+    Args:
+        protocol_server: An instance of ProtocolServer to access protocol content.
+        text: Text to scan, e.g. an excerpt or a single reference. Defaults to the whole protocol.
+    Returns:
+        One {"reference", "number", "section", "source_section"} dict per referenced number. "section"
+        is None for dangling references; "source_section" is set when scanning the whole protocol.
+    """
+    index = get_section_index(protocol_server) if text is None else None
+    source = protocol_server.get_all_content() if text is None else text
+    resolved = []
+    for match in _CROSS_REFERENCE_RE.finditer(source):
+        source_section = index.section_of(match.start()) if index is not None else None
+        for number in _SECTION_NUMBER_RE.findall(match.group("numbers")):
+            entry = protocol_server.get_section_entry(number)
+            resolved.append({
+                "reference": match.group(0).strip(),
+                "number": number,
+                "section": entry.key if entry is not None else None,
+                "source_section": source_section,
+            })
+    return resolved
+
+
+def _normalize_quantity(match) -> tuple:
+    """Returns (quantity, frequency) of a _QUANTITY_RE match, e.g. ("100 mg", "once daily"); frequency may be ""."""
+    value = match.group("value").replace(",", ".")
+    value = value.rstrip("0").rstrip(".") if "." in value else value
+    unit = match.group("unit").lower().replace("²", "2").replace("µg", "mcg").replace("units", "unit")
+    frequency = (match.group("frequency") or "").lower()
+    frequency = _FREQUENCY_SYNONYMS.get(frequency, frequency)
+    return f"{value} {unit}", frequency
+
+
+def check_term_consistency(protocol_server: ProtocolServer, term: str) -> dict:
+    """
+    Collects the doses and other quantities stated right after each mention of a term (e.g. "Drug X")
+    in every section, and reports whether the sections agree. A quantity stated without a frequency
+    ("100 mg") agrees with the same quantity stated with one ("100 mg once daily").
+    Returns:
+        {"term", "consistent", "values": {quantity: [sections]}, "mentions": [{"section", "quantity", "context"}]}
+    """
+    index = get_section_index(protocol_server)
+    pattern = re.compile(re.escape(term.strip()), re.IGNORECASE)
+    buffer = protocol_server.get_all_content()
+    mentions, amounts, values = [], [], {}
+    frequencies = {}  # quantity -> frequencies it is stated with
+    for title, start, end in index.passages_containing(term):
+        for match in pattern.finditer(buffer, start, end):
+            # Line wraps inside a phrase ("100 mg once\ndaily") read as single spaces.
+            window = " ".join(buffer[match.end():min(end, match.end() + TERM_CONTEXT_CHARS)].split())
+            # Only quantities in the same sentence as the mention.
+            window = re.split(r"\.\s+(?=[A-Z])", window, maxsplit=1)[0]
+            quantity = _QUANTITY_RE.search(window)
+            if quantity is None:
+                continue
+            amount, frequency = _normalize_quantity(quantity)
+            frequencies.setdefault(amount, set()).add(frequency)
+            amounts.append(amount)
+            mentions.append({"section": title, "quantity": f"{amount} {frequency}".strip(),
+                             "context": f"{match.group(0)} {window}".strip()})
+    for mention, amount in zip(mentions, amounts):
+        stated = sorted(frequencies[amount] - {""})
+        if mention["quantity"] == amount and len(stated) == 1:
+            # A bare quantity is reported under the one frequency it is otherwise stated with.
+            mention["quantity"] = f"{amount} {stated[0]}"
+        sections = values.setdefault(mention["quantity"], [])
+        if mention["section"] not in sections:
+            sections.append(mention["section"])
+    # Bare quantities stated with several frequencies elsewhere agree with each of them.
+    distinct = [value for value in values if value not in frequencies or frequencies[value] == {""}]
+    return {"term": term, "consistent": len(distinct) <= 1, "values": values, "mentions": mentions}
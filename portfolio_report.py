@@ -0,0 +1,63 @@
+"""
+Portfolio report over batch review results.
+
+Loads the JSON lines written by batch_review.py into a RiskTable and prints scores and severity counts
+per study, indication and agent, plus the monthly score trend, under a weighting scheme. Re-scoring
+uses the risks already in the results file, so trying other weights needs no LLM call.
+
+    python portfolio_report.py review_results.jsonl
+    python portfolio_report.py review_results.jsonl --scheme regulatory --by study
+    python portfolio_report.py review_results.jsonl --weights '{"severity": {"Low": 2, "Medium": 10, "High": 40}}'
+"""
+import argparse
+import json
+import time
+
+from utils.risk_table import SEVERITIES, RiskTable
+from utils.scoring_engine import WEIGHTING_SCHEMES, WeightingScheme
+
+
+def print_groups(title: str, groups: dict):
+    print(f"\n{title}")
+    print(f"  {'':<28}{'reviews':>8}{'mean':>8}" + "".join(f"{name:>12}" for name in SEVERITIES))
+    for label, summary in sorted(groups.items(), key=lambda item: str(item[0])):
+        mean = f"{summary['mean_score']:.1f}" if summary["mean_score"] is not None else "-"
+        print(f"  {str(label or '(none)'):<28}{summary['reviews']:>8}{mean:>8}"
+              + "".join(f"{summary['severity'][name]:>12}" for name in SEVERITIES))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scores and risk aggregates across batch review results.")
+    parser.add_argument("results", help="JSONL results file from batch_review.py.")
+    parser.add_argument("--scheme", choices=sorted(WEIGHTING_SCHEMES), default="default", help="Named weighting scheme.")
+    parser.add_argument("--weights", help="Custom scheme as JSON with optional severity, agents, base and floor.")
+    parser.add_argument("--by", choices=["study", "indication", "agent"], action="append",
+                        help="Grouping to print; repeat for several (default: all).")
+    parser.add_argument("--trend", choices=["D", "W", "M", "Y"], default="M", help="Period of the score trend.")
+    args = parser.parse_args(argv)
+
+    weights = WeightingScheme(**json.loads(args.weights)) if args.weights else WEIGHTING_SCHEMES[args.scheme]
+    start = time.perf_counter()
+    table = RiskTable.from_jsonl(args.results)
+    loaded = time.perf_counter() - start
+    if not len(table):
+        print(f"No successful reviews in {args.results}.")
+        return 1
+
+    start = time.perf_counter()
+    scores = table.scores(weights)
+    groups = {by: table.aggregate(by, weights) for by in args.by or ["study", "indication", "agent"]}
+    rescored = time.perf_counter() - start
+    print(f"{len(table)} reviews loaded in {loaded:.2f}s; scored and aggregated in {rescored * 1000:.1f}ms "
+          f"with {json.dumps(weights.as_dict())}.")
+    print(f"Mean score {scores.mean():.1f}, min {scores.min():.0f}, max {scores.max():.0f}.")
+    for by, summaries in groups.items():
+        print_groups(f"By {by}:", summaries)
+    print("\nTrend:")
+    for bucket, mean, reviews in table.trend(weights, period=args.trend)[None]:
+        print(f"  {bucket:<12}{mean:>8.1f}  ({reviews} reviews)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
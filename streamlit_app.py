@@ -1,19 +1,167 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
+import time
 
-# Assuming you have these modules implemented
-from agents.protocol_generator import ProtocolGenerator
-from mcp_interface.protocol_server import ProtocolServer
-from agents.pi_agent import PIAgent
-from agents.site_physician_agent import SitePhysicianAgent
-from agents.health_authority_agent import HealthAuthorityAgent
-from utils.risk_assessor import RiskAssessor
+# Only lightweight modules are imported at startup. The agents (and with them LangChain and the
+# OpenAI client) and pypdf are imported inside the handlers that need them, so the first page
+# paints without paying for them. Run `python import_report.py` to see where startup time goes.
+from mcp_interface.protocol_store import get_default_protocol_store
 from utils.scoring_engine import ScoringEngine
-from utils.document_processor import DocumentProcessor
+from utils.llm_cache import get_default_cache
+from utils.llm_resilience import get_call_guard
+from utils.rate_limiter import get_scheduler
+from utils.tracing import get_tracer
 
 load_dotenv() # Load environment variables
 
+
+@st.cache_resource
+def get_review_agents(llm_model: str = "gpt-4o") -> dict:
+    """Reviewer agents shared across reruns and sessions; clients and HTTP pools are built once per process."""
+    from agents.review_pipeline import build_review_agents
+    return build_review_agents(llm_model)
+
+
+@st.cache_resource
+def get_shared_agent(agent_cls, llm_model: str = "gpt-4o"):
+    """Shared ProtocolGenerator / RiskAssessor instances."""
+    from utils.llm_registry import get_agent
+    return get_agent(agent_cls, llm_model)
+
+
+@st.cache_resource
+def get_findings_store():
+    """Findings store of previously reviewed sections, shared with the review job workers."""
+    from utils.findings_store import get_default_findings_store
+    return get_default_findings_store()
+
+
+@st.cache_data(show_spinner=False)
+def get_review_preflight(protocol_text: str, llm_model: str = "gpt-4o", page_starts: list = None) -> dict:
+    """Chunks and prompt tokens the review of a protocol will take, computed once per protocol text."""
+    from agents.chunked_review import preflight_review
+    # Same page offsets as the review, so the review reuses this parse.
+    _, protocol_server = get_default_protocol_store().open(protocol_text, page_starts=page_starts)
+    return preflight_review(protocol_server, get_review_agents(llm_model))
+
+
+AGENT_LABELS = {
+    "pi": "Principal Investigator Agent",
+    "site_physician": "Site Physician Agent",
+    "health_authority": "Health Authority Agent",
+}
+
+
+def show_agent_feedback(agent_key: str, feedback: str, error: str = None, report: dict = None):
+    """Renders one agent's feedback, or its failure, with a caption on how its input was routed."""
+    label = AGENT_LABELS.get(agent_key, agent_key)
+    if error:
+        st.error(f"{label} review failed: {error}")
+        return
+    st.write(f"**{label} Feedback:**\n{feedback}")
+    if report and report.get("triage"):
+        triage = report["triage"]
+        st.caption(
+            f"Triage ({triage['model']}, threshold {triage['threshold']}) escalated {len(triage['escalated'])} of "
+            f"{triage['sections']} sections; ~{triage['skipped_tokens']:,} section tokens were not sent to the reviewer model"
+        )
+    elif report and report.get("reused_sections"):
+        st.caption(
+            f"Reused findings for {len(report['reused_sections'])} sections near-identical to "
+            f"sections reviewed before (~{report['reused_tokens']:,} tokens saved): "
+            + "; ".join(f"{item['section']} ({item['similarity']:.0%})" for item in report["reused_sections"])
+        )
+    elif report and report.get("layout") == "shared_prefix" and report["sections"]:
+        st.caption(
+            f"Focused on {len(report['sections'])} sections; the full protocol was sent as a "
+            f"prompt prefix shared with the other agents ({report['full_tokens']:,} tokens, cacheable)"
+            + (f"; routed prompts would have sent {report['forgone_saved_tokens']:,} fewer tokens"
+               if report.get("forgone_saved_tokens") else "")
+        )
+    elif report and not report["fallback"]:
+        st.caption(
+            f"Reviewed {len(report['sections'])} routed sections: "
+            f"{report['routed_tokens']:,} of {report['full_tokens']:,} input tokens "
+            f"({report['saved_tokens']:,} saved)"
+        )
+
+
+@st.fragment(run_every=1.0)
+def review_job_progress(job_id: str):
+    """Polls a running review job and shows each agent's feedback as it streams in; reruns the page when it ends."""
+    from agents.review_jobs import ACTIVE_STATUSES, get_review_job_queue
+    job = get_review_job_queue().get(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
+    elapsed = time.time() - (job["started_at"] or job["created_at"])
+    st.info(f"Review job {job_id} is {job['status']} ({elapsed:.0f}s). "
+            f"It keeps running if you refresh or leave the page.")
+    st.subheader("Agent Review Feedback:")
+    finished = {stage["payload"]["agent"]: stage["payload"] for stage in job["stages"] if stage["stage"] == "agent"}
+    for agent_key, label in AGENT_LABELS.items():
+        if agent_key in finished:
+            payload = finished[agent_key]
+            show_agent_feedback(agent_key, payload["feedback"], payload["error"], payload.get("routing_report"))
+        elif agent_key in job["partial_feedback"]:
+            st.write(f"**{label} Feedback:**\n{job['partial_feedback'][agent_key]}")
+        else:
+            st.write(f"**{label} Feedback:** _{'waiting...' if job['status'] == 'running' else 'queued...'}_")
+    if any(stage["stage"] == "risks" for stage in job["stages"]):
+        st.write("_Scoring..._")
+    elif len(finished) == len(AGENT_LABELS):
+        st.write("_Assessing amendment risks..._")
+
+
+def show_score(label: str, score, assessment_error: str = None):
+    """Shows a protocol score, or why it wasn't computed."""
+    if score is None:
+        st.warning(f"Score not computed: the amendment risk assessment failed for some feedback "
+                   f"({assessment_error or 'unknown error'}). Re-run the review to score the protocol.")
+    else:
+        st.success(f"{label}: {score}/100")
+
+
+def show_review_result(job: dict):
+    """Renders a finished review job and records it as the baseline for amendment re-reviews."""
+    if job["error"]:
+        st.error(f"Review failed: {job['error']}")
+        return
+    result = job["result"]
+    st.subheader("Agent Review Feedback:")
+    for agent_key in AGENT_LABELS:
+        if agent_key in result["feedback"] or agent_key in result["agent_errors"]:
+            show_agent_feedback(agent_key, result["feedback"].get(agent_key), result["agent_errors"].get(agent_key),
+                                result["routing_reports"].get(agent_key))
+    st.session_state["all_feedback"] = result["feedback"]
+
+    st.subheader("Amendment Risk Assessment:")
+    for risk in result["risks"]:
+        st.write(f"- **Risk:** {risk['description']} (Severity: {risk['severity']})")
+        if risk.get("agents"):
+            st.write(f"  **Raised by:** {', '.join(AGENT_LABELS.get(a, a) for a in risk['agents'])}")
+        st.write(f"  **Rationale:** {risk['rationale']}")
+        st.write(f"  **Recommendation:** {risk['recommendation']}")
+    st.subheader("Overall Protocol Score:")
+    show_score("The protocol scored", result["score"], result["agent_errors"].get("risk_assessor"))
+
+    # Keep the reviewed protocol so section amendments only re-review what changed
+    if st.session_state.get("baseline_job_id") != job["id"]:
+        from agents.incremental_review import IncrementalReviewer
+        from utils.risk_assessor import RiskAssessor
+        from agents.review_jobs import get_review_job_queue
+        protocol_text, page_starts = get_review_job_queue().protocol(job["id"])
+        # Amendments edit this session's protocol in place, so it gets a private copy of the parsed protocol.
+        protocol_server = get_default_protocol_store().checkout(protocol_text, page_starts)
+        llm_model = job["options"]["llm_model"]
+        incremental_reviewer = IncrementalReviewer(get_review_agents(llm_model), get_shared_agent(RiskAssessor, llm_model))
+        incremental_reviewer.record_baseline(protocol_server, result["feedback"], result["risks"],
+                                             routing_reports=result["routing_reports"])
+        st.session_state["protocol_server"] = protocol_server
+        st.session_state["incremental_reviewer"] = incremental_reviewer
+        st.session_state["baseline_job_id"] = job["id"]
+
+
 st.set_page_config(layout="wide", page_title="Clinical Protocol AI Review")
 
 st.title("Clinical Protocol AI Review System")
@@ -28,18 +176,38 @@ with st.expander("Generate a New Protocol Draft"):
     # Add more parameters as needed based on your templates
 
     if st.button("Generate Protocol Draft"):
-        with st.spinner("Generating protocol draft..."):
-            protocol_generator = ProtocolGenerator(llm_model="gpt-4o") # or your preferred model
-            generated_protocol_content = protocol_generator.generate_protocol_draft(
-                study_title=study_title,
-                indication=indication,
-                objectives=objectives,
-                template_path="templates/ich_templates/ich_template_v1.md" # Placeholder
+        st.subheader("Generated Protocol Draft:")
+        # The draft renders token by token as it is generated.
+        draft_placeholder = st.empty()
+        from agents.protocol_generator import ProtocolGenerator
+        protocol_generator = get_shared_agent(ProtocolGenerator, "gpt-4o") # or your preferred model
+        generated_protocol_content = protocol_generator.generate_protocol_draft(
+            study_title=study_title,
+            indication=indication,
+            objectives=objectives,
+            template_path="templates/ich_templates/ich_template_v1.md", # Placeholder
+            on_partial=draft_placeholder.markdown
+        )
+        st.session_state["current_protocol"] = generated_protocol_content
+        st.session_state["current_protocol_page_starts"] = None
+        st.session_state["draft_inputs"] = (study_title, indication, objectives)
+        st.success("Protocol draft generated!")
+        draft_placeholder.text_area("Protocol Content", generated_protocol_content, height=400)
+
+    # Sections are drafted independently, so one can be redone without regenerating the rest.
+    if st.session_state.get("draft_inputs") and st.session_state.get("current_protocol"):
+        from agents.protocol_generator import ProtocolGenerator
+        protocol_generator = get_shared_agent(ProtocolGenerator, "gpt-4o")
+        draft_template = "templates/ich_templates/ich_template_v1.md"
+        section_to_redo = st.selectbox("Section", protocol_generator.get_template(draft_template).headings)
+        if st.button("Regenerate Section"):
+            section_placeholder = st.empty()
+            st.session_state["current_protocol"] = protocol_generator.regenerate_section(
+                st.session_state["current_protocol"], section_to_redo, *st.session_state["draft_inputs"],
+                template_path=draft_template, on_partial=section_placeholder.markdown
             )
-            st.session_state["current_protocol"] = generated_protocol_content
-            st.success("Protocol draft generated!")
-            st.subheader("Generated Protocol Draft:")
-            st.text_area("Protocol Content", generated_protocol_content, height=400)
+            st.success(f"Regenerated {section_to_redo}.")
+            section_placeholder.text_area("Protocol Content", st.session_state["current_protocol"], height=400)
 
 
 # --- Protocol Upload Section ---
@@ -47,11 +215,16 @@ st.header("2. Upload Existing Protocol")
 uploaded_file = st.file_uploader("Upload a clinical protocol (PDF, TXT, MD)", type=["pdf", "txt", "md"])
 if uploaded_file is not None:
     with st.spinner("Processing uploaded protocol..."):
+        from utils.document_processor import DocumentProcessor
         doc_processor = DocumentProcessor()
         if uploaded_file.type == "application/pdf":
-            st.session_state["current_protocol"] = doc_processor.extract_text_from_pdf(uploaded_file)
+            # Extracted text is cached by file hash, so Streamlit reruns don't re-extract the PDF.
+            document = doc_processor.extract_pdf_document(uploaded_file)
+            st.session_state["current_protocol"] = document.text
+            st.session_state["current_protocol_page_starts"] = document.page_starts
         else: # Assuming txt or md
             st.session_state["current_protocol"] = uploaded_file.read().decode("utf-8")
+            st.session_state["current_protocol_page_starts"] = None
         st.success("Protocol uploaded and processed!")
         st.subheader("Uploaded Protocol Content:")
         st.text_area("Protocol Content", st.session_state["current_protocol"], height=400)
@@ -59,49 +232,89 @@ if uploaded_file is not None:
 
 # --- Protocol Review Section ---
 st.header("3. Multi-Agent Protocol Review")
+# After a browser refresh the session is new; the job id in the URL brings its review (and protocol) back.
+if "job" in st.query_params and "review_job_id" not in st.session_state:
+    from agents.review_jobs import get_review_job_queue
+    restored_text, restored_page_starts = get_review_job_queue().protocol(st.query_params["job"])
+    if restored_text is not None:
+        st.session_state["review_job_id"] = st.query_params["job"]
+        st.session_state.setdefault("current_protocol", restored_text)
+        st.session_state.setdefault("current_protocol_page_starts", restored_page_starts)
 if "current_protocol" in st.session_state and st.session_state["current_protocol"]:
+    bypass_cache = st.checkbox("Bypass LLM response cache", value=False)
+    reuse_findings = st.checkbox(
+        "Reuse findings from near-identical sections reviewed before", value=False,
+        help="Reviews section by section; boilerplate already reviewed in another protocol is not sent again."
+    )
+    triage = st.checkbox(
+        "Triage sections with a cheap model first", value=False,
+        help="A cheap model screens each section per reviewer; only the sections it flags get a full review. "
+             "Every decision is logged to the triage audit log."
+    )
+    preflight = get_review_preflight(st.session_state["current_protocol"], "gpt-4o",
+                                     st.session_state.get("current_protocol_page_starts"))
+    chunked = {key: plan for key, plan in preflight["agents"].items() if plan["chunks"] > 1}
+    st.caption(
+        f"This review will make {preflight['chunks']} LLM calls with about {preflight['prompt_tokens']:,} prompt tokens"
+        + (f"; larger than one context window, so it is split into section-aligned chunks ("
+           + ", ".join(f"{key}: {plan['chunks']}" for key, plan in chunked.items()) + ")" if chunked else "")
+        + "."
+    )
     if st.button("Start Multi-Agent Review"):
-        with st.spinner("Agents are reviewing the protocol..."):
-            # Initialize MCP Server (to simulate structured access for agents)
-            protocol_server = ProtocolServer(st.session_state["current_protocol"])
-
-            # Initialize Agents
-            pi_agent = PIAgent(llm_model="gpt-4o")
-            site_physician_agent = SitePhysicianAgent(llm_model="gpt-4o")
-            health_authority_agent = HealthAuthorityAgent(llm_model="gpt-4o")
-
-            # Perform Reviews
-            st.subheader("Agent Review Feedback:")
-            pi_feedback = pi_agent.review_protocol(protocol_server)
-            st.write(f"**Principal Investigator Agent Feedback:**\n{pi_feedback}")
-
-            site_physician_feedback = site_physician_agent.review_protocol(protocol_server)
-            st.write(f"**Site Physician Agent Feedback:**\n{site_physician_feedback}")
-
-            health_authority_feedback = health_authority_agent.review_protocol(protocol_server)
-            st.write(f"**Health Authority Agent Feedback:**\n{health_authority_feedback}")
-
-            # Consolidate feedback (this can be done by a meta-agent or a utility)
-            all_feedback = {
-                "pi": pi_feedback,
-                "site_physician": site_physician_feedback,
-                "health_authority": health_authority_feedback
-            }
-            st.session_state["all_feedback"] = all_feedback
-
-            # Risk Assessment and Scoring
-            risk_assessor = RiskAssessor()
-            amendment_risks = risk_assessor.assess_risks(all_feedback)
-            st.subheader("Amendment Risk Assessment:")
-            for risk in amendment_risks:
-                st.write(f"- **Risk:** {risk['description']} (Severity: {risk['severity']})")
-                st.write(f"  **Rationale:** {risk['rationale']}")
-                st.write(f"  **Recommendation:** {risk['recommendation']}")
-
-            scoring_engine = ScoringEngine()
-            protocol_score = scoring_engine.score_protocol(amendment_risks)
-            st.subheader("Overall Protocol Score:")
-            st.success(f"The protocol scored: {protocol_score}/100")
+        # The review runs on the shared worker pool; reruns, refreshes and other sessions don't interrupt it.
+        from agents.review_jobs import get_review_job_queue
+        job_id = get_review_job_queue().submit(
+            st.session_state["current_protocol"],
+            page_starts=st.session_state.get("current_protocol_page_starts"),
+            llm_model="gpt-4o", bypass_cache=bypass_cache, reuse_findings=reuse_findings,
+            triage=triage
+        )
+        if reuse_findings:
+            st.session_state["findings_store_used"] = True
+        st.session_state["review_job_id"] = job_id
+        st.query_params["job"] = job_id
+
+    if st.session_state.get("review_job_id"):
+        from agents.review_jobs import ACTIVE_STATUSES, get_review_job_queue
+        review_job = get_review_job_queue().get(st.session_state["review_job_id"])
+        if review_job is None:
+            st.warning("The review job no longer exists; please start the review again.")
+        elif get_review_job_queue().protocol(review_job["id"])[0] != st.session_state["current_protocol"]:
+            pass # The protocol was replaced or amended since this review was started.
+        elif review_job["status"] in ACTIVE_STATUSES:
+            review_job_progress(review_job["id"])
+        else:
+            show_review_result(review_job)
+
+    # --- Amendment Section ---
+    if "incremental_reviewer" in st.session_state:
+        st.header("4. Amend a Section and Re-review")
+        protocol_server = st.session_state["protocol_server"]
+        incremental_reviewer = st.session_state["incremental_reviewer"]
+        section_title = st.selectbox("Section to amend", protocol_server.section_titles())
+        amended_text = st.text_area(
+            "Amended section content", protocol_server.get_section(section_title), height=200, key=f"amend_{section_title}"
+        )
+        if st.button("Apply Amendment and Re-review"):
+            with st.spinner("Re-reviewing the amended section..."):
+                protocol_server.update_section(section_title, amended_text)
+                st.session_state["current_protocol"] = protocol_server.get_all_content()
+                all_feedback = incremental_reviewer.rereview(protocol_server, bypass_cache=bypass_cache)
+                st.session_state["all_feedback"] = all_feedback
+                stats = incremental_reviewer.last_stats
+                st.caption(
+                    f"Protocol version {stats['protocol_version']}: re-reviewed {stats['sections_rereviewed']} "
+                    f"agent/section pairs; carried forward {', '.join(stats['agents_carried_forward']) or 'none'}."
+                )
+                for agent_key in stats["agents_affected"]:
+                    st.write(f"**{agent_key} updated feedback:**\n{all_feedback[agent_key]}")
+                amendment_risks = incremental_reviewer.current_risks()
+                st.subheader("Updated Amendment Risk Assessment:")
+                for risk in amendment_risks:
+                    st.write(f"- **Risk:** {risk['description']} (Severity: {risk['severity']})")
+                unassessed = [risk["rationale"] for risk in amendment_risks if risk["severity"] == "Unassessed"]
+                show_score("The amended protocol scored", ScoringEngine().score_if_assessed(amendment_risks),
+                           unassessed[0] if unassessed else None)
 
 else:
     st.info("Please generate or upload a protocol to proceed with the review.")
@@ -112,4 +325,55 @@ st.sidebar.info(
     "This is a prototype for an AI-powered clinical protocol generation and multi-agent review system. "
     "It leverages LangChain for agentic behavior and the Model Context Protocol (MCP) for structured "
     "protocol interaction."
-)
\ No newline at end of file
+)
+
+cache_stats = get_default_cache().stats()
+st.sidebar.header("LLM Response Cache")
+st.sidebar.caption(
+    f"{cache_stats['entries']} cached responses, "
+    f"{cache_stats['hits']} hits / {cache_stats['misses']} misses this session"
+)
+
+if st.session_state.get("findings_store_used"):
+    reuse_stats = get_findings_store().stats()
+    st.sidebar.header("Findings Reuse")
+    st.sidebar.caption(
+        f"{reuse_stats['entries']} reviewed sections stored; {reuse_stats['reused']} of {reuse_stats['lookups']} "
+        f"sections reused this session ({reuse_stats['reuse_rate']:.0%}), ~{reuse_stats['tokens_saved']:,} tokens saved"
+    )
+
+scheduler_metrics = get_scheduler().metrics()
+st.sidebar.header("LLM Request Scheduler")
+st.sidebar.caption(
+    f"Queue depth {scheduler_metrics['queue_depth']}, p95 wait {scheduler_metrics['wait_p95_seconds']:.1f}s, "
+    f"{scheduler_metrics['rate_limited']} rate-limited responses, {scheduler_metrics['retries']} retries"
+)
+
+guard_metrics = get_call_guard().metrics()
+st.sidebar.header("LLM Tail Latency")
+st.sidebar.caption(
+    f"Call latency p50 {guard_metrics['latency_p50_seconds']:.1f}s, p95 {guard_metrics['latency_p95_seconds']:.1f}s, "
+    f"p99 {guard_metrics['latency_p99_seconds']:.1f}s; {guard_metrics['hedged']} of {guard_metrics['calls']} calls "
+    f"hedged ({guard_metrics['hedge_rate']:.1%}), {guard_metrics['deadline_exceeded']} past their stage deadline, "
+    f"{guard_metrics['fallbacks']} sent to a fallback model"
+    + (f"; open circuits: {', '.join(guard_metrics['open_circuits'])}" if guard_metrics["open_circuits"] else "")
+)
+
+tracer = get_tracer()
+trace_summary = tracer.summary()
+st.sidebar.header("Pipeline Tracing")
+if trace_summary:
+    for stage, totals in sorted(trace_summary.items()):
+        st.sidebar.caption(
+            f"**{stage}**: {totals['runs']} runs, avg {totals['wall_avg_seconds']:.2f}s "
+            f"(p95 {totals['wall_p95_seconds']:.2f}s), queued {totals['queue_seconds']:.1f}s, "
+            f"{totals['prompt_tokens'] + totals['completion_tokens']:,} tokens "
+            f"({totals['cached_prompt_tokens']:,} prompt-cached), "
+            f"{totals['cache_hits']} cache hits, ${totals['cost_usd']:.4f}"
+        )
+    st.sidebar.download_button("Download trace (JSON lines)", tracer.to_jsonl(), file_name="trace.jsonl",
+                               mime="application/jsonl")
+    st.sidebar.download_button("Download metrics (Prometheus)", tracer.to_prometheus(),
+                               file_name="protocol_review.prom", mime="text/plain")
+else:
+    st.sidebar.caption("No pipeline stages have run yet.")
@@ -1,17 +1,219 @@
 # utils/document_processor.py
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
-from pypdf import PdfReader
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from utils.tracing import trace_stage
+
+
+DEFAULT_TEXT_CACHE_DIR = os.path.join(".cache", "pdf_text")
+PAGE_SEPARATOR = "\n"
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _open_pdf(pdf_bytes: bytes):
+    # pypdf is imported on first use so that importing this module (e.g. at app startup) stays cheap.
+    from pypdf import PdfReader
+    return PdfReader(io.BytesIO(pdf_bytes))
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> list[str]:
+    """Extracts pages [start, stop) of a PDF file."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _extract_in_subprocess(pdf_path: str, start: int, stop: int) -> list[str]:
+    """
+    Extracts pages [start, stop) in a fresh interpreter (this module's __main__).
+    The app and the batch runner have threads running, so their process isn't forked. multiprocessing's
+    spawn and forkserver re-run the main script in each worker, which under Streamlit is the whole app.
+    """
+    result = subprocess.run([sys.executable, "-m", "utils.document_processor", pdf_path, str(start), str(stop)],
+                            cwd=_REPO_ROOT, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Extracting PDF pages {start + 1}-{stop} failed: "
+                           f"{result.stderr.decode(errors='replace').strip()[-500:]}")
+    return json.loads(result.stdout)
+
+
+class ExtractedDocument:
+    """
+    Text of a PDF with the offset where each page starts, so text offsets map back to source pages.
+    """
+    def __init__(self, pages: list[str]):
+        self.pages = pages
+        self.page_starts = []
+        offset = 0
+        for page_text in pages:
+            self.page_starts.append(offset)
+            offset += len(page_text) + len(PAGE_SEPARATOR)
+        self.text = PAGE_SEPARATOR.join(pages)
+
+    def page_for_offset(self, offset: int) -> int:
+        """Returns the 1-based page number containing the given text offset."""
+        return max(1, bisect_right(self.page_starts, offset))
 
 
 class DocumentProcessor:
+    def __init__(self, cache_dir: str = None, workers: int = None, parallel_min_pages: int = 40,
+                 pages_per_task: int = 25, max_cached_documents: int = 500, max_cache_bytes: int = 200 * 1024 * 1024,
+                 max_cache_age_seconds: float = 30 * 24 * 3600):
+        """
+        Args:
+            cache_dir: Directory for extracted text, keyed by file hash. Defaults to $PDF_TEXT_CACHE_DIR or .cache/pdf_text.
+            workers: Processes used for parallel extraction, at most the CPU count. Defaults to the CPU count.
+            parallel_min_pages: Documents with at least this many pages are extracted in parallel, if more
+                                than one CPU is available.
+            pages_per_task: Size of the page ranges handed to each worker.
+            max_cached_documents: Cached documents kept before least-recently-used eviction.
+            max_cache_bytes: Total size of cached text kept before least-recently-used eviction.
+            max_cache_age_seconds: Cached documents not read for this long are evicted.
+        """
+        self.cache_dir = cache_dir or os.getenv("PDF_TEXT_CACHE_DIR", DEFAULT_TEXT_CACHE_DIR)
+        self.workers = min(workers or os.cpu_count() or 1, os.cpu_count() or 1)
+        self.parallel_min_pages = parallel_min_pages
+        self.pages_per_task = pages_per_task
+        self.max_cached_documents = max_cached_documents
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_age_seconds = max_cache_age_seconds
+
+    @staticmethod
+    def _read_bytes(file_buffer) -> bytes:
+        if hasattr(file_buffer, "getvalue"):
+            return file_buffer.getvalue()
+        data = file_buffer.read()
+        file_buffer.seek(0)
+        return data
+
+    def _cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.json")
+
+    def _load_cached_pages(self, file_hash: str):
+        path = self._cache_path(file_hash)
+        try:
+            with open(path, "r") as f:
+                pages = json.load(f)["pages"]
+            # The modification time records the last read, for eviction.
+            os.utime(path)
+            return pages
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store_cached_pages(self, file_hash: str, pages: list[str]):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._cache_path(file_hash) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"pages": pages}, f)
+            os.replace(tmp_path, self._cache_path(file_hash))
+            self.evict_cache()
+        except OSError as e:
+            print(f"Warning: could not cache extracted PDF text: {e}")
+
+    def evict_cache(self):
+        """
+        Deletes cached documents not read within max_cache_age_seconds, then the least recently read ones
+        until the cache fits max_cached_documents and max_cache_bytes.
+        """
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        entries.sort()
+        cutoff = time.time() - self.max_cache_age_seconds
+        count, total_bytes = len(entries), sum(size for _, size, _ in entries)
+        for last_read, size, path in entries:
+            if last_read >= cutoff and count <= self.max_cached_documents and total_bytes <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            total_bytes -= size
+
+    def iter_pdf_pages(self, pdf_file_buffer):
+        """
+        Streams (page_number, text) pairs from a PDF file buffer, one page at a time.
+        Page numbers are 1-based. Served from the extracted-text cache when the file was seen before.
+        """
+        pdf_bytes = self._read_bytes(pdf_file_buffer)
+        cached = self._load_cached_pages(hashlib.sha256(pdf_bytes).hexdigest())
+        if cached is not None:
+            yield from enumerate(cached, start=1)
+            return
+        reader = _open_pdf(pdf_bytes)
+        for page_number, page in enumerate(reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+
+    def extract_pdf_document(self, pdf_file_buffer, parallel: bool = None) -> ExtractedDocument:
+        """
+        Extracts a PDF into an ExtractedDocument, using the file-hash cache and, for long documents on
+        machines with more than one CPU, worker processes that extract page ranges in parallel.
+        Args:
+            pdf_file_buffer: A binary file-like object.
+            parallel: Force (True) or disable (False) parallel extraction. By default it is used
+                      for documents with at least parallel_min_pages pages when workers > 1; on one CPU
+                      the worker start-up makes it slower than extracting in-process.
+        """
+        with trace_stage("document_processor.extract_pdf") as span:
+            pdf_bytes = self._read_bytes(pdf_file_buffer)
+            file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+            pages = self._load_cached_pages(file_hash)
+            span.attributes["cached"] = pages is not None
+            if pages is not None:
+                span.attributes["pages"] = len(pages)
+                return ExtractedDocument(pages)
+
+            page_count = len(_open_pdf(pdf_bytes).pages)
+            span.attributes["pages"] = page_count
+            if parallel is None:
+                parallel = page_count >= self.parallel_min_pages and self.workers > 1
+            if parallel and page_count > self.pages_per_task:
+                ranges = [(start, min(start + self.pages_per_task, page_count))
+                          for start in range(0, page_count, self.pages_per_task)]
+                # Workers read the PDF from one temporary file instead of each receiving a copy of its bytes.
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                    f.write(pdf_bytes)
+                try:
+                    with ThreadPoolExecutor(max_workers=min(self.workers, len(ranges))) as executor:
+                        chunks = executor.map(_extract_in_subprocess, [f.name] * len(ranges),
+                                              [r[0] for r in ranges], [r[1] for r in ranges])
+                        pages = [page_text for chunk in chunks for page_text in chunk]
+                finally:
+                    os.remove(f.name)
+            else:
+                pages = [text for _, text in self.iter_pdf_pages(io.BytesIO(pdf_bytes))]
+
+            self._store_cached_pages(file_hash, pages)
+            return ExtractedDocument(pages)
+
     def extract_text_from_pdf(self, pdf_file_buffer: io.BytesIO) -> str:
         """Extracts text from a PDF file buffer."""
-        reader = PdfReader(pdf_file_buffer)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        return self.extract_pdf_document(pdf_file_buffer).text
 
     def process_text_file(self, text_file_buffer: io.StringIO) -> str:
         """Reads text from a text file buffer."""
-        return text_file_buffer.read()
\ No newline at end of file
+        with trace_stage("document_processor.read_text"):
+            return text_file_buffer.read()
+
+
+if __name__ == "__main__":
+    # Worker for parallel extraction: python -m utils.document_processor PDF_PATH START STOP
+    json.dump(_extract_page_range(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])), sys.stdout)
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from utils.token_counter import count_tokens
+
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "findings_store.sqlite3")
+
+# Reuse modes. REUSE skips the LLM for a near-duplicate section stating the same numbers and carries its
+# findings over (other near-duplicates are reviewed with the earlier findings as context);
+# CONTEXT always reviews the section and passes the earlier findings to the agent.
+REUSE = "reuse"
+CONTEXT = "context"
+
+NUM_PERMUTATIONS = 128
+SHINGLE_WORDS = 5
+_MERSENNE_PRIME = (1 << 31) - 1
+# Fixed seed: signatures are persisted, so the permutations must be identical in every process.
+_rng = np.random.RandomState(20240611)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+_HEADING_NUMBER_RE = re.compile(r'(?m)^[ \t#*]*\d+(?:\.\d+)*\.?[ \t]+')
+
+
+def normalize_section_text(text: str) -> str:
+    """
+    Lowercased words only, with heading numbers removed, so the same boilerplate numbered
+    "7. Safety Reporting" in one protocol and "8. Safety Reporting" in another fingerprints alike.
+    """
+    return " ".join(re.findall(r'[a-z0-9]+', _HEADING_NUMBER_RE.sub('', text).lower()))
+
+
+def numbers_fingerprint(text: str) -> str:
+    """
+    Hash of the numbers stated in a section (doses, visit days, windows), without heading numbers.
+    Shingle similarity barely moves when one dose changes, so reuse also requires equal numbers.
+    """
+    numbers = sorted(re.findall(r'\d+(?:[.,]\d+)?', _HEADING_NUMBER_RE.sub('', text)))
+    return hashlib.sha256(" ".join(numbers).encode("utf-8")).hexdigest()[:16]
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERMUTATIONS uint32 values) of the section's word shingles. The fraction of
+    equal positions between two signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    words = normalize_section_text(text).split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                         count=len(shingles))
+    # a * h + b stays below 2**63 because a < 2**31 and h < 2**32.
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+class FindingsStore:
+    def __init__(self, path: str = None, threshold: float = None, mode: str = None, max_entries: int = 50000):
+        """
+        Persistent store of reviewed protocol sections: their MinHash fingerprints, the findings an agent
+        produced for them and the amendment risks assessed from those findings. Lookups compare a
+        section's signature against every stored signature of the same agent/prompt at once in NumPy.
+        Args:
+            path: Location of the SQLite file. Defaults to $FINDINGS_STORE_PATH or .cache/findings_store.sqlite3.
+            threshold: Estimated Jaccard similarity (0-1) at which a stored section counts as a near-duplicate.
+                       Defaults to $FINDINGS_REUSE_THRESHOLD or 0.9.
+            mode: REUSE or CONTEXT. Defaults to $FINDINGS_REUSE_MODE or REUSE.
+            max_entries: Maximum stored sections before the oldest are evicted.
+        """
+        self.path = path or os.getenv("FINDINGS_STORE_PATH", DEFAULT_STORE_PATH)
+        self.threshold = threshold if threshold is not None else float(os.getenv("FINDINGS_REUSE_THRESHOLD", "0.9"))
+        self.mode = mode or os.getenv("FINDINGS_REUSE_MODE", REUSE)
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.matches = 0
+        self.reused = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reviewed_sections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agent_key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                template_version TEXT NOT NULL,
+                section_title TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                numbers_hash TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                findings TEXT NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                risks TEXT,
+                created_at REAL NOT NULL,
+                UNIQUE (agent_key, model, template_version, content_hash)
+            )
+            """
+        )
+        self._conn.commit()
+        # (agent_key, model, template_version) -> (row ids, signature matrix), loaded on first lookup.
+        self._signatures = {}
+
+    @staticmethod
+    def signature(text: str) -> np.ndarray:
+        """MinHash signature of a section, to compute once and pass to find_similar and add."""
+        return minhash_signature(text)
+
+    def _load_group_locked(self, group: tuple):
+        if group not in self._signatures:
+            rows = self._conn.execute(
+                "SELECT id, signature FROM reviewed_sections WHERE agent_key = ? AND model = ? AND template_version = ?",
+                group,
+            ).fetchall()
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            matrix = (np.vstack([np.frombuffer(row[1], dtype=np.uint32) for row in rows]) if rows
+                      else np.empty((0, NUM_PERMUTATIONS), dtype=np.uint32))
+            self._signatures[group] = (ids, matrix)
+        return self._signatures[group]
+
+    def find_similar(self, agent_key: str, model: str, template_version: str, text: str, signature=None):
+        """
+        Returns the most similar stored section for the agent and prompt version as a dict
+        (id, section_title, similarity, numbers_match, findings, risks, prompt_tokens, completion_tokens),
+        or None if nothing reaches the threshold. numbers_match is False if the sections state different
+        numbers, in which case the match should only be used as context.
+        """
+        signature = minhash_signature(text) if signature is None else signature
+        with self._lock:
+            self.lookups += 1
+            ids, matrix = self._load_group_locked((agent_key, model, template_version))
+            if not len(ids):
+                return None
+            similarities = (matrix == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+            row = self._conn.execute(
+                "SELECT id, section_title, findings, risks, prompt_tokens, completion_tokens, numbers_hash "
+                "FROM reviewed_sections WHERE id = ?", (int(ids[best]),)
+            ).fetchone()
+            if row is None:
+                return None
+            self.matches += 1
+        return {
+            "id": row[0],
+            "section_title": row[1],
+            "similarity": round(float(similarities[best]), 4),
+            "numbers_match": row[6] == numbers_fingerprint(text),
+            "findings": row[2],
+            "risks": json.loads(row[3]) if row[3] is not None else None,
+            "prompt_tokens": row[4],
+            "completion_tokens": row[5],
+        }
+
+    def add(self, agent_key: str, model: str, template_version: str, section_title: str, text: str,
+            findings: str, risks: list = None, signature=None) -> int:
+        """
+        Stores an agent's findings for a section and returns the entry id. Re-adding identical content
+        for the same agent and prompt replaces the earlier entry.
+        """
+        signature = minhash_signature(text) if signature is None else signature
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        group = (agent_key, model, template_version)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM reviewed_sections WHERE agent_key = ? AND model = ? AND template_version = ? "
+                "AND content_hash = ?", group + (content_hash,)
+            )
+            cursor = self._conn.execute(
+                "INSERT INTO reviewed_sections (agent_key, model, template_version, section_title, content_hash, "
+                "numbers_hash, signature, prompt_tokens, findings, completion_tokens, risks, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                group + (section_title, content_hash, numbers_fingerprint(text), signature.astype(np.uint32).tobytes(), count_tokens(text, model),
+                         findings, count_tokens(findings, model),
+                         json.dumps(risks) if risks is not None else None, time.time()),
+            )
+            self._evict_locked()
+            self._conn.commit()
+            # Reload the group on its next lookup rather than patching the matrix in place.
+            self._signatures.pop(group, None)
+            return cursor.lastrowid
+
+    def attach_risks(self, entry_id: int, risks: list):
+        """Records the amendment risks assessed from a stored entry's findings."""
+        with self._lock:
+            self._conn.execute("UPDATE reviewed_sections SET risks = ? WHERE id = ?", (json.dumps(risks), entry_id))
+            self._conn.commit()
+
+    def record_reuse(self, tokens_saved: int):
+        """Counts a lookup whose stored findings were used instead of an LLM call."""
+        with self._lock:
+            self.reused += 1
+            self.tokens_saved += tokens_saved
+
+    def _evict_locked(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM reviewed_sections").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM reviewed_sections WHERE id IN "
+                "(SELECT id FROM reviewed_sections ORDER BY created_at ASC LIMIT ?)", (count - self.max_entries,)
+            )
+            self._signatures.clear()
+
+    def clear(self):
+        """Removes every stored section and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM reviewed_sections")
+            self._conn.commit()
+            self._signatures.clear()
+            self.lookups = self.matches = self.reused = self.tokens_saved = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the lookup counters, the reuse rate (reused sections / lookups), tokens saved and
+        the number of stored sections.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM reviewed_sections").fetchone()[0]
+        return {
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "reused": self.reused,
+            "reuse_rate": self.reused / self.lookups if self.lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "entries": entries,
+        }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_findings_store() -> FindingsStore:
+    """
+    Returns the process-wide findings store.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FindingsStore()
+        return _default_store
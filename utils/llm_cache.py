@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_cache.sqlite3")
+
+
+class LLMCache:
+    def __init__(self, path: str = None, max_entries: int = 5000, max_bytes: int = 200 * 1024 * 1024,
+                 max_age_seconds: float = 30 * 24 * 3600):
+        """
+        Persistent, content-addressed cache of LLM responses backed by SQLite.
+        Args:
+            path: Location of the SQLite file. Defaults to $LLM_CACHE_PATH or .cache/llm_cache.sqlite3.
+            max_entries: Maximum number of cached responses before least-recently-used eviction.
+            max_bytes: Maximum total size of cached responses before least-recently-used eviction.
+            max_age_seconds: Responses older than this are treated as misses and evicted.
+        """
+        self.path = path or os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str, template_version: str) -> str:
+        """
+        Builds the cache key from everything that determines a completion.
+        """
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "prompt": prompt, "template_version": template_version},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached response for key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str):
+        """
+        Stores a response and evicts old or excess entries.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def invalidate(self, key: str):
+        """Removes a single entry, e.g. a response that later failed validation."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def evict(self):
+        """Applies age- and size-based eviction."""
+        with self._lock:
+            self._evict_locked(time.time())
+            self._conn.commit()
+
+    def _evict_locked(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        # Drop least recently used entries until both limits are satisfied.
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total_bytes -= size
+
+    def clear(self):
+        """Removes every cached response and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current size of the cache.
+        """
+        with self._lock:
+            count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total_bytes,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> LLMCache:
+    """
+    Returns the process-wide cache shared by all agents, RiskAssessor and ProtocolGenerator.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
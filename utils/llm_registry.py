@@ -0,0 +1,74 @@
+from langchain_openai import ChatOpenAI
+from langchain.prompts import PromptTemplate
+import httpx
+import os
+import threading
+
+
+# One keep-alive connection pool per process, so TLS handshakes happen once rather than per review.
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_lock = threading.RLock()
+_http_client = None
+_http_async_client = None
+_chat_models = {}
+_prompts = {}
+_agents = {}
+
+
+def get_http_clients():
+    """
+    Returns the process-wide (sync, async) httpx clients shared by every ChatOpenAI instance.
+    """
+    global _http_client, _http_async_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+            _http_async_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        return _http_client, _http_async_client
+
+
+def get_chat_model(model: str = "gpt-4o", temperature: float = 0.5) -> ChatOpenAI:
+    """
+    Returns the shared ChatOpenAI client for a model and temperature.
+    Retries are owned by the shared RequestScheduler (utils/rate_limiter.py), not the client.
+    """
+    key = (model, temperature)
+    with _lock:
+        if key not in _chat_models:
+            http_client, http_async_client = get_http_clients()
+            _chat_models[key] = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                # Streamed responses then report real (and prompt-cached) token usage too.
+                stream_usage=True,
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
+        return _chat_models[key]
+
+
+def get_prompt(template: str, input_variables: list) -> PromptTemplate:
+    """
+    Returns a PromptTemplate compiled once per process for the given template text.
+    """
+    key = (template, tuple(input_variables))
+    with _lock:
+        if key not in _prompts:
+            _prompts[key] = PromptTemplate(template=template, input_variables=list(input_variables))
+        return _prompts[key]
+
+
+def get_agent(agent_cls, llm_model: str = "gpt-4o"):
+    """
+    Returns the shared instance of an agent class (a reviewer agent, RiskAssessor or ProtocolGenerator)
+    for a model. Agents are stateless between calls, so one instance can serve concurrent reviews.
+    """
+    key = (agent_cls, llm_model)
+    with _lock:
+        if key not in _agents:
+            _agents[key] = agent_cls(llm_model=llm_model)
+        return _agents[key]
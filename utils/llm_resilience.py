@@ -0,0 +1,505 @@
+"""
+Tail-latency controls for LLM calls: stage deadlines, hedged requests and per-model circuit breakers.
+
+run_chain and run_structured (utils/llm_runner.py) send every uncached call through the process-wide
+CallGuard:
+- Deadlines: a stage sets a time budget with stage_deadline("agent"). Calls inside the block, including
+  those from worker threads started with submit_with_context, give up with DeadlineExceeded once it runs out.
+- Hedging: if a call has not answered after the recent p95 latency of its stage and model, a duplicate
+  request is sent and the first answer wins. A streamed call is hedged on time to first token instead: the
+  first of the two streams to produce a token is the one shown, and the other is abandoned. Latency is
+  measured from the moment the request scheduler admits a request, so time spent queued doesn't count.
+- Circuit breaking: after consecutive failures (or calls slower than LLM_SLOW_CALL_SECONDS) a model's
+  circuit opens. Calls then go straight to its fallback model, or fail fast if it has none, until a
+  probe call succeeds.
+
+Configured from the environment, e.g.:
+    LLM_STAGE_DEADLINES="agent=300,risk_assessment=120,draft_section=180"
+    LLM_HEDGING=1 LLM_HEDGE_QUANTILE=0.95 LLM_HEDGE_MIN_DELAY=2
+    LLM_FALLBACK_MODELS="gpt-4o=gpt-4o-mini"
+    LLM_BREAKER_FAILURES=5 LLM_BREAKER_RESET_SECONDS=30
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import contextvars
+import math
+import os
+import threading
+import time
+from utils.rate_limiter import is_retryable
+from utils.tracing import current_span
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage's time budget runs out before an LLM call answers."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a model's circuit is open and no fallback model can take the call."""
+
+
+class StreamSuperseded(RuntimeError):
+    """Raised in a streamed attempt whose hedge (or original) produced a token first; its stream is abandoned."""
+
+
+def parse_mapping(value: str, cast=str) -> dict:
+    """Parses "a=1,b=2" into {"a": cast("1"), "b": cast("2")}; blank entries are ignored."""
+    mapping = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, _, raw = item.partition("=")
+            mapping[key.strip()] = cast(raw.strip())
+    return mapping
+
+
+# Seconds each stage may spend on its LLM calls. An agent's budget covers all its chunk, section and
+# triage calls; a risk assessment's covers every agent's extraction.
+DEFAULT_STAGE_DEADLINES = {"agent": 300.0, "risk_assessment": 120.0, "draft_section": 180.0}
+STAGE_DEADLINES = {**DEFAULT_STAGE_DEADLINES, **parse_mapping(os.getenv("LLM_STAGE_DEADLINES", ""), float)}
+
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float = None):
+    """
+    Limits LLM calls made inside the block to `seconds` from now. Nested deadlines never extend an
+    enclosing one; None or 0 sets no limit.
+    """
+    at = _deadline.get()
+    if seconds:
+        at = min(at, time.monotonic() + seconds) if at is not None else time.monotonic() + seconds
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def stage_deadline(stage: str):
+    """Applies the configured deadline of a stage ("agent", "risk_assessment", "draft_section")."""
+    return deadline(STAGE_DEADLINES.get(stage))
+
+
+def current_deadline():
+    """Returns the time.monotonic() deadline of the current context, or None."""
+    return _deadline.get()
+
+
+def call_before(deadline_at, fn):
+    """
+    Runs fn(timeout) with the seconds left before deadline_at (None if there is no deadline).
+    Raises DeadlineExceeded if the deadline has passed, before or during the call.
+    """
+    if deadline_at is None:
+        return fn(None)
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Stage deadline passed before the LLM call could be made")
+    try:
+        return fn(remaining)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if time.monotonic() >= deadline_at:
+            raise DeadlineExceeded(f"LLM call did not answer before the stage deadline ({type(e).__name__})") from e
+        raise
+
+
+class _Race:
+    """The attempts of one guarded call; for a streamed call, the first to produce a token owns the stream."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owner = None
+
+
+class _AttemptState:
+    """Timing of one attempt. Its latency counts from admission by the request scheduler, not from submission."""
+    def __init__(self, race: _Race, clock, on_first_token=None):
+        self.race = race
+        self._clock = clock
+        self.submitted_at = clock()
+        self.admitted_at = None
+        self._on_first_token = on_first_token
+
+    def admit(self):
+        # A retried request is re-admitted; its latency counts from the last admission.
+        self.admitted_at = self._clock()
+
+    @property
+    def started_at(self) -> float:
+        return self.admitted_at if self.admitted_at is not None else self.submitted_at
+
+    def claim(self):
+        with self.race.lock:
+            first = self.race.owner is None
+            if first:
+                self.race.owner = self
+            elif self.race.owner is not self:
+                raise StreamSuperseded("Another attempt of this call is already streaming")
+        if first and self._on_first_token is not None:
+            self._on_first_token(self._clock() - self.started_at)
+
+
+_attempt_state = contextvars.ContextVar("llm_attempt", default=None)
+
+
+def mark_admitted():
+    """
+    Tells the call guard that the current attempt's request was admitted by the request scheduler; call it
+    from the scheduler's on_admitted callback. The attempt's latency and hedge timer start here.
+    """
+    state = _attempt_state.get()
+    if state is not None:
+        state.admit()
+
+
+def claim_stream():
+    """
+    Called by a streamed attempt before it passes partial text on. The first attempt of a call to do so
+    owns the stream.
+    Raises:
+        StreamSuperseded: If another attempt of the same call (its hedge, or the original) owns it.
+    """
+    state = _attempt_state.get()
+    if state is not None:
+        state.claim()
+
+
+def _percentile(samples, quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)] if ordered else 0.0
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        """
+        Opens after failure_threshold consecutive failures. After reset_timeout seconds one probe call
+        is let through (half-open): its success closes the circuit, its failure opens it again.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def _refresh_locked(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_locked()
+            return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go to the model now."""
+        with self._lock:
+            self._refresh_locked()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """Ends a call that neither succeeded nor failed (e.g. abandoned at the caller's deadline)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+
+# How often a race checks whether its first attempt has been admitted, to start the hedge timer.
+ADMISSION_POLL_SECONDS = 0.05
+
+_COUNTERS = ("calls", "hedged", "hedge_wins", "fallbacks", "deadline_exceeded", "failures", "fast_failures")
+
+
+class CallGuard:
+    def __init__(self, hedging: bool = True, hedge_quantile: float = 0.95, hedge_min_delay: float = 2.0,
+                 hedge_min_samples: int = 20, fallback_models: dict = None, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, slow_call_seconds: float = None, window: int = 500,
+                 max_workers: int = 128, clock=time.monotonic):
+        """
+        Args:
+            hedging: Send a duplicate of slow calls (of streamed calls, slow to produce their first token).
+            hedge_quantile: Latency (or, when streamed, time to first token) quantile of recent calls of the
+                            same stage and model after which to hedge.
+            hedge_min_delay: Never hedge sooner than this many seconds.
+            hedge_min_samples: Calls of a stage and model needed before its calls are hedged.
+            fallback_models: {model: fallback model} used while a model's circuit is open or its call failed.
+            failure_threshold, reset_timeout: CircuitBreaker settings, per model.
+            slow_call_seconds: Successful calls slower than this count as failures for the circuit breaker.
+            window: Latencies kept per stage and model for the hedge delay and percentiles.
+            max_workers: Threads for hedged attempts; attempts abandoned at a deadline or beaten by a hedge
+                         finish in the background.
+            clock: Injectable for tests.
+        """
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback_models = dict(fallback_models or {})
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-attempt")
+        self._attempt_latencies = {}
+        self._call_latencies = {}
+        self._breakers = {}
+        self._counts = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout, clock=self._clock)
+            return self._breakers[model]
+
+    def _count(self, model: str, counter: str):
+        with self._lock:
+            self._counts.setdefault(model, dict.fromkeys(_COUNTERS, 0))[counter] += 1
+
+    def _record(self, latencies: dict, key, seconds: float):
+        with self._lock:
+            latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, stage: str, model: str, streamed: bool = False):
+        """
+        Seconds after admission after which a call of this stage and model is hedged, or None if it isn't.
+        For a streamed call, the delay applies to its first token.
+        """
+        if not self.hedging:
+            return None
+        with self._lock:
+            samples = list(self._attempt_latencies.get((stage, model, streamed), ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, _percentile(samples, self.hedge_quantile))
+
+    def call(self, model: str, attempt, hedge: bool = True, streamed: bool = False):
+        """
+        Runs attempt(model, deadline_at) under the current deadline, hedging and the model's circuit breaker.
+        attempt makes one request (through the scheduler) to the given model. It should call mark_admitted
+        once the scheduler admits the request (until then it isn't hedged), and, where it can, pass the time
+        left before deadline_at (time.monotonic(), or None) to the HTTP client, e.g. with call_before, so
+        abandoned requests are closed too.
+        Args:
+            hedge: False for calls that must not be duplicated. These run in the calling thread, so the
+                   attempt itself must enforce the deadline.
+            streamed: The attempt streams partial text to a callback, from a worker thread if hedged. It must
+                      call claim_stream before each update, so that of a hedged pair only the stream that
+                      produced a token first is passed on.
+        Returns:
+            (result, model that answered)
+        Raises:
+            DeadlineExceeded, CircuitOpenError, or the last attempt's error.
+        """
+        span = current_span()
+        stage = span.name if span is not None else "llm"
+        fallback = self.fallback_models.get(model)
+        if self.breaker(model).allow():
+            try:
+                return self._call_model(model, attempt, stage, hedge, streamed), model
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if fallback is None or not is_retryable(e) or not self.breaker(fallback).allow():
+                    raise
+                print(f"LLM call to {model} failed ({type(e).__name__}); retrying on fallback model {fallback}.")
+        elif fallback is None or not self.breaker(fallback).allow():
+            self._count(model, "fast_failures")
+            raise CircuitOpenError(f"Circuit for {model} is open and no fallback model is available")
+        self._count(model, "fallbacks")
+        return self._call_model(fallback, attempt, stage, hedge, streamed), fallback
+
+    def _call_model(self, model: str, attempt, stage: str, hedge: bool, streamed: bool):
+        self._count(model, "calls")
+        breaker = self.breaker(model)
+        deadline_at = _deadline.get()
+        start = self._clock()
+        try:
+            if hedge:
+                result = self._race(model, attempt, stage, deadline_at, self.hedge_delay(stage, model, streamed),
+                                    streamed)
+            else:
+                state = self._new_attempt(_Race(), stage, model, streamed)
+                result = self._attempt(model, attempt, stage, deadline_at, state, streamed)
+        except DeadlineExceeded:
+            # The caller's time budget ran out; that says nothing about the model's health.
+            self._count(model, "deadline_exceeded")
+            breaker.release()
+            raise
+        except Exception as e:
+            self._count(model, "failures")
+            # Invalid requests or outputs say nothing about the model's health.
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        elapsed = self._clock() - start
+        self._record(self._call_latencies, model, elapsed)
+        if self.slow_call_seconds and elapsed > self.slow_call_seconds:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return result
+
+    def _new_attempt(self, race: _Race, stage: str, model: str, streamed: bool) -> _AttemptState:
+        on_first_token = None
+        if streamed:
+            on_first_token = lambda seconds: self._record(self._attempt_latencies, (stage, model, True), seconds)
+        return _AttemptState(race, self._clock, on_first_token)
+
+    def _attempt(self, model: str, attempt, stage: str, deadline_at, state: _AttemptState, streamed: bool):
+        token = _attempt_state.set(state)
+        try:
+            result = attempt(model, deadline_at)
+        finally:
+            _attempt_state.reset(token)
+        if not streamed:
+            self._record(self._attempt_latencies, (stage, model, False), self._clock() - state.started_at)
+        return result
+
+    def _race(self, model: str, attempt, stage: str, deadline_at, delay, streamed: bool):
+        """
+        Runs the attempt on a worker thread until deadline_at, hedged once the first attempt has been admitted
+        for delay seconds (never if None). A streamed call is only hedged while neither attempt has produced a
+        token, and the attempt that produced the first token is the one whose result counts.
+        """
+        race = _Race()
+
+        def submit():
+            state = self._new_attempt(race, stage, model, streamed)
+            # Each attempt runs in its own copy of the caller's context (usage scope, span, priority).
+            context = contextvars.copy_context()
+            return state, self._executor.submit(context.run, self._attempt, model, attempt, stage, deadline_at,
+                                                state, streamed)
+
+        first_state, first = submit()
+        states = {first: first_state}
+        pending = {first}
+        hedged = delay is None
+        errors = []
+        while pending:
+            now = self._clock()
+            hedge_at = None
+            if not hedged and race.owner is None:
+                # The hedge timer starts when the scheduler admits the first attempt, not while it is queued.
+                admitted_at = first_state.admitted_at
+                hedge_at = admitted_at + delay if admitted_at is not None else now + ADMISSION_POLL_SECONDS
+            limits = [limit - now for limit in (deadline_at, hedge_at) if limit is not None]
+            done, pending = wait(pending, timeout=max(0.0, min(limits)) if limits else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count(model, "hedge_wins")
+                    return future.result()
+                if race.owner is states[future]:
+                    # The stream being shown failed; the abandoned one can't take over.
+                    raise future.exception()
+                errors.append(future.exception())
+            now = self._clock()
+            if pending and deadline_at is not None and now >= deadline_at:
+                raise DeadlineExceeded(f"{model} did not answer before the stage deadline")
+            if (pending and not hedged and race.owner is None and first_state.admitted_at is not None
+                    and now >= first_state.admitted_at + delay):
+                hedged = True
+                self._count(model, "hedged")
+                hedge_state, hedge = submit()
+                states[hedge] = hedge_state
+                pending.add(hedge)
+        raise next((error for error in errors if not isinstance(error, StreamSuperseded)), errors[0])
+
+    def metrics(self) -> dict:
+        """
+        Returns per-model counters (calls, hedged, hedge_wins, fallbacks taken from the model,
+        deadline_exceeded, failures, fast_failures), hedge rate, circuit state and latency percentiles,
+        plus totals over all models.
+        """
+        with self._lock:
+            counts = {model: dict(values) for model, values in self._counts.items()}
+            latencies = {model: list(samples) for model, samples in self._call_latencies.items()}
+            breakers = dict(self._breakers)
+        models = {}
+        for model in sorted(set(counts) | set(latencies) | set(breakers)):
+            values = counts.get(model, dict.fromkeys(_COUNTERS, 0))
+            samples = latencies.get(model, [])
+            models[model] = dict(
+                values,
+                hedge_rate=values["hedged"] / values["calls"] if values["calls"] else 0.0,
+                circuit=breakers[model].state if model in breakers else CLOSED,
+                circuit_opened=breakers[model].opened if model in breakers else 0,
+                latency_p50_seconds=_percentile(samples, 0.50),
+                latency_p95_seconds=_percentile(samples, 0.95),
+                latency_p99_seconds=_percentile(samples, 0.99),
+            )
+        all_samples = [seconds for samples in latencies.values() for seconds in samples]
+        totals = {counter: sum(values[counter] for values in models.values()) for counter in _COUNTERS}
+        return dict(
+            totals,
+            hedge_rate=totals["hedged"] / totals["calls"] if totals["calls"] else 0.0,
+            open_circuits=[model for model, values in models.items() if values["circuit"] != CLOSED],
+            latency_p50_seconds=_percentile(all_samples, 0.50),
+            latency_p95_seconds=_percentile(all_samples, 0.95),
+            latency_p99_seconds=_percentile(all_samples, 0.99),
+            models=models,
+        )
+
+
+_default_guard = None
+_default_guard_lock = threading.Lock()
+
+
+def get_call_guard() -> CallGuard:
+    """
+    Returns the process-wide call guard, configured from $LLM_HEDGING, $LLM_HEDGE_QUANTILE,
+    $LLM_HEDGE_MIN_DELAY, $LLM_FALLBACK_MODELS, $LLM_BREAKER_FAILURES, $LLM_BREAKER_RESET_SECONDS
+    and $LLM_SLOW_CALL_SECONDS.
+    """
+    global _default_guard
+    with _default_guard_lock:
+        if _default_guard is None:
+            slow_call_seconds = os.getenv("LLM_SLOW_CALL_SECONDS")
+            _default_guard = CallGuard(
+                hedging=os.getenv("LLM_HEDGING", "1") != "0",
+                hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+                hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "2")),
+                fallback_models=parse_mapping(os.getenv("LLM_FALLBACK_MODELS", "")),
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+                slow_call_seconds=float(slow_call_seconds) if slow_call_seconds else None,
+            )
+        return _default_guard
@@ -0,0 +1,286 @@
+from contextlib import contextmanager
+import contextvars
+import json
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from utils.llm_cache import LLMCache, get_default_cache
+from utils.llm_registry import get_chat_model
+from utils.llm_resilience import DeadlineExceeded, call_before, claim_stream, get_call_guard, mark_admitted
+from utils.rate_limiter import get_scheduler
+from utils.token_counter import count_tokens
+from utils.tracing import record_cache_hit, record_llm_call, record_queue_time
+
+
+class TokenUsage:
+    """
+    Thread-safe tally of LLM calls and tokens (as reported by the API, or tiktoken-estimated when it doesn't report them).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int = 0, completion_tokens: int = 0, cache_hit: bool = False,
+            cached_prompt_tokens: int = 0):
+        with self._lock:
+            if cache_hit:
+                self.cache_hits += 1
+            else:
+                self.calls += 1
+                self.prompt_tokens += prompt_tokens
+                self.cached_prompt_tokens += cached_prompt_tokens
+                self.completion_tokens += completion_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+
+# Usage for the whole process, plus an optional per-scope tally (e.g. one protocol in a batch run).
+global_usage = TokenUsage()
+_usage_scope = contextvars.ContextVar("llm_usage_scope", default=None)
+
+
+@contextmanager
+def track_usage():
+    """
+    Collects the token usage of every run_chain call made inside the block, including calls
+    made from worker threads started with submit_with_context.
+    """
+    usage = TokenUsage()
+    token = _usage_scope.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_scope.reset(token)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """
+    Submits fn to an executor so it runs with the caller's context (usage scope and the like).
+    """
+    context = contextvars.copy_context()
+    return executor.submit(context.run, fn, *args, **kwargs)
+
+
+def _record_usage(**kwargs):
+    global_usage.add(**kwargs)
+    scope = _usage_scope.get()
+    if scope is not None:
+        scope.add(**kwargs)
+
+
+class _UsageCallback(BaseCallbackHandler):
+    """
+    Captures the token usage the API reports for one request, including prompt tokens served from
+    the provider's prompt cache. If a response carries no usage, the caller falls back to tiktoken estimates.
+    """
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            self.prompt_tokens = usage.get("prompt_tokens", 0)
+            self.completion_tokens = usage.get("completion_tokens", 0)
+            self.cached_prompt_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+            return
+        # Streamed responses report usage on the final chunk's message instead.
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    self.prompt_tokens = metadata.get("input_tokens", 0)
+                    self.completion_tokens = metadata.get("output_tokens", 0)
+                    self.cached_prompt_tokens = (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+                    return
+
+
+def _finish_call(model_name: str, callback: _UsageCallback, estimated_prompt_tokens: int, response_text: str):
+    """Records a completed request's usage in the usage scopes and the current trace span."""
+    prompt_tokens = callback.prompt_tokens or estimated_prompt_tokens
+    completion_tokens = callback.completion_tokens or count_tokens(response_text, model_name)
+    _record_usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                  cached_prompt_tokens=callback.cached_prompt_tokens)
+    record_llm_call(model_name, prompt_tokens, completion_tokens, callback.cached_prompt_tokens)
+
+
+# Completion tokens reserved against the TPM budget before the real length is known.
+EXPECTED_COMPLETION_TOKENS = 1000
+
+
+def get_model_name(llm) -> str:
+    """Returns the model name of a LangChain chat model."""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", "unknown")
+
+
+# Minimum seconds between partial-text callbacks while streaming, so the UI isn't redrawn per token.
+STREAM_UPDATE_INTERVAL = 0.05
+
+
+def _invoke_text(llm, prompt_text: str, callbacks: list = None, timeout: float = None) -> str:
+    """Returns the completion text of a single non-streamed request."""
+    request_kwargs = {"timeout": timeout} if timeout is not None else {}
+    return llm.invoke(prompt_text, config={"callbacks": callbacks or []}, **request_kwargs).content
+
+
+def _stream_completion(llm, prompt_text: str, on_partial, callbacks: list = None, timeout: float = None) -> str:
+    """
+    Streams a completion, calling on_partial(text_so_far) as tokens arrive, and returns the full text.
+    The callback always receives the accumulated text, so a retried request simply starts over.
+    With a timeout, the stream is abandoned (DeadlineExceeded) once it runs longer than that.
+    """
+    parts = []
+    last_update = 0.0
+    request_kwargs = {"timeout": timeout} if timeout is not None else {}
+    give_up_at = time.monotonic() + timeout if timeout is not None else None
+    for chunk in llm.stream(prompt_text, config={"callbacks": callbacks or []}, **request_kwargs):
+        parts.append(chunk.content)
+        now = time.monotonic()
+        if give_up_at is not None and now >= give_up_at:
+            raise DeadlineExceeded("Streamed completion did not finish before the stage deadline")
+        # The first update is sent with the first token, not the empty role-only chunk before it.
+        if chunk.content and now - last_update >= STREAM_UPDATE_INTERVAL:
+            on_partial("".join(parts))
+            last_update = now
+    response = "".join(parts)
+    on_partial(response)
+    return response
+
+
+def _on_admitted(queue_seconds: float):
+    """Scheduler callback: records the queue time and starts the call guard's latency clock for the attempt."""
+    record_queue_time(queue_seconds)
+    mark_admitted()
+
+
+def _model_for(llm, model: str):
+    """Returns llm itself, or the shared client of another model (a fallback) at the same temperature."""
+    return llm if model == get_model_name(llm) else get_chat_model(model, llm.temperature)
+
+
+def run_chain(chain, template_version: str = "1", bypass_cache: bool = False, cache: LLMCache = None,
+              cache_if=None, on_partial=None, **inputs) -> str:
+    """
+    Runs an LLMChain through the shared response cache and, on a miss, the shared request scheduler
+    under the call guard (utils/llm_resilience.py: stage deadline, hedging, circuit breaker and fallback).
+    Args:
+        chain: An LLMChain with a `prompt` and `llm`.
+        template_version: Version tag of the prompt template; bump it to invalidate old responses.
+        bypass_cache: If True, always call the LLM (the fresh response still refreshes the cache).
+        cache: Cache to use. Defaults to the process-wide cache.
+        cache_if: Optional predicate; responses for which it returns False are not cached.
+        on_partial: Optional callback(text_so_far). If given, the completion is streamed token by token. The
+                    callback may be invoked from a worker thread (the guard's hedged attempts).
+        **inputs: Prompt variables.
+    Returns:
+        The completion text.
+    """
+    cache = cache or get_default_cache()
+    model_name = get_model_name(chain.llm)
+    prompt_text = chain.prompt.format(**inputs)
+    key = LLMCache.make_key(model_name, chain.llm.temperature, prompt_text, template_version)
+    if not bypass_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            _record_usage(cache_hit=True)
+            record_cache_hit()
+            if on_partial is not None:
+                on_partial(cached)
+            return cached
+    prompt_tokens = count_tokens(prompt_text, model_name)
+
+    def forward_partial(text):
+        # Of a hedged pair of streams, only the one that produced a token first reaches the caller.
+        claim_stream()
+        on_partial(text)
+
+    def attempt(model, deadline_at):
+        llm = _model_for(chain.llm, model)
+        usage_callback = _UsageCallback()
+        if on_partial is None:
+            request = lambda timeout: _invoke_text(llm, prompt_text, [usage_callback], timeout)
+        else:
+            request = lambda timeout: _stream_completion(llm, prompt_text, forward_partial, [usage_callback], timeout)
+        response = get_scheduler().call(lambda: call_before(deadline_at, request),
+                                        estimated_tokens=prompt_tokens + EXPECTED_COMPLETION_TOKENS,
+                                        on_admitted=_on_admitted)
+        _finish_call(model, usage_callback, prompt_tokens, response)
+        return response
+
+    response, answered_by = get_call_guard().call(model_name, attempt, streamed=on_partial is not None)
+    # A fallback model's answer is not cached under the primary model's key.
+    if answered_by == model_name and (cache_if is None or cache_if(response)):
+        cache.set(key, response)
+    return response
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a completion doesn't validate against the requested output schema."""
+
+
+def run_structured(llm, prompt, schema, template_version: str = "1", bypass_cache: bool = False,
+                   cache: LLMCache = None, **inputs) -> dict:
+    """
+    Runs a prompt with function-calling output validated against a pydantic schema, through the
+    shared cache, scheduler and call guard. Only validated outputs of the requested model are cached.
+    Args:
+        llm: A LangChain chat model that supports with_structured_output.
+        prompt: A PromptTemplate rendered with **inputs.
+        schema: Pydantic model class the output must validate against.
+    Returns:
+        The validated output as a dict.
+    Raises:
+        StructuredOutputError: If the model's output is missing or fails validation.
+    """
+    cache = cache or get_default_cache()
+    model_name = get_model_name(llm)
+    prompt_text = prompt.format(**inputs)
+    key = LLMCache.make_key(model_name, llm.temperature, prompt_text, f"{template_version}:{schema.__name__}")
+    if not bypass_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            _record_usage(cache_hit=True)
+            record_cache_hit()
+            return schema.model_validate_json(cached).model_dump()
+
+    prompt_tokens = count_tokens(prompt_text, model_name)
+
+    def attempt(model, deadline_at):
+        structured_llm = _model_for(llm, model).with_structured_output(schema, include_raw=True)
+        usage_callback = _UsageCallback()
+
+        # The structured-output runnable takes no request options; the guard enforces the deadline instead.
+        def request(timeout):
+            result = structured_llm.invoke(prompt_text, config={"callbacks": [usage_callback]})
+            if result.get("parsing_error") is not None or result.get("parsed") is None:
+                raise StructuredOutputError(f"Output did not match {schema.__name__}: {result.get('parsing_error')}")
+            return result["parsed"]
+
+        parsed = get_scheduler().call(lambda: call_before(deadline_at, request),
+                                      estimated_tokens=prompt_tokens + EXPECTED_COMPLETION_TOKENS,
+                                      on_admitted=_on_admitted)
+        serialized = json.dumps(parsed.model_dump())
+        _finish_call(model, usage_callback, prompt_tokens, serialized)
+        return serialized
+
+    serialized, answered_by = get_call_guard().call(model_name, attempt)
+    if answered_by == model_name:
+        cache.set(key, serialized)
+    return json.loads(serialized)
@@ -0,0 +1,224 @@
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+
+INTERACTIVE = 0
+BATCH = 1
+
+_priority_scope = contextvars.ContextVar("llm_request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """
+    Sets the scheduling priority of LLM calls made inside the block (INTERACTIVE or BATCH).
+    """
+    token = _priority_scope.set(priority)
+    try:
+        yield
+    finally:
+        _priority_scope.reset(token)
+
+
+def current_priority() -> int:
+    return _priority_scope.get()
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: float = None, clock=time.monotonic):
+        """
+        Classic token bucket refilled continuously at rate_per_minute, holding at most capacity.
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = self.capacity
+        self._clock = clock
+        self._last_refill = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be consumed (0 if it can be consumed now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True for rate limits (429), server errors (5xx) and connection errors from the OpenAI client.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError", "RateLimitError")
+
+
+def _header(error: Exception, name: str):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(error: Exception):
+    return _header(error, "retry-after")
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0, clock=time.monotonic, sleep=time.sleep):
+        """
+        Admits LLM calls against request and token budgets, highest priority first, and retries
+        rate-limited or failed calls with jittered exponential backoff.
+        Args:
+            requests_per_minute: Request budget (the account's RPM limit).
+            tokens_per_minute: Token budget (the account's TPM limit), charged with each call's estimate. None
+                               admits calls without a token budget until a 429 response reports the
+                               account's limit (x-ratelimit-limit-tokens), which is then used.
+            max_retries: Retries after a 429/5xx/connection error before the error is raised.
+            base_delay: First backoff delay in seconds; doubles on each retry.
+            max_delay: Upper bound on a single backoff delay.
+            clock, sleep: Injectable for tests.
+        """
+        self._clock = clock
+        self._sleep = sleep
+        self._requests = TokenBucket(requests_per_minute, clock=clock)
+        self._tokens = TokenBucket(tokens_per_minute, clock=clock) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._waits = deque(maxlen=1000)
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def _admit(self, estimated_tokens: int, priority: int) -> float:
+        """Blocks until the call may proceed; returns the seconds spent queued."""
+        entry = (priority, next(self._sequence))
+        enqueued_at = self._clock()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            while True:
+                if self._queue[0] == entry:
+                    wait = self._requests.wait_time(1)
+                    if self._tokens is not None:
+                        wait = max(wait, self._tokens.wait_time(estimated_tokens))
+                    if wait <= 0:
+                        self._requests.consume(1)
+                        if self._tokens is not None:
+                            self._tokens.consume(estimated_tokens)
+                        heapq.heappop(self._queue)
+                        self.admitted += 1
+                        waited = self._clock() - enqueued_at
+                        self._waits.append(waited)
+                        self._cond.notify_all()
+                        return waited
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # Full jitter keeps concurrent callers from retrying in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, estimated_tokens: int = 0, priority: int = None, on_admitted=None):
+        """
+        Runs fn() once admitted, retrying retryable errors with backoff.
+        Args:
+            fn: Zero-argument callable performing the LLM request.
+            estimated_tokens: Prompt plus expected completion tokens, charged to the token budget.
+            priority: INTERACTIVE or BATCH. Defaults to the priority set with request_priority().
+            on_admitted: Optional callback(queue_seconds) invoked each time the call is admitted.
+        """
+        priority = current_priority() if priority is None else priority
+        attempt = 0
+        while True:
+            waited = self._admit(estimated_tokens, priority)
+            if on_admitted is not None:
+                on_admitted(waited)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    with self._cond:
+                        self.failures += 1
+                    raise
+                with self._cond:
+                    self.retries += 1
+                    if getattr(e, "status_code", None) == 429:
+                        self.rate_limited += 1
+                        limit = _header(e, "x-ratelimit-limit-tokens")
+                        if self._tokens is None and limit:
+                            print(f"Adopting the API's token limit of {limit:,.0f} tokens per minute.")
+                            self._tokens = TokenBucket(limit, clock=self._clock)
+                            self._tokens.available = 0.0
+                delay = self._backoff(attempt, e)
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+                self._sleep(delay)
+                attempt += 1
+
+    def metrics(self) -> dict:
+        """
+        Returns queue depth, wait-time statistics and retry counters.
+        """
+        with self._cond:
+            waits = sorted(self._waits)
+            queued = [priority for priority, _ in self._queue]
+            return {
+                "queue_depth": len(queued),
+                "queued_interactive": queued.count(INTERACTIVE),
+                "queued_batch": queued.count(BATCH),
+                "admitted": self.admitted,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "wait_avg_seconds": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "wait_max_seconds": waits[-1] if waits else 0.0,
+            }
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Returns the process-wide scheduler shared by every LLM caller. Limits come from
+    $OPENAI_RPM_LIMIT and $OPENAI_TPM_LIMIT; without a TPM limit, tokens are only budgeted once the API
+    reports its limit on a 429 response.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(
+                requests_per_minute=float(os.getenv("OPENAI_RPM_LIMIT", "500")),
+                tokens_per_minute=float(os.getenv("OPENAI_TPM_LIMIT", "0")) or None,
+            )
+        return _default_scheduler
@@ -1,50 +1,155 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-import os
-import json
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Literal
+from pydantic import BaseModel, Field
+from utils.llm_registry import get_chat_model, get_prompt
+from utils.llm_resilience import CircuitOpenError, DeadlineExceeded, stage_deadline
+from utils.llm_runner import run_structured, submit_with_context
+from utils.tracing import trace_stage
+import re
+
+
+# Severity used when the assessment itself failed; ScoringEngine does not deduct for it.
+UNASSESSED = "Unassessed"
+SEVERITY_ORDER = {UNASSESSED: -1, "Low": 0, "Medium": 1, "High": 2}
+
+
+class AmendmentRisk(BaseModel):
+    description: str = Field(description="Concise description of the potential amendment trigger.")
+    severity: Literal["Low", "Medium", "High"] = Field(description="Severity of the risk.")
+    rationale: str = Field(description="Reason this could lead to a protocol amendment.")
+    recommendation: str = Field(description="Specific change or action that addresses the risk.")
+
+
+class RiskReport(BaseModel):
+    """Amendment risks identified in one reviewer's feedback."""
+    risks: list[AmendmentRisk] = Field(description="Distinct amendment risks; empty if there are no concerns.")
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
 
 class RiskAssessor:
-    def __init__(self, llm_model="gpt-4o"):
-        self.llm = ChatOpenAI(model=llm_model, temperature=0.3, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        self.prompt_template = PromptTemplate(
+    TEMPLATE_VERSION = "2"
+
+    def __init__(self, llm_model="gpt-4o", max_shard_retries: int = 2, dedupe_threshold: float = 0.8):
+        """
+        Args:
+            llm_model: Model used for per-agent risk extraction.
+            max_shard_retries: Retries for an agent's extraction whose output fails schema validation.
+            dedupe_threshold: Description similarity (0-1) above which risks from different agents are merged.
+        """
+        self.llm = get_chat_model(llm_model, 0.3)
+        self.max_shard_retries = max_shard_retries
+        self.dedupe_threshold = dedupe_threshold
+        self.prompt_template = get_prompt(
             template="""
-            Analyze the following agent feedback on a clinical trial protocol.
+            Analyze the following feedback from the {agent_name} reviewer on a clinical trial protocol.
             Identify potential amendment triggers, categorize their severity (Low, Medium, High),
             provide a concise rationale, and suggest a specific recommendation to address the issue.
-            Structure your output as a JSON array of objects.
-
-            Agent Feedback:
-            {agent_feedback_json}
-
-            Output JSON format example:
-            [
-                {{
-                    "description": "Risk description",
-                    "severity": "Low|Medium|High",
-                    "rationale": "Reason for the risk",
-                    "recommendation": "Suggested change or action"
-                }},
-                ...
-            ]
+            Report each distinct issue once. If the feedback raises no concerns, return an empty list.
+
+            {agent_name} Feedback:
+            {agent_feedback}
             """,
-            input_variables=["agent_feedback_json"]
+            input_variables=["agent_name", "agent_feedback"]
         )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
 
-    def assess_risks(self, all_feedback: dict) -> list[dict]:
+    def _assess_shard(self, agent_name: str, feedback: str, bypass_cache: bool) -> list[dict]:
+        """
+        Map step: extracts schema-validated risks from one agent's feedback, retrying only this shard.
+        """
+        last_error = None
+        for attempt in range(self.max_shard_retries + 1):
+            try:
+                report = run_structured(
+                    self.llm,
+                    self.prompt_template,
+                    RiskReport,
+                    template_version=self.TEMPLATE_VERSION,
+                    # A retry must not be answered from the cache.
+                    bypass_cache=bypass_cache or attempt > 0,
+                    agent_name=agent_name,
+                    agent_feedback=feedback
+                )
+                return [dict(risk, agents=[agent_name]) for risk in report["risks"]]
+            except Exception as e:
+                last_error = e
+                print(f"Risk extraction for '{agent_name}' failed (attempt {attempt + 1}): {e}")
+                # Retrying can't help once the stage is out of time or the model is failing fast.
+                if isinstance(e, (DeadlineExceeded, CircuitOpenError)):
+                    break
+        # Failures say nothing about the protocol, so they are reported as unassessed
+        # rather than as a risk that lowers the score.
+        return [{"description": f"Risk assessment of {agent_name} feedback could not be completed.",
+                 "severity": UNASSESSED, "rationale": str(last_error),
+                 "recommendation": "Re-run the risk assessment.", "agents": [agent_name]}]
+
+    def _merge_risks(self, shards: list[list[dict]]) -> list[dict]:
+        """
+        Reduce step: merges near-duplicate risks raised by several agents, keeping the highest severity.
+        """
+        merged = []
+        for shard in shards:
+            for risk in shard:
+                normalized = _normalize(risk["description"])
+                match = None
+                if risk["severity"] != UNASSESSED:
+                    for existing in merged:
+                        if existing["severity"] == UNASSESSED:
+                            continue
+                        similarity = SequenceMatcher(None, existing["_normalized"], normalized).ratio()
+                        if similarity >= self.dedupe_threshold:
+                            match = existing
+                            break
+                if match is None:
+                    merged.append(dict(risk, agents=list(risk["agents"]), _normalized=normalized))
+                    continue
+                if SEVERITY_ORDER[risk["severity"]] > SEVERITY_ORDER[match["severity"]]:
+                    match.update(severity=risk["severity"], rationale=risk["rationale"],
+                                 recommendation=risk["recommendation"])
+                match["agents"].extend(agent for agent in risk["agents"] if agent not in match["agents"])
+        for risk in merged:
+            del risk["_normalized"]
+        return merged
+
+    def assess_risks(self, all_feedback: dict, bypass_cache: bool = False, known_risks: dict = None) -> list[dict]:
         """
         Assesses amendment risks based on consolidated agent feedback.
+        Each agent's feedback is assessed in parallel, then risks are merged and deduplicated.
+        Args:
+            known_risks: Optional {source: risks} assessed earlier (e.g. reused from the findings store),
+                         merged and deduplicated with the new risks without another LLM call.
         """
-        agent_feedback_str = json.dumps(all_feedback, indent=2)
-        try:
-            response = self.chain.run(agent_feedback_json=agent_feedback_str)
-            risks = json.loads(response)
+        known_risks = known_risks or {}
+        if not all_feedback and not known_risks:
+            return []
+        with stage_deadline("risk_assessment"), trace_stage("risk_assessor.assess_risks", sources=len(all_feedback),
+                                                            known_sources=len(known_risks)) as span:
+            shards = []
+            if all_feedback:
+                with ThreadPoolExecutor(max_workers=len(all_feedback)) as executor:
+                    futures = [
+                        submit_with_context(executor, self._assess_shard, agent_name, feedback, bypass_cache)
+                        for agent_name, feedback in all_feedback.items()
+                    ]
+                    shards = [future.result() for future in futures]
+            shards.extend(known_risks.values())
+            risks = self._merge_risks(shards)
+            span.attributes["risks"] = len(risks)
             return risks
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from LLM response: {e}")
-            print(f"LLM Response was: {response}")
-            return [{"description": "Error in risk assessment format.", "severity": "High", "rationale": "LLM output not valid JSON.", "recommendation": "Check LLM prompt."}]
-        except Exception as e:
-            print(f"An unexpected error occurred during risk assessment: {e}")
-            return [{"description": "Unexpected error during risk assessment.", "severity": "High", "rationale": str(e), "recommendation": "Review logs."}]
\ No newline at end of file
+
+    def assess_risk_delta(self, risks_by_source: dict, changed_feedback: dict, bypass_cache: bool = False) -> dict:
+        """
+        Re-assesses only the feedback that changed; risks for every other source are carried forward.
+        Args:
+            risks_by_source: Previously assessed risks, keyed by feedback source.
+            changed_feedback: {source: feedback} for the new or changed feedback only.
+        Returns:
+            The updated {source: risks} mapping.
+        """
+        updated = dict(risks_by_source)
+        for source, feedback in changed_feedback.items():
+            updated[source] = self.assess_risks({source: feedback}, bypass_cache=bypass_cache)
+        return updated
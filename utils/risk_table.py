@@ -0,0 +1,251 @@
+"""
+Columnar, NumPy-backed table of amendment risks across many reviews, for the portfolio dashboard.
+
+Each review keeps a row of risk counts per (raising-agent combination, severity). The counts don't
+depend on the weights, so re-scoring every review under a new WeightingScheme is one matrix-vector
+product instead of a Python loop over risk dicts, and no LLM call is repeated. Per-study and
+per-indication count totals are updated as reviews are added, so severity aggregates never rescan
+the reviews.
+
+    table = RiskTable.from_jsonl("review_results.jsonl")
+    table.scores(WEIGHTING_SCHEMES["regulatory"])
+    table.aggregate("study")
+"""
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from utils.scoring_engine import WeightingScheme
+
+
+SEVERITIES = ("Unassessed", "Low", "Medium", "High")
+_SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+GROUP_FIELDS = ("study", "indication")
+
+
+class _Codes:
+    """Assigns dense integer codes to labels in first-seen order."""
+    def __init__(self):
+        self.labels = []
+        self._codes = {}
+
+    def code(self, label) -> int:
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+class RiskTable:
+    def __init__(self, capacity: int = 1024):
+        """
+        Args:
+            capacity: Initial number of review rows; the arrays grow geometrically as reviews are added.
+        """
+        self.review_ids = []
+        self._review_rows = {}
+        self._agents = _Codes()
+        # Each distinct set of raising agents (a bitmask over agent codes) gets a column block.
+        self._masks = _Codes()
+        self._groups = {field: _Codes() for field in GROUP_FIELDS}
+        self._size = 0
+        self._counts = np.zeros((capacity, 0), dtype=np.int32)
+        self._group_codes = {field: np.zeros(capacity, dtype=np.int32) for field in GROUP_FIELDS}
+        self._reviewed_at = np.zeros(capacity, dtype=np.float64)
+        # Running risk counts per group (rows) and column, kept in step with the review rows.
+        self._group_counts = {field: np.zeros((0, 0), dtype=np.int64) for field in GROUP_FIELDS}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _ensure_capacity(self, rows: int, columns: int):
+        capacity, current_columns = self._counts.shape
+        if rows <= capacity and columns <= current_columns:
+            return
+        new_capacity = max(rows, capacity * 2) if rows > capacity else capacity
+        counts = np.zeros((new_capacity, max(columns, current_columns)), dtype=np.int32)
+        counts[:self._size, :current_columns] = self._counts[:self._size]
+        self._counts = counts
+        if new_capacity != capacity:
+            for field in GROUP_FIELDS:
+                codes = np.zeros(new_capacity, dtype=np.int32)
+                codes[:self._size] = self._group_codes[field][:self._size]
+                self._group_codes[field] = codes
+            reviewed_at = np.zeros(new_capacity, dtype=np.float64)
+            reviewed_at[:self._size] = self._reviewed_at[:self._size]
+            self._reviewed_at = reviewed_at
+
+    def _column(self, agents: list, severity: str) -> int:
+        mask = 0
+        for agent in agents or []:
+            # Section-level sources from the findings store read "pi | 7. Safety Reporting".
+            mask |= 1 << self._agents.code(agent.split(" | ")[0])
+        severity_code = _SEVERITY_CODES.get(severity or "Low", _SEVERITY_CODES["Unassessed"])
+        return self._masks.code(mask) * len(SEVERITIES) + severity_code
+
+    @staticmethod
+    def _grown(matrix: np.ndarray, rows: int, columns: int) -> np.ndarray:
+        if rows <= matrix.shape[0] and columns <= matrix.shape[1]:
+            return matrix
+        grown = np.zeros((max(rows, matrix.shape[0]), max(columns, matrix.shape[1])), dtype=matrix.dtype)
+        grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+        return grown
+
+    def add_review(self, review_id: str, risks: list, study: str = None, indication: str = None,
+                   reviewed_at=None):
+        """
+        Adds one review's risks, or replaces them if the review id was added before (e.g. a re-review).
+        Only this review's row and its groups' running totals are touched.
+        Args:
+            review_id: Identifier of the review, e.g. the batch_review.py record id.
+            risks: Amendment risks from RiskAssessor ("severity", "agents").
+            study: Optional study the protocol belongs to.
+            indication: Optional indication of the study.
+            reviewed_at: Review time as epoch seconds or an ISO 8601 string. Defaults to now.
+        """
+        columns = [self._column(risk.get("agents"), risk.get("severity")) for risk in risks]
+        width = len(self._masks.labels) * len(SEVERITIES)
+        for field in GROUP_FIELDS:
+            self._group_counts[field] = self._grown(self._group_counts[field], len(self._groups[field].labels), width)
+        row = self._review_rows.get(review_id)
+        if row is None:
+            row = self._size
+            self._ensure_capacity(row + 1, width)
+            self._review_rows[review_id] = row
+            self.review_ids.append(review_id)
+            self._size += 1
+        else:
+            self._ensure_capacity(self._size, width)
+            for field in GROUP_FIELDS:
+                self._group_counts[field][self._group_codes[field][row], :width] -= self._counts[row, :width]
+            self._counts[row] = 0
+        np.add.at(self._counts[row], np.array(columns, dtype=np.int64), 1)
+        for field, label in zip(GROUP_FIELDS, (study, indication)):
+            code = self._groups[field].code(label)
+            self._group_codes[field][row] = code
+            self._group_counts[field] = self._grown(self._group_counts[field], code + 1, width)
+            self._group_counts[field][code, :width] += self._counts[row, :width]
+        if isinstance(reviewed_at, str):
+            reviewed_at = datetime.fromisoformat(reviewed_at).timestamp()
+        self._reviewed_at[row] = reviewed_at if reviewed_at is not None else time.time()
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> "RiskTable":
+        """
+        Loads the successful reviews of a batch_review.py results file. Later records for the same id win.
+        Reviews without a score (their risk assessment failed) are skipped rather than scored as risk-free.
+        """
+        table = cls()
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("status") not in ("ok", "partial") or record.get("score", 0) is None:
+                    continue
+                table.add_review(record["id"], record.get("risks") or [], study=record.get("study"),
+                                 indication=record.get("indication"), reviewed_at=record.get("reviewed_at"))
+        return table
+
+    def _column_weights(self, weights: WeightingScheme) -> np.ndarray:
+        severity = np.array([weights.severity.get(name, 0) for name in SEVERITIES], dtype=np.float64)
+        multipliers = np.array([
+            weights.agent_multiplier([agent for code, agent in enumerate(self._agents.labels) if mask >> code & 1])
+            for mask in self._masks.labels
+        ], dtype=np.float64)
+        return (multipliers[:, None] * severity[None, :]).ravel()
+
+    def _counts_view(self) -> np.ndarray:
+        return self._counts[:self._size, :len(self._masks.labels) * len(SEVERITIES)]
+
+    def scores(self, weights: WeightingScheme = None) -> np.ndarray:
+        """
+        Scores of every review under a weighting scheme, in review_ids order.
+        Matches ScoringEngine(weights).score_protocol for each review.
+        """
+        weights = weights or WeightingScheme()
+        deductions = self._counts_view() @ self._column_weights(weights)
+        return np.maximum(weights.floor, np.round(np.round(weights.base - deductions, 6)))
+
+    def severity_histograms(self) -> np.ndarray:
+        """Risk counts per review and severity, shape (reviews, len(SEVERITIES))."""
+        return self._counts_view().reshape(self._size, -1, len(SEVERITIES)).sum(axis=1)
+
+    def agent_histograms(self) -> dict:
+        """{agent: risk counts per review and severity}; a risk raised by several agents counts for each."""
+        counts = self._counts_view().reshape(self._size, -1, len(SEVERITIES))
+        histograms = {}
+        for code, agent in enumerate(self._agents.labels):
+            columns = [index for index, mask in enumerate(self._masks.labels) if mask >> code & 1]
+            histograms[agent] = counts[:, columns, :].sum(axis=1)
+        return histograms
+
+    def aggregate(self, by: str, weights: WeightingScheme = None) -> dict:
+        """
+        Per-group totals for the dashboard.
+        Args:
+            by: "study", "indication" or "agent".
+            weights: Scheme for the mean scores. Defaults to the standard deductions.
+        Returns:
+            {group: {"reviews", "mean_score", "severity": {severity: risk count}}}. For "agent", reviews
+            and mean_score cover the reviews in which the agent raised at least one risk.
+        """
+        scores = self.scores(weights)
+        if by == "agent":
+            groups = {}
+            for agent, histogram in self.agent_histograms().items():
+                raised = histogram.sum(axis=1) > 0
+                groups[agent] = self._summary(int(raised.sum()), float(scores[raised].mean()) if raised.any() else None,
+                                              histogram.sum(axis=0))
+            return groups
+        if by not in GROUP_FIELDS:
+            raise ValueError(f"Unknown grouping '{by}'; use one of {GROUP_FIELDS + ('agent',)}")
+        codes = self._group_codes[by][:self._size]
+        labels = self._groups[by].labels
+        reviews = np.bincount(codes, minlength=len(labels))
+        score_sums = np.bincount(codes, weights=scores, minlength=len(labels))
+        width = len(self._masks.labels) * len(SEVERITIES)
+        histograms = self._grown(self._group_counts[by], len(labels), width)[:len(labels), :width]
+        histograms = histograms.reshape(len(labels), -1, len(SEVERITIES)).sum(axis=1)
+        return {
+            label: self._summary(int(reviews[code]), float(score_sums[code] / reviews[code]), histograms[code])
+            for code, label in enumerate(labels) if reviews[code]
+        }
+
+    @staticmethod
+    def _summary(reviews: int, mean_score, histogram) -> dict:
+        return {
+            "reviews": reviews,
+            "mean_score": round(mean_score, 2) if mean_score is not None else None,
+            "severity": {name: int(count) for name, count in zip(SEVERITIES, histogram)},
+        }
+
+    def trend(self, weights: WeightingScheme = None, by: str = None, period: str = "M") -> dict:
+        """
+        Mean score per time period, overall or per study/indication.
+        Args:
+            period: NumPy datetime unit to bucket review dates by ("D", "W", "M" or "Y").
+        Returns:
+            {group: [(period, mean score, reviews)]} in period order; the group is None when by is None.
+        """
+        scores = self.scores(weights)
+        buckets = self._reviewed_at[:self._size].astype("datetime64[s]").astype(f"datetime64[{period}]")
+        if by is None:
+            codes, labels = np.zeros(self._size, dtype=np.int32), [None]
+        else:
+            codes, labels = self._group_codes[by][:self._size], self._groups[by].labels
+        keys, inverse = np.unique(np.stack([codes, buckets.astype(np.int64)]), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        reviews = np.bincount(inverse, minlength=keys.shape[1])
+        score_sums = np.bincount(inverse, weights=scores, minlength=keys.shape[1])
+        trend = {}
+        for index in range(keys.shape[1]):
+            label = labels[keys[0, index]]
+            bucket = str(np.array(keys[1, index]).astype(f"datetime64[{period}]"))
+            trend.setdefault(label, []).append((bucket, round(float(score_sums[index] / reviews[index]), 2),
+                                                int(reviews[index])))
+        return trend
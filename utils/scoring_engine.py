@@ -1,20 +1,72 @@
+class WeightingScheme:
+    def __init__(self, severity: dict = None, agents: dict = None, base: float = 100, floor: float = 0):
+        """
+        How amendment risks are turned into a protocol score.
+        Args:
+            severity: Points deducted per risk of each severity. Unlisted severities deduct nothing.
+            agents: Optional multiplier per raising agent (e.g. {"health_authority": 1.5}); a risk raised by
+                    several agents uses the largest. Unlisted agents count 1.
+            base: Score of a protocol without risks.
+            floor: Lowest possible score.
+        """
+        self.severity = dict(severity if severity is not None else ScoringEngine.DEFAULT_DEDUCTIONS)
+        self.agents = dict(agents or {})
+        self.base = base
+        self.floor = floor
+
+    def agent_multiplier(self, agents: list) -> float:
+        # Section-level sources from the findings store read "pi | 7. Safety Reporting".
+        weights = [self.agents.get(agent.split(" | ")[0], 1.0) for agent in agents or []]
+        return max(weights) if weights else 1.0
+
+    def as_dict(self) -> dict:
+        return {"severity": self.severity, "agents": self.agents, "base": self.base, "floor": self.floor}
+
 
 class ScoringEngine:
+    DEFAULT_DEDUCTIONS = {
+        "Low": 5,
+        "Medium": 15,
+        "High": 30,
+        "Unassessed": 0
+    }
+
+    def __init__(self, weights: WeightingScheme = None):
+        """
+        Args:
+            weights: Weighting scheme to score with. Defaults to the standard deductions.
+        """
+        self.weights = weights or WeightingScheme()
+
     def score_protocol(self, amendment_risks: list[dict]) -> int:
         """
         Scores the protocol based on the identified amendment risks.
         Higher score means fewer/less severe risks.
-        Scoring logic can be customized.
+        Scoring logic can be customized with a WeightingScheme; use utils.risk_table.RiskTable
+        to score many reviews at once.
         """
-        score = 100 # Start with a perfect score
-        risk_deductions = {
-            "Low": 5,
-            "Medium": 15,
-            "High": 30
-        }
+        score = self.weights.base # Start with a perfect score
 
         for risk in amendment_risks:
             severity = risk.get("severity", "Low")
-            score -= risk_deductions.get(severity, 0)
+            score -= self.weights.severity.get(severity, 0) * self.weights.agent_multiplier(risk.get("agents"))
+
+        # Round off float noise first so the result doesn't depend on summation order (see RiskTable.scores).
+        return max(self.weights.floor, round(round(score, 6)))
+
+    def score_if_assessed(self, amendment_risks: list[dict]):
+        """
+        Like score_protocol, but returns None if any risk is unassessed (its assessment failed): unassessed
+        risks deduct nothing, so the score would overstate the protocol, up to 100 when every assessment failed.
+        """
+        if any(risk.get("severity") == "Unassessed" for risk in amendment_risks):
+            return None
+        return self.score_protocol(amendment_risks)
+
 
-        return max(0, score)
\ No newline at end of file
+# Named schemes for the portfolio dashboard (utils/risk_table.py, portfolio_report.py).
+WEIGHTING_SCHEMES = {
+    "default": WeightingScheme(),
+    "high_only": WeightingScheme(severity={"Low": 0, "Medium": 0, "High": 30}),
+    "regulatory": WeightingScheme(agents={"health_authority": 1.5}),
+}
@@ -0,0 +1,32 @@
+from functools import lru_cache
+
+
+# Rough characters-per-token ratio used when the tiktoken encoding files can't be loaded (e.g. offline hosts).
+APPROX_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        # Deferred so that modules counting tokens don't pay for tiktoken at import time.
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Unknown or newer model names fall back to the gpt-4o encoding.
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Warning: could not load tiktoken encoding for {model} ({e}). Token counts are approximate.")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Counts the prompt tokens text would use for the given model.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // APPROX_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
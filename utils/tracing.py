@@ -0,0 +1,233 @@
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+
+# USD per million tokens as (prompt, cached prompt, completion). Longest matching prefix wins, so
+# dated snapshots such as "gpt-4o-2024-08-06" use their family's price. Unknown models cost 0.
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+    """
+    Estimated USD cost of a call from MODEL_PRICING. cached_prompt_tokens are the part of
+    prompt_tokens served from the provider's prompt cache, billed at the cached rate.
+    """
+    matches = [name for name in MODEL_PRICING if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, cached_price, completion_price = MODEL_PRICING[max(matches, key=len)]
+    uncached = prompt_tokens - cached_prompt_tokens
+    return (uncached * prompt_price + cached_prompt_tokens * cached_price + completion_tokens * completion_price) / 1_000_000
+
+
+class Span:
+    """
+    One timed pipeline stage (e.g. an agent's review) and the LLM usage made directly inside it.
+    LLM usage is attributed to the innermost open span only, so per-stage totals don't double count.
+    """
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self.wall_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add_llm_call(self, model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost_usd += estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens)
+
+    def add_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def add_queue_time(self, seconds: float):
+        with self._lock:
+            self.queue_seconds += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "queue_seconds": round(self.queue_seconds, 6),
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+_TOTAL_FIELDS = ("runs", "errors", "wall_seconds", "queue_seconds", "calls", "cache_hits",
+                 "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "cost_usd")
+
+
+class Tracer:
+    def __init__(self, max_spans: int = 10000):
+        """
+        Keeps the most recent finished spans plus running per-stage totals for the whole process.
+        Args:
+            max_spans: Finished spans retained for export and percentiles; totals are never truncated.
+        """
+        self._lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+        self._totals = {}
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            totals = self._totals.setdefault(span.name, dict.fromkeys(_TOTAL_FIELDS, 0))
+            totals["runs"] += 1
+            totals["errors"] += 1 if span.error else 0
+            for field in _TOTAL_FIELDS[2:]:
+                totals[field] += getattr(span, field)
+
+    def spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._totals.clear()
+
+    def summary(self) -> dict:
+        """
+        Returns {stage: totals} with the average and p95 wall time of the retained spans.
+        """
+        with self._lock:
+            totals = {name: dict(values) for name, values in self._totals.items()}
+            walls = {}
+            for span in self._spans:
+                walls.setdefault(span.name, []).append(span.wall_seconds)
+        for name, values in totals.items():
+            samples = sorted(walls.get(name, [0.0]))
+            values["wall_avg_seconds"] = sum(samples) / len(samples)
+            values["wall_p95_seconds"] = samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+        return totals
+
+    def to_jsonl(self) -> str:
+        """Retained spans as JSON lines, oldest first."""
+        return "".join(json.dumps(span.as_dict()) + "\n" for span in self.spans())
+
+    def to_prometheus(self, prefix: str = "protocol_review") -> str:
+        """Per-stage totals in the Prometheus text exposition format."""
+        metrics = [
+            ("stage_runs_total", "counter", "Completed runs of each pipeline stage.", "runs"),
+            ("stage_errors_total", "counter", "Runs of each pipeline stage that raised.", "errors"),
+            ("stage_seconds_total", "counter", "Wall time spent in each pipeline stage.", "wall_seconds"),
+            ("stage_queue_seconds_total", "counter", "Time LLM calls waited for the request scheduler.", "queue_seconds"),
+            ("llm_calls_total", "counter", "LLM requests made (cache hits excluded).", "calls"),
+            ("llm_cache_hits_total", "counter", "LLM calls answered from the response cache.", "cache_hits"),
+            ("llm_prompt_tokens_total", "counter", "Prompt tokens sent.", "prompt_tokens"),
+            ("llm_cached_prompt_tokens_total", "counter", "Prompt tokens served from the provider's prompt cache.",
+             "cached_prompt_tokens"),
+            ("llm_completion_tokens_total", "counter", "Completion tokens received.", "completion_tokens"),
+            ("llm_cost_usd_total", "counter", "Estimated LLM cost in USD.", "cost_usd"),
+        ]
+        summary = self.summary()
+        lines = []
+        for name, metric_type, help_text, field in metrics:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for stage in sorted(summary):
+                label = stage.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{prefix}_{name}{{stage="{label}"}} {summary[stage][field]:g}')
+        return "\n".join(lines) + "\n"
+
+    def export_jsonl(self, path: str):
+        """Appends the retained spans to a JSON lines file."""
+        with open(path, "a") as f:
+            f.write(self.to_jsonl())
+
+    def export_prometheus(self, path: str):
+        """Writes the totals atomically, e.g. for the node_exporter textfile collector."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+_tracer = Tracer()
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer."""
+    return _tracer
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def trace_stage(name: str, **attributes):
+    """
+    Times the block as a pipeline stage. LLM calls made inside it (including from worker threads
+    started with utils.llm_runner.submit_with_context) are attributed to it.
+    """
+    span = Span(name, parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.wall_seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        _tracer.add(span)
+
+
+def record_llm_call(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0):
+    span = _current_span.get()
+    if span is not None:
+        span.add_llm_call(model, prompt_tokens, completion_tokens, cached_prompt_tokens)
+
+
+def record_cache_hit():
+    span = _current_span.get()
+    if span is not None:
+        span.add_cache_hit()
+
+
+def record_queue_time(seconds: float):
+    span = _current_span.get()
+    if span is not None:
+        span.add_queue_time(seconds)